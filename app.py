@@ -1,30 +1,122 @@
 import os
+import math
 import subprocess
 import json
 import threading
 import time
 import re
-import hashlib
 import musicbrainzngs
 import requests
-import socket
-from flask import Flask, render_template, jsonify, Response, request, make_response
+import sqlite3
+import tempfile
+import concurrent.futures
+import logging
+from flask import Flask, render_template, jsonify, Response, request, make_response, abort, send_file
 from flask_cors import CORS
+from disc_cache import DiscCache
+from cdtoc import drive_status, CDS_DISC_OK, CDS_NO_DISC, CDS_TRAY_OPEN, FRAMES_PER_SECOND
+from events import EventBus
+from device_monitor import DeviceMonitor
+from broadcast import BroadcastRegistry
+from pcm_cache import PCMCache, tee_pcm, feed_pcm, wav_header, BYTES_PER_SECTOR, BYTES_PER_SECOND, WAV_HEADER_SIZE
+from sources import open_source, source_kind, ImageSource
+from disc_images import ImageArchive, CaptureManager
+from library import Library, RipManager, RIP_FORMATS
+from hls import HLSCache
+from cddb import CDDBClient, CDDBError
+from musicbrainz import MusicBrainzClient, Pending, RateLimited
+from encoder_pool import EncoderPool
+from output import LocalPlayback, open_sink
+from streamio import read_chunks, grow_pipe, parse_size
+import encoder
+import logs
+import metrics
 
 app = Flask(__name__)
 CORS(app)
 
+# Queue-based logging configured by WEBCD_LOG_*; log calls never wait for I/O
+log_system = logs.from_environment()
+log = logging.getLogger('webcd.app')
+# Sampled per-chunk stream events (DEBUG)
+chunk_log = logging.getLogger(logs.CHUNK_LOGGER)
+
 # Configure MusicBrainz
 musicbrainzngs.set_useragent("WebCD", "1.0", "https://github.com/webcd")
+if os.environ.get('WEBCD_MUSICBRAINZ_HOST'):
+    musicbrainzngs.set_hostname(os.environ['WEBCD_MUSICBRAINZ_HOST'])
+# Requests are paced by MusicBrainzClient instead, without blocking callers
+musicbrainzngs.set_rate_limit(False)
+# MusicBrainz allows one request per second
+MUSICBRAINZ_RATE = float(os.environ.get('WEBCD_MUSICBRAINZ_RATE', '1'))
+
+# GNUDB server, spoken to over CDDBP ('cddbp') or CDDB over HTTP ('http')
+GNUDB_HOST = os.environ.get('WEBCD_GNUDB_HOST', 'gnudb.gnudb.org')
+GNUDB_PROTOCOL = os.environ.get('WEBCD_GNUDB_PROTOCOL', 'cddbp')
+GNUDB_PORT = int(os.environ.get('WEBCD_GNUDB_PORT') or (80 if GNUDB_PROTOCOL == 'http' else 8880))
+
+# Upper bound on a background album lookup
+METADATA_TIMEOUT = 30
+
+# Read sectors with CDROMREADAUDIO and encode with PyAV inside this process
+# instead of running cdparanoia and ffmpeg for every stream
+INPROCESS_PIPELINE = os.environ.get('WEBCD_INPROCESS_PIPELINE', '0') == '1'
+
+# Stream formats and MP3 bitrates a listener can choose
+STREAM_FORMATS = ['mp3', 'flac', 'wav']
+MP3_BITRATES = ['32k', '64k', '96k', '128k', '192k', '256k', '320k']
+
+# Seconds before the end of a track at which the next one starts extracting
+# and encoding (default: the preload_seconds stream setting)
+PREFETCH_SECONDS = (float(os.environ['WEBCD_PREFETCH_SECONDS'])
+                    if os.environ.get('WEBCD_PREFETCH_SECONDS') else None)
+# How long a prefetched track waits for its listener before it is dropped
+PREFETCH_TIMEOUT = 30
+
+# Serve discs that have an image in the archive (/api/image) from the image,
+# without reading the drive
+SERVE_IMAGES = os.environ.get('WEBCD_SERVE_IMAGES', '1') != '0'
+
+# Where /api/play plays on the server: alsa[:device], pulse[:sink], null or
+# file:<path>, comma separated to play on several at once
+LOCAL_OUTPUTS = os.environ.get('WEBCD_OUTPUT', 'alsa').split(',')
+
+def run_blocking(func, *args):
+    """Call ``func``, off the event loop when served by gevent workers (see server.py).
+
+    CDROM ioctls block in C while the drive spins up, which would otherwise
+    stall every open stream in the worker.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            import gevent
+            return gevent.get_hub().threadpool.apply(func, args)
+    except ImportError:
+        pass
+    return func(*args)
 
 class CDPlayer:
-    def __init__(self):
-        self.current_process = None
+    """Playback and streaming state of one drive (its TOC, metadata, settings and pipelines)
+
+    The disc is read through an AudioSource (see sources.py): the drive
+    itself, or a disc image or FLAC directory standing in for one.
+    """
+    
+    def __init__(self, manager, cd_device=None):
+        self.manager = manager
+        # Playback on the server's own outputs (/api/play)
+        self.output = None
         self.is_playing = False
         self.current_track = 1
         self.track_info = []
-        self.available_devices = []
-        self.cd_device = None
+        self.cd_device = cd_device
+        self.device_id = manager.device_id(cd_device) if cd_device else None
+        # The drive (or image) this player stands for; SourceError for a bad image
+        self.source = (open_source(cd_device, self.device_id, inprocess=INPROCESS_PIPELINE)
+                       if cd_device else None)
+        # Archived image of the disc in the drive, read instead of the drive
+        self.image_source = None
         # Default streaming settings
         self.stream_settings = {
             'format': 'mp3',  # 'mp3', 'flac', 'wav'
@@ -34,118 +126,53 @@ class CDPlayer:
             'preload_seconds': 1
         }
         self.album_info = None
-        # Detect CD devices on initialization
-        self.detect_cd_devices()
-        
-        # Check for environment variable override
-        env_device = os.environ.get('WEBCD_DEVICE')
-        if env_device and os.path.exists(env_device):
-            self.cd_device = env_device
-        elif self.available_devices and not self.cd_device:
-            # Use first available device if no environment override
-            self.cd_device = self.available_devices[0]['device']
+        # TOC of the current CD, its disc ID and the equivalent cd-discid output
+        self.toc = None
+        self.disc_id = None
+        self.disc_id_output = None
+        # Guards state shared with the background metadata resolver
+        self.lock = threading.Lock()
+        self.resolving = set()
+        # Caches, lookup workers and the event bus are shared by all drives
+        self.metadata_executor = manager.metadata_executor
+        self.events = manager.events
+        self.disc_cache = manager.disc_cache
+        self.cddb = manager.cddb
+        self.musicbrainz = manager.musicbrainz
+        self.pcm_cache = manager.pcm_cache
+        self.library = manager.library
+        self.hls = manager.hls
+        self.encoders = manager.encoders
+        # Number of open /api/stream responses per track
+        self.active_streams = {}
+        # One shared encoding pipeline per (device, track, format, bitrate, start)
+        self.broadcasts = BroadcastRegistry()
+        # Timers starting the next track's pipeline near the end of the current
+        # one, by what they prefetch: (track, format, bitrate)
+        self.prefetch_timers = {}
     
-    def detect_cd_devices(self):
-        """Detect available CD/DVD devices on the system"""
-        self.available_devices = []
-        
-        # Method 1: Check common device paths
-        common_devices = ['/dev/cdrom', '/dev/dvd', '/dev/sr0', '/dev/sr1', '/dev/sr2']
-        for device in common_devices:
-            if os.path.exists(device):
-                # Try to get device info
-                device_info = self.get_device_info(device)
-                if device_info:
-                    self.available_devices.append(device_info)
-        
-        # Method 2: Check /sys/block for sr* devices
-        try:
-            for device in os.listdir('/sys/block'):
-                if device.startswith('sr'):
-                    device_path = f'/dev/{device}'
-                    if os.path.exists(device_path):
-                        device_info = self.get_device_info(device_path)
-                        if device_info and not any(d['device'] == device_path for d in self.available_devices):
-                            self.available_devices.append(device_info)
-        except:
-            pass
-        
-        # Remove duplicates based on real path
-        unique_devices = {}
-        for dev in self.available_devices:
-            real_path = dev['real_path']
-            if real_path not in unique_devices:
-                unique_devices[real_path] = dev
-        self.available_devices = list(unique_devices.values())
-        
-        return self.available_devices
-    
-    def get_device_info(self, device_path):
-        """Get information about a CD/DVD device"""
-        try:
-            # Get the real device path (resolve symlinks)
-            real_path = os.path.realpath(device_path)
-            
-            # Try to get device model info
-            model = "Unknown CD/DVD Drive"
-            try:
-                # Extract device name from path (e.g., sr0 from /dev/sr0)
-                device_name = os.path.basename(real_path)
-                model_file = f'/sys/block/{device_name}/device/model'
-                if os.path.exists(model_file):
-                    with open(model_file, 'r') as f:
-                        model = f.read().strip()
-            except:
-                pass
-            
-            # Check if media is present
-            has_media = self.check_media_present(device_path)
-            
-            return {
-                'device': device_path,
-                'real_path': real_path,
-                'model': model,
-                'has_media': has_media
-            }
-        except:
-            return None
-    
-    def check_media_present(self, device_path):
-        """Check if a CD is present in the device"""
-        try:
-            # Try using cdparanoia -Q to check for media
-            result = subprocess.run(['cdparanoia', '-Q', '-d', device_path], 
-                                  capture_output=True, timeout=2)
-            # If cdparanoia can read TOC, media is present
-            return 'Unable to open disc' not in result.stderr.decode()
-        except:
-            try:
-                # Fallback: try using blockdev
-                result = subprocess.run(['blockdev', '--getsize64', device_path], 
-                                      capture_output=True, timeout=1)
-                return result.returncode == 0 and int(result.stdout.strip()) > 0
-            except:
-                return False
-    
-    def set_cd_device(self, device_path):
-        """Set the active CD device"""
-        # Verify the device exists
-        if not os.path.exists(device_path):
-            return {'success': False, 'error': 'Device not found'}
-        
-        # Stop playback if currently playing
-        if self.is_playing:
-            self.stop()
-        
-        self.cd_device = device_path
-        # Clear current track info when switching devices
+    def clear_disc(self):
+        """Forget everything known about the disc in the drive"""
         self.track_info = []
         self.album_info = None
-        
-        return {'success': True, 'device': device_path}
+        self.toc = None
+        self.disc_id = None
+        self.disc_id_output = None
+        if self.source:
+            self.source.toc = None
+        self.image_source = None
+        self.cancel_prefetch()
+    
+    def media_changed(self, has_media):
+        """Device monitor saw a disc inserted or removed"""
+        if not has_media:
+            # Disc removed behind our back
+            if self.is_playing:
+                self.stop()
+            self.clear_disc()
         
     def get_cd_info(self):
-        """Get CD track information using cdparanoia or ffmpeg"""
+        """Get CD track information from the disc TOC or ffmpeg"""
         tracks = []
         # Reset album info for new scan
         self.album_info = None
@@ -154,38 +181,36 @@ class CDPlayer:
         if not self.cd_device:
             return {'success': False, 'error': 'No CD device selected', 'tracks': []}
         
-        # First try cdparanoia which is more reliable for CD info
+        # A single TOC read identifies the disc and gives us the track list
+        toc = self.read_toc()
+        disc_id = self.disc_id
+        # Archived images carry the metadata known when they were captured
+        cached = self.disc_cache.get(disc_id) or (self.reader.metadata() if toc else None)
+        if cached:
+            self.track_info = cached['tracks']
+            self.album_info = cached['album']
+            return {'success': True, 'tracks': self.track_info, 'album': self.album_info,
+                    'disc_id': disc_id, 'cached': True}
+        
+        # The TOC (read natively, or from cdparanoia -Q) is the reliable source
         try:
-            cmd = ['cdparanoia', '-Q', '-d', self.cd_device]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-            
-            # Parse cdparanoia output (it outputs to stderr)
-            lines = result.stderr.split('\n')
-            for line in lines:
-                # Look for track listings like: "  1.    33027 [07:20.27]        0 [00:00.00]    0"
-                match = re.match(r'\s+(\d+)\.\s+\d+\s+\[(\d+):(\d+)\.(\d+)\]', line)
-                if match:
-                    track_num = int(match.group(1))
-                    minutes = int(match.group(2))
-                    seconds = int(match.group(3))
-                    duration = f"{minutes:02d}:{seconds:02d}"
-                    
-                    tracks.append({
-                        'number': track_num,
-                        'title': f'Track {track_num}',
-                        'duration': duration
-                    })
+            if toc:
+                tracks = toc.tracks()
             
             if tracks:
                 self.track_info = tracks
-                # Try to get album info from MusicBrainz
-                self.get_album_info()
-                return {'success': True, 'tracks': self.track_info, 'album': self.album_info}
+                # Album lookup runs in the background and is pushed via /api/events
+                self.resolve_in_background()
+                return {'success': True, 'tracks': self.track_info, 'album': None,
+                        'disc_id': self.disc_id, 'resolving': True}
                 
-        except (subprocess.TimeoutExpired, FileNotFoundError, Exception):
-            # cdparanoia failed, try ffmpeg
+        except Exception:
+            # TOC could not be used, try ffmpeg
             pass
         
+        if not self.source.is_drive:
+            return {'success': False, 'error': 'No audio tracks found'}
+        
         # Fallback to ffmpeg
         try:
             cmd = [
@@ -193,7 +218,7 @@ class CDPlayer:
                 '-t', '0.1', '-f', 'null', '-'
             ]
             
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            process = metrics.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
             
             try:
                 stdout, stderr = process.communicate(timeout=3)
@@ -218,20 +243,42 @@ class CDPlayer:
                     tracks = [{'number': 1, 'title': 'Track 1', 'duration': '00:00'}]
                 
                 self.track_info = tracks
-                # Try to get album info from MusicBrainz
-                self.get_album_info()
-                return {'success': True, 'tracks': self.track_info, 'album': self.album_info}
+                # Album lookup runs in the background and is pushed via /api/events
+                self.resolve_in_background()
+                return {'success': True, 'tracks': self.track_info, 'album': None,
+                        'disc_id': self.disc_id, 'resolving': True}
             else:
                 return {'success': False, 'error': 'No CD detected'}
             
         except Exception as e:
             return {'success': False, 'error': str(e)}
     
-    def calculate_disc_id(self):
-        """Calculate disc ID using cd-discid or manual calculation"""
+    def read_toc(self):
+        """Read the TOC once and derive the disc ID and cd-discid line from it"""
+        self.toc = None
+        self.disc_id = None
+        self.disc_id_output = None
+        
+        # Native CDROM ioctls (or the image) first, cdparanoia -Q as a fallback
+        start = time.monotonic()
         try:
-            # First try cd-discid if available
-            result = subprocess.run(
+            self.toc = run_blocking(self.source.read_toc)
+        except OSError:
+            # Not in run_blocking's thread pool: gevent can only wait for
+            # child processes from its main loop
+            self.toc = self.source.probe_toc()
+        metrics.DISC_SCAN_SECONDS.observe(time.monotonic() - start, phase='toc')
+        if self.toc:
+            self.disc_id = self.toc.freedb_id()
+            self.disc_id_output = self.toc.cd_discid_output()
+            self.mount_image()
+            return self.toc
+        if not self.source.is_drive:
+            return None
+        
+        # Without a TOC, cd-discid can still identify the disc for GNUDB
+        try:
+            result = metrics.run(
                 ['cd-discid', self.cd_device], 
                 capture_output=True, 
                 text=True, 
@@ -242,330 +289,305 @@ class CDPlayer:
                 # Parse cd-discid output
                 parts = result.stdout.strip().split()
                 if len(parts) >= 3:
-                    return parts[0]  # Return the disc ID
+                    self.disc_id_output = result.stdout.strip()
+                    self.disc_id = parts[0]
         except (FileNotFoundError, subprocess.TimeoutExpired):
             pass
         
-        # Fallback: calculate from track info
-        # This is a simplified version - real CDDB calculation is more complex
-        if self.track_info:
-            track_count = len(self.track_info)
-            # Create a simple hash based on track count and durations
-            hash_input = f"{track_count}"
-            for track in self.track_info:
-                hash_input += track['duration']
-            return hashlib.md5(hash_input.encode()).hexdigest()[:8]
-        
+        return None
+    
+    def mount_image(self):
+        """Read the disc in the drive from its archived image, if it was captured (WEBCD_SERVE_IMAGES)"""
+        self.image_source = None
+        path = self.manager.images.get(self.disc_id) if SERVE_IMAGES and self.source.is_drive else None
+        if not path:
+            return
+        try:
+            image = ImageSource(path, self.device_id)
+        except OSError as e:
+            log.warning("Archived image %s unusable: %s", path, e, extra={'device': self.cd_device})
+            return
+        # Only an image of exactly this disc
+        if image.toc == self.toc:
+            self.image_source = image
+            log.info("Serving disc %s from its image", self.disc_id, extra={'device': self.cd_device})
+    
+    @property
+    def reader(self):
+        """The source PCM is read from: the disc's archived image, or the drive (image, directory) itself"""
+        return self.image_source or self.source
+    
+    def cache_disc_info(self):
+        """Store the current track list and album info in the disc cache"""
+        # Discs without metadata are not cached so the lookup is retried next time
+        if not self.disc_id or not self.album_info:
+            return
+        if self.toc:
+            toc = self.toc.to_dict()
+        else:
+            toc = {'cd_discid': self.disc_id_output} if self.disc_id_output else None
+        self.disc_cache.put(self.disc_id, self.track_info, self.album_info, toc=toc,
+                            manual=bool(self.album_info and self.album_info.get('manually_set')))
+    
+    def calculate_disc_id(self):
+        """Calculate the MusicBrainz disc ID from the TOC read at the start of the scan"""
+        # A MusicBrainz disc ID needs exact track offsets; without a TOC
+        # there is nothing valid to look up
+        if self.toc:
+            return self.toc.musicbrainz_id()
+        return None
+    
+    def _find_medium(self, release, disc_id):
+        """Find the medium of a release that corresponds to the disc in the drive"""
+        media = release.get('medium-list', [])
+        for medium in media:
+            for disc in medium.get('disc-list', []):
+                if disc.get('id') == disc_id:
+                    return medium
+        # Fuzzy TOC matches carry no disc ID, so match on track count instead
+        track_count = len(self.track_info)
+        for medium in media:
+            if int(medium.get('track-count', len(medium.get('track-list', [])))) == track_count:
+                return medium
         return None
     
     def query_gnudb(self, disc_id_output):
-        """Query GNUDB/FreeDB for album information"""
+        """Query GNUDB/FreeDB, returning (album_info, {track number: title}) or None"""
+        start = time.monotonic()
+        outcome = 'error'
         try:
             # Parse cd-discid output: "a10b1d0c 12 150 22776 36491..."
             parts = disc_id_output.strip().split()
             if len(parts) < 4:
                 return None
-                
-            disc_id = parts[0]
-            track_count = int(parts[1])
-            offsets = [int(x) for x in parts[2:]]
             
             # cd-discid output format: discid num_tracks offset1 offset2 ... offsetN total_seconds
             # The last value is already the total disc length in seconds
-            disc_length_seconds = offsets[-1]
-            track_offsets = offsets[:-1]  # All but the last value
-            
-            # GNUDB query format
-            query = f"cddb query {disc_id} {track_count} {' '.join(map(str, track_offsets))} {disc_length_seconds}"
-            
-            print(f"GNUDB Query: {query}")
-            
-            # Debug: write to file
-            with open('/tmp/webcd_debug.log', 'a') as f:
-                f.write(f"\n--- GNUDB Query at {time.strftime('%Y-%m-%d %H:%M:%S')} ---\n")
-                f.write(f"CD-DISCID output: {disc_id_output}\n")
-                f.write(f"Query: {query}\n")
-            
-            # Connect to GNUDB
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)
-            
-            try:
-                sock.connect(('gnudb.gnudb.org', 8880))
-                
-                # Read welcome message first
-                welcome = sock.recv(1024).decode()
-                print(f"GNUDB Welcome: {welcome.strip()}")
-                
-                # Send hello
-                hello = f"cddb hello webcd localhost WebCD 1.0\r\n"
-                sock.send(hello.encode())
-                hello_response = sock.recv(1024).decode()
-                print(f"GNUDB Hello Response: {hello_response.strip()}")
-                
-                # Send query
-                sock.send((query + '\r\n').encode())
-                response = sock.recv(4096).decode()
-                
-                print(f"GNUDB Query Response: {response.strip()}")
-                
-                # Debug: write response to file
-                with open('/tmp/webcd_debug.log', 'a') as f:
-                    f.write(f"Response: {response.strip()}\n")
-                
-                # Parse response
-                if response.startswith('200'):  # Exact match
-                    # Response format: "200 genre discid Artist / Album"
-                    parts = response.split(' ', 3)
-                    if len(parts) >= 4:
-                        genre = parts[1]
-                        disc_id = parts[2]
-                        artist_album = parts[3].strip()
-                        
-                        # Get full disc info
-                        read_cmd = f"cddb read {genre} {disc_id}\n"
-                        sock.send(read_cmd.encode())
-                        
-                        # Read full response
-                        full_data = b""
-                        while True:
-                            chunk = sock.recv(4096)
-                            if not chunk:
-                                break
-                            full_data += chunk
-                            if b'\r\n.\r\n' in full_data or b'\n.\n' in full_data:
-                                break
-                        
-                        disc_data = full_data.decode('utf-8', errors='ignore')
-                        
-                        # Parse disc data
-                        album_info = self.parse_gnudb_data(disc_data)
-                        if album_info:
-                            return album_info
-                            
-                elif response.startswith('211') or response.startswith('210'):  # Multiple or exact matches
-                    # For 210 (exact match) or 211 (multiple matches), take the first match
-                    lines = response.split('\n')
-                    for line in lines[1:]:
-                        line = line.strip()
-                        if line and not line.startswith('.'):
-                            parts = line.split(' ', 2)
-                            if len(parts) >= 3:
-                                genre = parts[0]
-                                disc_id = parts[1]
-                                
-                                # Get full disc info
-                                read_cmd = f"cddb read {genre} {disc_id}\n"
-                                sock.send(read_cmd.encode())
-                                
-                                # Read full response
-                                full_data = b""
-                                while True:
-                                    chunk = sock.recv(4096)
-                                    if not chunk:
-                                        break
-                                    full_data += chunk
-                                    if b'\r\n.\r\n' in full_data or b'\n.\n' in full_data:
-                                        break
-                                
-                                disc_data = full_data.decode('utf-8', errors='ignore')
-                                album_info = self.parse_gnudb_data(disc_data)
-                                if album_info:
-                                    return album_info
-                                break  # Only process first match
-                
-                sock.close()
-                
-            except socket.error as e:
-                print(f"GNUDB connection error: {e}")
-                if sock:
-                    sock.close()
-                    
+            offsets = [int(x) for x in parts[2:]]
+            result = self.cddb.lookup(parts[0], offsets[:-1], offsets[-1])
+            outcome = 'found' if result else 'not_found'
+            return result
+        except (CDDBError, OSError, requests.RequestException) as e:
+            log.warning("GNUDB connection error: %s", e)
         except Exception as e:
-            print(f"GNUDB query error: {e}")
+            log.error("GNUDB query error: %s", e)
+        finally:
+            metrics.METADATA_LOOKUP_SECONDS.observe(time.monotonic() - start, source='gnudb', outcome=outcome)
             
         return None
     
-    def parse_gnudb_data(self, data):
-        """Parse GNUDB disc data"""
+    def lookup_gnudb(self):
+        """Look up the current disc in GNUDB"""
+        if not self.disc_id_output:
+            return None
+        log.debug("Trying GNUDB lookup", extra={'cd_discid': self.disc_id_output})
+        result = self.query_gnudb(self.disc_id_output)
+        if result:
+            log.info("Found album in GNUDB", extra={'disc_id': self.disc_id, 'album': result[0].get('album'),
+                                                   'artist': result[0].get('artist')})
+        else:
+            log.debug("GNUDB lookup returned nothing", extra={'disc_id': self.disc_id})
+        return result
+    
+    def lookup_musicbrainz(self):
+        """Look up the current disc in MusicBrainz, returning (album_info, titles) or None"""
+        disc_id = self.calculate_disc_id()
+        if not disc_id:
+            return None
+        
+        log.debug("Trying MusicBrainz lookup", extra={'musicbrainz_id': disc_id})
+        
+        # Look up by disc ID; passing the TOC lets MusicBrainz fall back to
+        # a fuzzy TOC match when the exact disc ID is not known
+        start = time.monotonic()
+        outcome = 'error'
         try:
-            lines = data.split('\n')
-            album_info = {}
-            tracks = []
-            
-            for line in lines:
-                if line.startswith('DTITLE='):
-                    # Format: "Artist / Album"
-                    title = line[7:].strip()
-                    if ' / ' in title:
-                        artist, album = title.split(' / ', 1)
-                        album_info['artist'] = artist.strip()
-                        album_info['album'] = album.strip()
-                    else:
-                        album_info['album'] = title
-                        album_info['artist'] = 'Unknown Artist'
-                        
-                elif line.startswith('DYEAR='):
-                    album_info['year'] = line[6:].strip()
-                    
-                elif line.startswith('TTITLE'):
-                    # Track title format: "TTITLE0=Track Name"
-                    match = re.match(r'TTITLE(\d+)=(.*)', line)
-                    if match:
-                        track_num = int(match.group(1)) + 1
-                        track_title = match.group(2).strip()
-                        tracks.append((track_num, track_title))
-            
-            # Update track info
-            if tracks and album_info:
-                for track_num, title in sorted(tracks):
-                    if track_num <= len(self.track_info):
-                        self.track_info[track_num - 1]['title'] = title
-                        
-                album_info['source'] = 'GNUDB'
-                return album_info
-                
-        except Exception as e:
-            print(f"Error parsing GNUDB data: {e}")
-            
+            result = self.musicbrainz.get_releases_by_discid(
+                disc_id, 
+                toc=self.toc.musicbrainz_toc() if self.toc else None,
+                includes=["artists", "recordings", "release-groups"],
+                wait=METADATA_TIMEOUT
+            )
+            outcome = 'found'
+        except musicbrainzngs.ResponseError:
+            # 404: neither the disc ID nor the TOC is known to MusicBrainz
+            outcome = 'not_found'
+            log.debug("Disc %s not found in MusicBrainz", disc_id)
+            return None
+        except RateLimited as e:
+            outcome = 'rate_limited'
+            log.warning("MusicBrainz lookup of %s skipped: %s", disc_id, e)
+            return None
+        except Pending:
+            outcome = 'timeout'
+            log.warning("MusicBrainz lookup of %s took longer than %ss", disc_id, METADATA_TIMEOUT)
+            return None
+        finally:
+            metrics.METADATA_LOOKUP_SECONDS.observe(time.monotonic() - start, source='musicbrainz',
+                                                    outcome=outcome)
+        
+        if 'disc' in result and result['disc'].get('release-list'):
+            releases = result['disc']['release-list']
+        elif result.get('release-list'):
+            # TOC match: only keep releases with a medium of the right length
+            releases = [r for r in result['release-list']
+                        if self._find_medium(r, disc_id) is not None]
+        else:
+            releases = []
+        
+        # Prefer releases in English or with high data quality
+        best_release = None
+        for release in releases:
+            if best_release is None:
+                best_release = release
+            # Prefer releases with more complete data
+            if 'date' in release and 'date' not in best_release:
+                best_release = release
+            # Prefer releases with language info
+            if release.get('text-representation', {}).get('language') == 'eng':
+                best_release = release
+                break
+        
+        if not best_release:
+            return None
+        
+        album_info = {
+            'artist': best_release['artist-credit'][0]['artist']['name'],
+            'album': best_release['title'],
+            'year': best_release.get('date', '').split('-')[0],
+            'disc_id': disc_id,
+            'source': 'MusicBrainz'
+        }
+        
+        # Track titles from the medium that matches this disc
+        titles = {}
+        medium = self._find_medium(best_release, disc_id)
+        if medium:
+            for i, track in enumerate(medium.get('track-list', [])):
+                titles[i + 1] = track['recording']['title']
+        return album_info, titles
+    
+    def resolve_album_info(self, timeout=METADATA_TIMEOUT):
+        """Race GNUDB against MusicBrainz and return the first good answer"""
+        start = time.monotonic()
+        try:
+            return self._resolve_album_info(timeout)
+        finally:
+            metrics.DISC_SCAN_SECONDS.observe(time.monotonic() - start, phase='metadata')
+    
+    def _resolve_album_info(self, timeout):
+        futures = [
+            self.metadata_executor.submit(self.lookup_gnudb),
+            self.metadata_executor.submit(self.lookup_musicbrainz)
+        ]
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=timeout):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    log.warning("Album lookup failed: %s", e)
+                    continue
+                if result:
+                    # The slower lookup finishes on its own; its answer is ignored
+                    return result
+        except concurrent.futures.TimeoutError:
+            log.warning("Album lookup timed out after %ss", timeout)
         return None
     
+    def apply_album_info(self, album_info, titles):
+        """Set the album info and copy resolved titles onto the track list"""
+        self.album_info = album_info
+        for track_num, title in titles.items():
+            if 1 <= track_num <= len(self.track_info):
+                self.track_info[track_num - 1]['title'] = title
+    
     def get_album_info(self):
-        """Look up album information from GNUDB first, then MusicBrainz"""
+        """Look up album information, blocking until GNUDB or MusicBrainz answers"""
         try:
-            # First try to get full cd-discid output for GNUDB
-            try:
-                result = subprocess.run(
-                    ['cd-discid', self.cd_device], 
-                    capture_output=True, 
-                    text=True, 
-                    timeout=5
-                )
-                
-                if result.returncode == 0 and result.stdout.strip():
-                    # Try GNUDB first
-                    cd_discid_output = result.stdout.strip()
-                    print(f"CD-DISCID output: {cd_discid_output}")
-                    print(f"Trying GNUDB lookup...")
-                    gnudb_info = self.query_gnudb(cd_discid_output)
-                    if gnudb_info:
-                        self.album_info = gnudb_info
-                        print(f"Found album in GNUDB: {gnudb_info}")
-                        return
-                    else:
-                        print("GNUDB lookup returned nothing")
-                        
-            except Exception as e:
-                print(f"GNUDB lookup failed: {e}")
-            
-            # Fall back to MusicBrainz
-            disc_id = self.calculate_disc_id()
-            if not disc_id:
+            result = self.resolve_album_info()
+            if result:
+                self.apply_album_info(*result)
+        except Exception as e:
+            log.error("Error getting album info: %s", e)
+            self.album_info = None
+    
+    def resolve_in_background(self):
+        """Resolve album info off the request thread and push it to clients when done"""
+        disc_id = self.disc_id
+        with self.lock:
+            if disc_id in self.resolving:
                 return
-            
-            print(f"Trying MusicBrainz with disc ID: {disc_id}")
-            
-            # Try to look up by disc ID
+            self.resolving.add(disc_id)
+        
+        def worker():
             try:
-                result = musicbrainzngs.get_releases_by_discid(
-                    disc_id, 
-                    includes=["artists", "recordings", "release-groups"]
-                )
-                
-                if 'disc' in result and result['disc'].get('release-list'):
-                    releases = result['disc']['release-list']
-                    
-                    # Prefer releases in English or with high data quality
-                    best_release = None
-                    for release in releases:
-                        if best_release is None:
-                            best_release = release
-                        # Prefer releases with more complete data
-                        if 'date' in release and 'date' not in best_release:
-                            best_release = release
-                        # Prefer releases with language info
-                        if release.get('text-representation', {}).get('language') == 'eng':
-                            best_release = release
-                            break
-                    
-                    if best_release:
-                        self.album_info = {
-                            'artist': best_release['artist-credit'][0]['artist']['name'],
-                            'album': best_release['title'],
-                            'year': best_release.get('date', '').split('-')[0],
-                            'disc_id': disc_id
-                        }
-                        
-                        # Update track titles
-                        if 'medium-list' in best_release:
-                            for medium in best_release['medium-list']:
-                                if 'disc-list' in medium:
-                                    for disc in medium['disc-list']:
-                                        if disc['id'] == disc_id:
-                                            # Found the right disc
-                                            if 'track-list' in medium:
-                                                for i, track in enumerate(medium['track-list']):
-                                                    if i < len(self.track_info):
-                                                        self.track_info[i]['title'] = track['recording']['title']
-                                            return
+                result = self.resolve_album_info()
+                with self.lock:
+                    # Drop the answer if the disc changed or the user picked an album meanwhile
+                    if self.disc_id != disc_id:
                         return
+                    if result and not (self.album_info and self.album_info.get('manually_set')):
+                        self.apply_album_info(*result)
+                        self.cache_disc_info()
+                    event = self.metadata_event()
+                self.events.publish('metadata', event)
             except Exception as e:
-                print(f"MusicBrainz lookup error: {e}")
-            
-            # If disc ID lookup fails, try searching by track count and first track duration
-            if self.track_info:
-                track_count = len(self.track_info)
-                # Search for releases with similar track count
-                search_results = musicbrainzngs.search_releases(
-                    tracks=str(track_count),
-                    limit=5
-                )
-                
-                if search_results and 'release-list' in search_results:
-                    # For now, just use the first result as a guess
-                    release = search_results['release-list'][0]
-                    self.album_info = {
-                        'artist': release.get('artist-credit', [{}])[0].get('artist', {}).get('name', 'Unknown Artist'),
-                        'album': release.get('title', 'Unknown Album'),
-                        'year': release.get('date', '').split('-')[0] if 'date' in release else ''
-                    }
-                    
-        except Exception as e:
-            print(f"Error getting album info: {e}")
-            self.album_info = None
+                log.error("Error resolving album info: %s", e)
+            finally:
+                with self.lock:
+                    self.resolving.discard(disc_id)
+        
+        threading.Thread(target=worker, name='metadata-resolver', daemon=True).start()
     
     def play_track(self, track_number=None):
-        """Play a specific track or resume playback"""
+        """Play a specific track or resume playback on the server's outputs (WEBCD_OUTPUT)
+
+        Playback continues with the following tracks to the end of the disc.
+        """
         if track_number:
             self.current_track = track_number
             
         self.stop()  # Stop any current playback
         
+        # Without a TOC cdparanoia still finds tracks by number
+        if self.toc and self.current_track not in self.toc.audio_tracks():
+            return {'success': False, 'error': f'Unknown track: {self.current_track}'}
+        
+        sinks = []
         try:
-            # Start ffmpeg process for audio streaming
-            self.current_process = subprocess.Popen([
-                'ffmpeg',
-                '-f', 'libcdio',
-                '-i', self.cd_device,
-                '-track', str(self.current_track),
-                '-acodec', 'mp3',
-                '-ab', '192k',
-                '-f', 'mp3',
-                '-'
-            ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-            
-            self.is_playing = True
-            return {'success': True, 'track': self.current_track}
-            
+            for spec in LOCAL_OUTPUTS:
+                sinks.append(open_sink(spec))
         except Exception as e:
-            return {'success': False, 'error': str(e)}
+            for sink in sinks:
+                sink.close(drain=False)
+            return {'success': False, 'error': f'Cannot open output: {e}'}
+        
+        self.output = LocalPlayback(self, self.current_track, sinks,
+                                    on_track=self.output_track, on_finish=self.output_finished)
+        self.is_playing = True
+        self.output.start()
+        self.publish_status()
+        return {'success': True, 'track': self.current_track}
+    
+    def output_track(self, track):
+        """Local playback moved on to ``track``"""
+        self.current_track = track
+        self.publish_status()
+    
+    def output_finished(self, playback):
+        """Local playback reached the end of the disc, failed or was stopped"""
+        if self.output is playback:
+            self.output = None
+            self.is_playing = False
+            self.publish_status()
     
     def stop(self):
         """Stop playback"""
-        if self.current_process:
-            self.current_process.terminate()
-            self.current_process = None
+        if self.output:
+            self.output.stop()
+            self.output = None
         self.is_playing = False
+        self.publish_status()
         return {'success': True}
     
     def next_track(self):
@@ -580,18 +602,471 @@ class CDPlayer:
             return self.play_track(self.current_track - 1)
         return {'success': False, 'error': 'First track'}
     
+    @property
+    def chunk_size(self):
+        """Bytes per read and per HTTP chunk of a stream, from the buffer_size setting"""
+        return parse_size(self.stream_settings['buffer_size'])
+    
+    def inprocess_reads(self, track):
+        """Whether a track can be read without cdparanoia or ffmpeg (CDROMREADAUDIO, an image)"""
+        return (self.source is not None and self.reader.in_process(self.stream_settings['paranoia_mode'])
+                and self.toc is not None and track in self.toc.audio_tracks())
+    
+    def library_file(self, track, selected_format, bitrate=None):
+        """Path of this disc's ripped copy of a track in a format (MP3 at ``bitrate``), or None"""
+        if selected_format == 'mp3':
+            bitrate = bitrate or self.stream_settings['bitrate']
+        else:
+            bitrate = None
+        return self.library.get(self.disc_id, track, selected_format, bitrate)
+    
+    def decode_library(self, path, pcm_offset, length):
+        """Yield ``length`` bytes of PCM decoded from a ripped file, starting at ``pcm_offset``"""
+        process = metrics.popen(
+            ['ffmpeg', '-loglevel', 'quiet', '-i', path, '-f', 's16le', '-acodec', 'pcm_s16le', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        grow_pipe(process.stdout, self.chunk_size)
+        skip = pcm_offset
+        try:
+            # FLAC decodes far faster than real time, so decode from the start and skip
+            limit = None if length is None else pcm_offset + length
+            for data in read_chunks(process.stdout, self.chunk_size, limit=limit):
+                if skip:
+                    data, skip = data[skip:], max(skip - len(data), 0)
+                if data:
+                    yield data
+        finally:
+            process.terminate()
+    
+    def extract_pcm(self, track, start_sector=0, last_track=None):
+        """Generator of a track's raw PCM from the player's reader, starting ``start_sector`` sectors in
+
+        With ``last_track`` the read continues through the following tracks
+        up to and including that one, in one pass.
+        """
+        return self.reader.read_track(track, start_sector, last_track, chunk_size=self.chunk_size,
+                                      paranoia_mode=self.stream_settings['paranoia_mode'])
+    
+    def encoder_args(self, selected_format, bitrate=None):
+        """FFmpeg output options for the selected stream format (and MP3 bitrate)"""
+        if selected_format == 'mp3':
+            bitrate = bitrate or self.stream_settings['bitrate']
+            return [
+                '-acodec', 'mp3',
+                '-ab', bitrate,
+                '-bufsize', self.stream_settings['buffer_size'],
+                '-maxrate', bitrate,
+                '-f', 'mp3'
+            ]
+        elif selected_format == 'flac':
+            return [
+                '-acodec', 'flac',
+                '-compression_level', '5',  # 0-12, 5 is default
+                '-f', 'flac'
+            ]
+        elif selected_format == 'wav':
+            return [
+                '-acodec', 'pcm_s16le',
+                '-f', 'wav'
+            ]
+        return []
+    
+    def pcm_source(self, track):
+        """(cached PCM path or None, PCM size or None) of a track"""
+        # Tracks that were extracted before are served from the PCM cache
+        disc_id = self.disc_id
+        cached_pcm = self.pcm_cache.get(disc_id, track) if disc_id else None
+        
+        # Size of the track's PCM, from the cache or the TOC
+        pcm_size = self.pcm_cache.size(disc_id, track) if cached_pcm else None
+        if pcm_size is None and self.toc and track in self.toc.audio_tracks():
+            pcm_size = self.toc.track_sectors(track)[1] * BYTES_PER_SECTOR
+        return cached_pcm, pcm_size
+    
+    def direct_wav(self, track, cached_pcm, pcm_size):
+        """Whether a WAV stream can be built straight from PCM (known size, no ffmpeg)"""
+        return pcm_size is not None and bool(
+            cached_pcm or self.library_file(track, 'flac') or (self.source and self.reader.readable()))
+    
+    def read_pcm(self, track, cached_pcm, pcm_size, pcm_offset, length):
+        """Yield ``length`` bytes of a track's PCM starting at ``pcm_offset``, from the cache or the source
+
+        ``length`` None reads to the end of the track, whose size is not
+        known without a TOC.
+        """
+        disc_id = self.disc_id
+        if cached_pcm:
+            self.pcm_cache.record_cache_read(length)
+            with open(cached_pcm, 'rb') as f:
+                f.seek(pcm_offset)
+                yield from read_chunks(f, self.chunk_size, limit=length)
+            return
+        
+        library_flac = self.library_file(track, 'flac')
+        if library_flac:
+            # Ripped before: no drive access at all
+            yield from self.decode_library(library_flac, pcm_offset, length)
+            return
+        
+        # Start reading at the sector holding the offset and drop the remainder
+        sector, skip = divmod(pcm_offset, BYTES_PER_SECTOR)
+        chunks = self.extract_pcm(track, sector)
+        # Only a complete extraction from a drive is worth keeping; images
+        # and FLAC directories are on fast storage already
+        drive = self.reader.is_drive
+        writer = None
+        if drive and disc_id and pcm_size is not None and pcm_offset == 0 and length == pcm_size:
+            writer = self.pcm_cache.writer(disc_id, track, pcm_size)
+        try:
+            for data in chunks:
+                if drive:
+                    self.pcm_cache.record_drive_read(len(data))
+                if writer:
+                    writer.write(data)
+                if skip:
+                    data, skip = data[skip:], max(skip - len(data), 0)
+                if length is not None:
+                    data = data[:length]
+                    length -= len(data)
+                if data:
+                    yield data
+                if length is not None and length <= 0:
+                    break
+        finally:
+            chunks.close()
+            if writer:
+                if length == 0 and writer.size == pcm_size:
+                    writer.commit()
+                else:
+                    writer.abort()
+    
+    def encode_track(self, track, selected_format, start_sector, cached_pcm, pcm_size, bitrate=None):
+        """Generator of a track encoded to ``selected_format``, starting ``start_sector`` sectors in"""
+        disc_id = self.disc_id
+        bitrate = bitrate or self.stream_settings['bitrate']
+        library_flac = None if cached_pcm else self.library_file(track, 'flac')
+        # A whole track being read from the drive anyway (local playback, WAV prefetch) is shared
+        shared_pcm = None
+        if not (cached_pcm or library_flac or start_sector):
+            shared_pcm = self.broadcasts.find(self.pcm_key(track))
+            if shared_pcm and not shared_pcm.has_start():
+                shared_pcm = None
+        if (INPROCESS_PIPELINE and encoder.available(selected_format) and pcm_size is not None
+                and (cached_pcm or library_flac or shared_pcm or self.inprocess_reads(track))):
+            # No processes or pipes: PCM from the cache or CDROMREADAUDIO, encoded by PyAV
+            pcm_start = start_sector * BYTES_PER_SECTOR
+            if shared_pcm:
+                pcm = shared_pcm.subscribe()
+            else:
+                pcm = self.read_pcm(track, cached_pcm, pcm_size, pcm_start, pcm_size - pcm_start)
+            yield from encoder.encode_pcm(pcm, selected_format, bitrate)
+            return
+        
+        # For CD audio, we need to specify the track differently
+        # Track selection in ffmpeg for CD audio uses -ss (seek start)
+        # We'll use cdparanoia for more reliable track extraction
+        
+        # First try cdparanoia which handles CD tracks better
+        try:
+            if library_flac:
+                # Transcoded from the ripped copy
+                ffmpeg_cmd = ['ffmpeg']
+                if start_sector:
+                    # File input seeks exactly and instantly
+                    ffmpeg_cmd.extend(['-ss', f'{start_sector / FRAMES_PER_SECOND:.3f}'])
+                ffmpeg_cmd.extend(['-i', library_flac])
+                ffmpeg_cmd.extend(self.encoder_args(selected_format, bitrate))
+                ffmpeg_cmd.append('-')  # output to stdout
+                cdp_process = None
+                ffmpeg_process = metrics.popen(
+                    ffmpeg_cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL
+                )
+            elif cached_pcm or shared_pcm or not self.reader.is_drive:
+                # No drive access of its own; an idle encoder from the pool reads
+                # the cached PCM, joins the track's shared PCM or reads the image
+                cdp_process = None
+                ffmpeg_process = self.encoders.acquire(self.encoder_args(selected_format, bitrate))
+                pcm_start = start_sector * BYTES_PER_SECTOR
+                if shared_pcm:
+                    pcm = shared_pcm.subscribe()
+                else:
+                    pcm = self.read_pcm(track, cached_pcm, pcm_size, pcm_start, pcm_size - pcm_start)
+                threading.Thread(
+                    target=feed_pcm,
+                    args=(pcm, ffmpeg_process.stdin),
+                    name=f'pcm-feed-{track}',
+                    daemon=True
+                ).start()
+            else:
+                # cdparanoia starts reading at the seek position while an
+                # encoder from the pool waits for its output
+                cdp_process = metrics.popen(
+                    self.source.cdparanoia_command(track, start_sector,
+                                                   paranoia_mode=self.stream_settings['paranoia_mode']),
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                ffmpeg_process = self.encoders.acquire(self.encoder_args(selected_format, bitrate))
+                
+                # Copy cdparanoia's PCM into ffmpeg, keeping a copy of whole tracks in the cache
+                writer = None
+                if disc_id and not start_sector:
+                    writer = self.pcm_cache.writer(disc_id, track, pcm_size)
+                grow_pipe(cdp_process.stdout, self.chunk_size)
+                threading.Thread(
+                    target=tee_pcm,
+                    args=(cdp_process.stdout, ffmpeg_process.stdin, writer, self.pcm_cache, cdp_process,
+                          self.chunk_size),
+                    name=f'pcm-tee-{track}',
+                    daemon=True
+                ).start()
+            
+            grow_pipe(ffmpeg_process.stdout, self.chunk_size)
+            try:
+                yield from read_chunks(ffmpeg_process.stdout, self.chunk_size)
+            finally:
+                if cdp_process:
+                    cdp_process.terminate()
+                ffmpeg_process.terminate()
+                
+        except Exception as e:
+            if not self.reader.is_drive:
+                raise
+            # Fallback to direct ffmpeg if cdparanoia fails
+            log.warning("cdparanoia failed: %s, falling back to ffmpeg", e, extra={'device': self.cd_device})
+            
+            cmd = [
+                'ffmpeg',
+                '-f', 'libcdio',
+                '-i', self.cd_device,
+                '-map', f'0:a:{track-1}',  # Map audio track (0-indexed)
+            ]
+            if start_sector:
+                cmd.extend(['-ss', f'{start_sector / FRAMES_PER_SECOND:.3f}'])
+            
+            if selected_format == 'mp3':
+                cmd.extend([
+                    '-acodec', 'mp3',
+                    '-ab', bitrate,
+                    '-f', 'mp3'
+                ])
+            elif selected_format == 'flac':
+                cmd.extend([
+                    '-acodec', 'flac',
+                    '-compression_level', '5',
+                    '-f', 'flac'
+                ])
+            elif selected_format == 'wav':
+                cmd.extend([
+                    '-acodec', 'pcm_s16le',
+                    '-f', 'wav'
+                ])
+            
+            cmd.append('-')
+            
+            process = metrics.popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            
+            grow_pipe(process.stdout, self.chunk_size)
+            try:
+                yield from read_chunks(process.stdout, self.chunk_size)
+            finally:
+                process.terminate()
+    
+    def shared_stream(self, track, selected_format, start_sector, cached_pcm=None, pcm_size=None,
+                      bitrate=None, **kwargs):
+        """The Broadcaster that all listeners of this track, quality and start position share"""
+        bitrate = (bitrate or self.stream_settings['bitrate']) if selected_format == 'mp3' else None
+        key = (self.cd_device, track, selected_format, bitrate, start_sector)
+        return self.broadcasts.get(
+            key, lambda: self.encode_track(track, selected_format, start_sector, cached_pcm, pcm_size, bitrate),
+            fmt=selected_format,
+            # Raw PCM chunks must stay aligned to 4 byte sample frames
+            align=4 if selected_format == 'wav' else 1,
+            # MP3 frames decode on their own, so a stalled listener may skip some;
+            # WAV and FLAC listeners get every byte
+            skip_ahead=selected_format == 'mp3',
+            **kwargs
+        )
+    
+    def pcm_key(self, track):
+        """Broadcast key of a whole track's raw PCM (WAV streams, local playback)"""
+        return (self.cd_device, track, 'pcm', None, 0)
+    
+    def shared_pcm(self, track, prebuffer_timeout=None):
+        """The Broadcaster of a whole track's raw PCM, read once for every sink and listener"""
+        cached_pcm, pcm_size = self.pcm_source(track)
+        return self.broadcasts.get(
+            self.pcm_key(track), lambda: self.read_pcm(track, cached_pcm, pcm_size, 0, pcm_size),
+            # Raw PCM chunks must stay aligned to 4 byte sample frames
+            align=4, prebuffer_timeout=prebuffer_timeout or PREFETCH_TIMEOUT,
+            # Sound cards play in real time, slower than most sources read: the
+            # read waits for them rather than skip audio
+            skip_ahead=False
+        )
+    
+    def next_audio_track(self, track):
+        """The audio track played after ``track``, or None at the end of the disc"""
+        if not self.toc:
+            return None
+        later = [t for t in self.toc.audio_tracks() if t > track]
+        return later[0] if later else None
+    
+    def prefetch_window(self):
+        """Seconds before the end of a track at which the next one is prefetched"""
+        if PREFETCH_SECONDS is not None:
+            return PREFETCH_SECONDS
+        return self.stream_settings['preload_seconds']
+    
+    def cancel_prefetch(self):
+        with self.lock:
+            timers, self.prefetch_timers = self.prefetch_timers, {}
+        for timer in timers.values():
+            timer.cancel()
+    
+    def schedule_prefetch(self, track, position=0, selected_format=None, bitrate=None):
+        """Prefetch the next track once ``track``, playing from ``position`` seconds, nears its end
+
+        The next track is prepared in the quality the current one is streamed in.
+        Listeners of different tracks or qualities get a timer each; a later call
+        for the same next track and quality (a seek) replaces its timer.
+        """
+        next_track = self.next_audio_track(track)
+        window = self.prefetch_window()
+        if next_track is None or window <= 0 or track not in self.toc.audio_tracks():
+            return
+        duration = self.toc.track_sectors(track)[1] / FRAMES_PER_SECOND
+        key = (next_track, selected_format, bitrate)
+        timer = threading.Timer(max(duration - position - window, 0), self.prefetch, args=key)
+        timer.daemon = True
+        with self.lock:
+            # Fired timers stay until replaced or cancelled: one per track and quality at most
+            replaced = self.prefetch_timers.get(key)
+            self.prefetch_timers[key] = timer
+        if replaced:
+            replaced.cancel()
+        timer.start()
+    
+    def prefetch(self, track, selected_format=None, bitrate=None):
+        """Start extracting and encoding a track before it is requested, so it starts without a gap"""
+        selected_format = selected_format or self.stream_settings.get('format', 'mp3')
+        cached_pcm, pcm_size = self.pcm_source(track)
+        timeout = self.prefetch_window() + PREFETCH_TIMEOUT
+        if self.library_file(track, selected_format, bitrate):
+            # Sent as a file from the library anyway
+            return
+        if selected_format == 'wav' and self.direct_wav(track, cached_pcm, pcm_size):
+            if cached_pcm or self.library_file(track, 'flac'):
+                # Served straight from the cache or the library anyway
+                return
+            # The WAV route builds the file from PCM, so prefetch the track's PCM
+            broadcaster = self.shared_pcm(track, prebuffer_timeout=timeout)
+        else:
+            broadcaster = self.shared_stream(track, selected_format, 0, cached_pcm, pcm_size, bitrate,
+                                             prebuffer_timeout=timeout)
+        log.debug("Prefetching track %d", track, extra={'device': self.cd_device})
+        broadcaster.start()
+    
+    def album_pcm(self, tracks):
+        """PCM of ``tracks`` back to back, with no gap or overlap between them"""
+        for track in tracks:
+            cached_pcm, pcm_size = self.pcm_source(track)
+            yield from self.read_pcm(track, cached_pcm, pcm_size, 0, pcm_size)
+    
+    def encode_album(self, tracks, selected_format, bitrate=None):
+        """Generator of ``tracks`` encoded as one continuous stream"""
+        bitrate = bitrate or self.stream_settings['bitrate']
+        if INPROCESS_PIPELINE and encoder.available(selected_format):
+            yield from encoder.encode_pcm(self.album_pcm(tracks), selected_format, bitrate)
+            return
+        
+        ffmpeg_process = self.encoders.acquire(self.encoder_args(selected_format, bitrate))
+        threading.Thread(
+            target=feed_pcm,
+            args=(self.album_pcm(tracks), ffmpeg_process.stdin),
+            name=f'album-feed-{tracks[0]}',
+            daemon=True
+        ).start()
+        grow_pipe(ffmpeg_process.stdout, self.chunk_size)
+        try:
+            yield from read_chunks(ffmpeg_process.stdout, self.chunk_size)
+        finally:
+            ffmpeg_process.terminate()
+    
     def get_status(self):
         """Get current player status"""
         return {
-            'is_playing': self.is_playing,
-            'current_track': self.current_track,
-            'track_count': len(self.track_info)
+            'is_playing': self.is_playing,
+            'current_track': self.current_track,
+            'track_count': len(self.track_info),
+            'device': self.cd_device,
+            'device_id': self.device_id,
+            'disc_id': self.disc_id,
+            'source': self.reader.kind if self.source else None,
+            'active_streams': dict(self.active_streams),
+            'listeners': sum(self.active_streams.values()),
+            'pipelines': len(self.broadcasts.broadcasters),
+            'output': self.output.to_dict() if self.output else None
+        }
+    
+    def publish_status(self):
+        """Push the current player status to /api/events subscribers"""
+        self.events.publish('status', self.get_status())
+    
+    def metadata_event(self):
+        """Payload of the 'metadata' event for the disc in this drive"""
+        return {
+            'device_id': self.device_id,
+            'disc_id': self.disc_id,
+            'album': self.album_info,
+            'tracks': self.track_info
         }
     
+    def stream_started(self, track):
+        """Record an /api/stream response starting for a track"""
+        with self.lock:
+            self.active_streams[track] = self.active_streams.get(track, 0) + 1
+            self.current_track = track
+        metrics.ACTIVE_STREAMS.inc(device=self.device_id)
+        self.publish_status()
+    
+    def stream_finished(self, track):
+        """Record an /api/stream response ending"""
+        with self.lock:
+            count = self.active_streams.get(track, 0) - 1
+            if count > 0:
+                self.active_streams[track] = count
+            else:
+                self.active_streams.pop(track, None)
+        metrics.ACTIVE_STREAMS.dec(device=self.device_id)
+        self.publish_status()
+    
+    def listener_stream(self, body, track, started, selected_format, source):
+        """``body`` of a response to a listener of ``track``, with its accounting and metrics
+
+        ``started`` is the monotonic time the request arrived and ``source``
+        (library, wav, encoded) labels the metrics.
+        """
+        self.stream_started(track)
+        sent = 0
+        try:
+            for data in metrics.observe_stream(body, started, device=self.device_id,
+                                               format=selected_format, source=source):
+                sent += len(data)
+                if chunk_log.isEnabledFor(logging.DEBUG):
+                    chunk_log.debug("Stream chunk", extra={'device': self.device_id, 'track': track,
+                                                           'format': selected_format, 'bytes': len(data),
+                                                           'sent': sent})
+                yield data
+        finally:
+            self.stream_finished(track)
+    
     def eject_cd(self):
         """Eject the CD tray"""
         if not self.cd_device:
             return {'success': False, 'error': 'No CD device selected'}
+        if not self.source.is_drive:
+            return {'success': False, 'error': 'Only drives can be ejected'}
             
         try:
             # Stop playback first if playing
@@ -600,14 +1075,13 @@ class CDPlayer:
             
             # Use eject command to open the CD tray
             cmd = ['eject', self.cd_device]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
+            result = metrics.run(cmd, capture_output=True, text=True, timeout=5)
             
             if result.returncode == 0:
                 # Clear track info since CD is ejected
-                self.track_info = []
-                self.album_info = None
-                # Refresh device info to update media status
-                self.detect_cd_devices()
+                self.clear_disc()
+                # Update the device registry (and notify clients) without a rescan
+                self.manager.device_monitor.set_media(self.cd_device, False)
                 return {'success': True, 'message': 'CD ejected successfully'}
             else:
                 return {'success': False, 'error': f'Failed to eject CD: {result.stderr}'}
@@ -616,65 +1090,425 @@ class CDPlayer:
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-# Create player instance
-player = CDPlayer()
+class PlayerManager:
+    """Keeps one independent CDPlayer per drive so several drives can stream at once.
+
+    The event bus, disc/PCM caches, metadata workers and device monitor are
+    shared. Routes without a device ID use the default drive, which
+    /api/set-device changes without touching the other drives.
+    """
+    
+    def __init__(self):
+        self.players = {}  # device ID -> CDPlayer
+        self.available_devices = []
+        # Disc images and FLAC directories served like drives: device ID -> device info
+        self.image_devices = {}
+        self.default_device = None
+        self.lock = threading.Lock()
+        self.metadata_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix='metadata')
+        # Publishes state changes to /api/events subscribers
+        self.events = EventBus()
+        # Persistent TOC/metadata cache keyed by disc ID
+        try:
+            self.disc_cache = DiscCache()
+        except (OSError, sqlite3.Error) as e:
+            log.warning("Disc cache unavailable (%s), using in-memory cache", e)
+            self.disc_cache = DiscCache(':memory:')
+        # GNUDB lookups, reusing connections and remembering discs it does not know
+        self.cddb = CDDBClient(GNUDB_HOST, GNUDB_PORT, protocol=GNUDB_PROTOCOL)
+        # Cached, coalesced and rate limited MusicBrainz requests
+        self.musicbrainz = MusicBrainzClient(rate=MUSICBRAINZ_RATE)
+        # Raw PCM of tracks already extracted from the drive
+        pcm_cache_mb = int(os.environ.get('WEBCD_PCM_CACHE_MB', '2048'))
+        try:
+            self.pcm_cache = PCMCache(max_bytes=pcm_cache_mb * 1024 * 1024)
+        except OSError as e:
+            log.warning("PCM cache unavailable (%s), using a temporary directory", e)
+            self.pcm_cache = PCMCache(tempfile.mkdtemp(prefix='webcd-pcm-'),
+                                      max_bytes=pcm_cache_mb * 1024 * 1024)
+        # Whole discs ripped to FLAC/MP3 by /api/rip
+        try:
+            self.library = Library()
+        except OSError as e:
+            log.warning("Library unavailable (%s), using a temporary directory", e)
+            self.library = Library(tempfile.mkdtemp(prefix='webcd-library-'))
+        self.rips = RipManager(self.library,
+                               on_progress=lambda job: self.events.publish('rip', job.to_dict()))
+        # Whole discs captured to BIN/CUE images by /api/image
+        try:
+            self.images = ImageArchive()
+        except OSError as e:
+            log.warning("Image archive unavailable (%s), using a temporary directory", e)
+            self.images = ImageArchive(tempfile.mkdtemp(prefix='webcd-images-'))
+        self.captures = CaptureManager(self.images,
+                                       on_progress=lambda job: self.events.publish('image', job.to_dict()),
+                                       on_done=self.image_captured)
+        # Segmented multi-bitrate renditions for /api/hls
+        hls_bitrates = os.environ.get('WEBCD_HLS_BITRATES', '64k,128k,256k').split(',')
+        hls_cache_mb = int(os.environ.get('WEBCD_HLS_CACHE_MB', '1024'))
+        try:
+            self.hls = HLSCache(bitrates=hls_bitrates, max_bytes=hls_cache_mb * 1024 * 1024)
+        except OSError as e:
+            log.warning("HLS cache unavailable (%s), using a temporary directory", e)
+            self.hls = HLSCache(tempfile.mkdtemp(prefix='webcd-hls-'), bitrates=hls_bitrates,
+                                max_bytes=hls_cache_mb * 1024 * 1024)
+        # Idle ffmpeg encoders, so streams do not wait for one to start
+        self.encoders = EncoderPool(size=int(os.environ.get('WEBCD_ENCODER_POOL_SIZE', '1')))
+        # Answers requests while there is no drive at all
+        self.no_device = CDPlayer(self)
+        # Detect CD devices on initialization, then follow hotplug/media
+        # changes in the background instead of re-scanning per request
+        self.device_monitor = DeviceMonitor(self.get_device_info, self.on_device_change)
+        self.detect_cd_devices()
+        if os.environ.get('WEBCD_DEVICE_MONITOR', '1') != '0':
+            self.device_monitor.start()
+        
+        # Images and directories to serve from the start, archived images included
+        paths = list(filter(None, os.environ.get('WEBCD_SOURCES', '').split(os.pathsep)))
+        if os.environ.get('WEBCD_IMAGE_DEVICES', '1') != '0':
+            paths.extend(self.images.list())
+        for path in paths:
+            try:
+                self.add_image(path)
+            except OSError as e:
+                log.warning("Not serving %s: %s", path, e)
+        
+        # Check for environment variable override
+        env_device = os.environ.get('WEBCD_DEVICE')
+        if env_device and os.path.exists(env_device):
+            if source_kind(env_device) == 'drive':
+                self.default_device = self.player_for(env_device).device_id
+            else:
+                self.default_device = self.add_image(env_device).device_id
+        elif self.available_devices and not self.default_device:
+            # Use first available device if no environment override
+            self.default_device = self.available_devices[0]['id']
+    
+    def warm_encoders(self):
+        """Start encoders for the default stream settings, so the first stream finds one.
+
+        Called by the process that serves requests (server.py), not on
+        import: an imported app starts no ffmpeg processes of its own.
+        """
+        player = self.get()
+        self.encoders.warm(player.encoder_args(player.stream_settings['format']))
+
+    @staticmethod
+    def device_id(device_path):
+        """Short, URL friendly ID of a drive (e.g. sr0 for /dev/cdrom -> /dev/sr0) or image"""
+        return re.sub(r'[^\w.-]+', '-', os.path.basename(os.path.realpath(device_path)))
+    
+    def get(self, device_id=None):
+        """Player for a device ID, the default drive's player, or None if the ID is unknown"""
+        with self.lock:
+            if device_id is None:
+                return self.players.get(self.default_device, self.no_device)
+            return self.players.get(device_id)
+    
+    def player_for(self, device_path):
+        """Player for a device path, created on first use"""
+        device_id = self.device_id(device_path)
+        with self.lock:
+            player = self.players.get(device_id)
+            if player is None:
+                player = CDPlayer(self, device_path)
+                self.players[device_id] = player
+            return player
+    
+    def add_image(self, path):
+        """Serve a disc image or FLAC directory like a drive with a disc in it
+
+        Raises OSError (SourceError) if it does not describe a disc.
+        """
+        player = self.player_for(path)
+        # Reading an image's TOC costs nothing, so its tracks can be streamed right away
+        if player.toc is None:
+            player.read_toc()
+        self.image_devices[player.device_id] = {
+            'id': player.device_id,
+            'device': path,
+            'real_path': os.path.realpath(path),
+            'model': 'FLAC directory' if player.source.kind == 'flac' else 'Disc image',
+            'has_media': True,
+            'source': player.source.kind
+        }
+        self.available_devices = self.all_devices()
+        return player
+    
+    def image_captured(self, job):
+        """A capture finished: serve the image, also to the drive it was read from"""
+        if os.environ.get('WEBCD_IMAGE_DEVICES', '1') != '0':
+            try:
+                self.add_image(job.path)
+            except OSError as e:
+                log.warning("Not serving %s: %s", job.path, e)
+            self.publish_devices()
+        for player in self.all_players():
+            if player.disc_id == job.disc_id and player.source.is_drive:
+                player.mount_image()
+    
+    def all_devices(self):
+        """Drives known to the device monitor, then the images being served"""
+        return self.device_monitor.devices() + list(self.image_devices.values())
+    
+    def all_players(self):
+        with self.lock:
+            return list(self.players.values())
+    
+    @property
+    def cd_device(self):
+        """Device path of the default drive"""
+        return self.get().cd_device
+    
+    def detect_cd_devices(self):
+        """Detect available CD/DVD devices on the system with a full rescan"""
+        self.device_monitor.rescan()
+        self.available_devices = self.all_devices()
+        for info in self.available_devices:
+            self.player_for(info['device'])
+        return self.available_devices
+    
+    def on_device_change(self, kind, info):
+        """Device monitor callback: keep one player per drive and notify clients"""
+        self.available_devices = self.all_devices()
+        
+        if kind == 'rescan':
+            for device in self.available_devices:
+                self.player_for(device['device'])
+        elif kind == 'added':
+            player = self.player_for(info['device'])
+            if not self.default_device:
+                self.default_device = player.device_id
+        elif kind == 'removed':
+            with self.lock:
+                player = self.players.pop(info['id'], None)
+            if player and player.is_playing:
+                player.stop()
+            if self.default_device == info['id']:
+                # The default drive was unplugged; fall back to another one
+                self.default_device = self.available_devices[0]['id'] if self.available_devices else None
+                self.events.publish('device', {'device': self.cd_device, 'device_id': self.default_device})
+        elif kind == 'media':
+            player = self.get(info['id'])
+            # Report the change under the name the drive was selected by
+            device = info['device']
+            if player:
+                player.media_changed(info['has_media'])
+                device = player.cd_device
+            self.events.publish('disc', {
+                'device': device,
+                'device_id': info['id'],
+                'state': 'inserted' if info['has_media'] else 'ejected'
+            })
+        
+        self.publish_devices()
+    
+    def get_device_info(self, device_path):
+        """Get information about a CD/DVD device"""
+        try:
+            # Get the real device path (resolve symlinks)
+            real_path = os.path.realpath(device_path)
+            
+            # Try to get device model info
+            model = "Unknown CD/DVD Drive"
+            try:
+                # Extract device name from path (e.g., sr0 from /dev/sr0)
+                device_name = os.path.basename(real_path)
+                model_file = f'/sys/block/{device_name}/device/model'
+                if os.path.exists(model_file):
+                    with open(model_file, 'r') as f:
+                        model = f.read().strip()
+            except:
+                pass
+            
+            # Check if media is present
+            has_media = self.check_media_present(device_path)
+            
+            return {
+                'id': self.device_id(device_path),
+                'device': device_path,
+                'real_path': real_path,
+                'model': model,
+                'has_media': has_media,
+                'source': 'drive'
+            }
+        except:
+            return None
+    
+    def check_media_present(self, device_path):
+        """Check if a CD is present in the device"""
+        try:
+            # Ask the drive directly, without spinning up the disc
+            status = drive_status(device_path)
+            if status == CDS_DISC_OK:
+                return True
+            if status in (CDS_NO_DISC, CDS_TRAY_OPEN):
+                return False
+        except OSError:
+            pass
+        try:
+            # Try using cdparanoia -Q to check for media
+            result = metrics.run(['cdparanoia', '-Q', '-d', device_path], 
+                                 capture_output=True, timeout=2)
+            # If cdparanoia can read TOC, media is present
+            return 'Unable to open disc' not in result.stderr.decode()
+        except:
+            try:
+                # Fallback: try using blockdev
+                result = metrics.run(['blockdev', '--getsize64', device_path], 
+                                     capture_output=True, timeout=1)
+                return result.returncode == 0 and int(result.stdout.strip()) > 0
+            except:
+                return False
+    
+    def set_default_device(self, device_path):
+        """Choose the drive used by routes without a device ID"""
+        # Verify the device exists
+        if not os.path.exists(device_path):
+            return {'success': False, 'error': 'Device not found'}
+        
+        # Other drives keep playing; the chosen one keeps its own state
+        try:
+            if source_kind(device_path) == 'drive':
+                player = self.player_for(device_path)
+            else:
+                player = self.add_image(device_path)
+                self.publish_devices()
+        except OSError as e:
+            return {'success': False, 'error': str(e)}
+        self.default_device = player.device_id
+        
+        self.events.publish('device', {'device': player.cd_device, 'device_id': player.device_id})
+        return {'success': True, 'device': player.cd_device, 'device_id': player.device_id}
+    
+    def publish_devices(self):
+        """Push the device list to /api/events subscribers"""
+        self.events.publish('devices', self.devices_event())
+    
+    def devices_event(self):
+        return {
+            'devices': self.available_devices,
+            'current_device': self.cd_device,
+            'current_device_id': self.default_device
+        }
+    
+    def snapshot_events(self):
+        """Events that bring a newly connected /api/events client up to date"""
+        events = [('devices', self.devices_event())]
+        for player in self.all_players() or [self.no_device]:
+            events.append(('status', player.get_status()))
+            if player.track_info:
+                events.append(('metadata', player.metadata_event()))
+        return events
+
+# One player per drive
+players = PlayerManager()
+
+def get_player(device_id=None):
+    """Player for a route's device ID (the default drive if none), or a 404"""
+    player = players.get(device_id)
+    if player is None:
+        abort(make_response(jsonify({'success': False, 'error': f'Unknown device: {device_id}'}), 404))
+    return player
+
+def stream_quality(player):
+    """(format, bitrate) of a stream request.
+
+    ``?format=`` and ``?bitrate=`` choose the quality for this request only;
+    without them the drive's stream settings apply.
+    """
+    selected_format = request.args.get('format', player.stream_settings.get('format', 'mp3'))
+    bitrate = request.args.get('bitrate', player.stream_settings['bitrate'])
+    if selected_format not in STREAM_FORMATS or bitrate not in MP3_BITRATES:
+        abort(make_response(jsonify({'success': False, 'error': 'Invalid format or bitrate'}), 400))
+    return selected_format, bitrate
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/cd-info')
-def get_cd_info():
+@app.route('/api/devices/<device_id>/cd-info')
+def get_cd_info(device_id=None):
+    player = get_player(device_id)
     # Force fresh CD read every time
     result = player.get_cd_info()
-    print(f"API returning album info: {player.album_info}")
+    log.debug("API returning album info", extra={'album': player.album_info})
     return jsonify(result)
 
+@app.route('/api/events')
+def events():
+    """Server-Sent Events stream of player updates"""
+    response = Response(players.events.stream(initial=players.snapshot_events()),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/play', methods=['POST'])
-def play():
+@app.route('/api/devices/<device_id>/play', methods=['POST'])
+def play(device_id=None):
     track = request.json.get('track') if request.json else None
-    return jsonify(player.play_track(track))
+    return jsonify(get_player(device_id).play_track(track))
 
 @app.route('/api/stop', methods=['POST'])
-def stop():
-    return jsonify(player.stop())
+@app.route('/api/devices/<device_id>/stop', methods=['POST'])
+def stop(device_id=None):
+    return jsonify(get_player(device_id).stop())
 
 @app.route('/api/next', methods=['POST'])
-def next_track():
-    return jsonify(player.next_track())
+@app.route('/api/devices/<device_id>/next', methods=['POST'])
+def next_track(device_id=None):
+    return jsonify(get_player(device_id).next_track())
 
 @app.route('/api/previous', methods=['POST'])
-def previous_track():
-    return jsonify(player.previous_track())
+@app.route('/api/devices/<device_id>/previous', methods=['POST'])
+def previous_track(device_id=None):
+    return jsonify(get_player(device_id).previous_track())
 
 @app.route('/api/status')
-def status():
-    return jsonify(player.get_status())
+@app.route('/api/devices/<device_id>/status')
+def status(device_id=None):
+    return jsonify(get_player(device_id).get_status())
 
 @app.route('/api/eject', methods=['POST'])
-def eject():
-    return jsonify(player.eject_cd())
+@app.route('/api/devices/<device_id>/eject', methods=['POST'])
+def eject(device_id=None):
+    return jsonify(get_player(device_id).eject_cd())
 
 @app.route('/api/devices')
 def get_devices():
-    """Get list of available CD/DVD devices"""
-    player.detect_cd_devices()  # Refresh device list
-    return jsonify({
-        'success': True,
-        'devices': player.available_devices,
-        'current_device': player.cd_device
-    })
+    """Get list of available CD/DVD devices from the device monitor's registry"""
+    if request.args.get('refresh') == '1':
+        players.detect_cd_devices()  # Explicit full rescan
+    return jsonify(dict(players.devices_event(), success=True))
 
 @app.route('/api/set-device', methods=['POST'])
 def set_device():
-    """Set the active CD device"""
+    """Set the default CD device, used by routes without a device ID"""
     data = request.json
     if not data or not data.get('device'):
         return jsonify({'success': False, 'error': 'No device specified'})
     
-    result = player.set_cd_device(data['device'])
+    result = players.set_default_device(data['device'])
     return jsonify(result)
 
+def rate_limited(error):
+    """503 response for a MusicBrainz request refused by the rate limit"""
+    response = jsonify({'success': False, 'error': str(error), 'retry_after': round(error.retry_after, 1)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
+def pending(error):
+    """202 response for a MusicBrainz answer still on its way: ask again after Retry-After"""
+    response = jsonify({'success': False, 'pending': True, 'retry_after': round(error.retry_after, 1)})
+    response.status_code = 202
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
 @app.route('/api/search-album', methods=['POST'])
 def search_album():
     """Manual album search"""
@@ -684,7 +1518,7 @@ def search_album():
     
     try:
         # Search MusicBrainz for albums
-        results = musicbrainzngs.search_releases(
+        results = players.musicbrainz.search_releases(
             release=data['query'],
             limit=10
         )
@@ -703,19 +1537,25 @@ def search_album():
         
         return jsonify({'success': True, 'albums': albums})
         
+    except Pending as e:
+        return pending(e)
+    except RateLimited as e:
+        return rate_limited(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/set-album', methods=['POST'])
-def set_album():
+@app.route('/api/devices/<device_id>/set-album', methods=['POST'])
+def set_album(device_id=None):
     """Manually set album information"""
+    player = get_player(device_id)
     data = request.json
     if not data or not data.get('release_id'):
         return jsonify({'success': False, 'error': 'No release ID provided'})
     
     try:
         # Get detailed release info
-        result = musicbrainzngs.get_release_by_id(
+        result = players.musicbrainz.get_release_by_id(
             data['release_id'],
             includes=["artists", "recordings", "media"]
         )
@@ -736,18 +1576,28 @@ def set_album():
                     if i < len(player.track_info):
                         player.track_info[i]['title'] = track['recording']['title']
             
+            # Remember the manual choice for this disc
+            player.cache_disc_info()
+            player.events.publish('metadata', player.metadata_event())
+            
             return jsonify({
                 'success': True, 
                 'album': player.album_info,
                 'tracks': player.track_info
             })
             
+    except Pending as e:
+        return pending(e)
+    except RateLimited as e:
+        return rate_limited(e)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/settings', methods=['GET', 'POST'])
-def stream_settings():
-    """Get or update stream quality settings"""
+@app.route('/api/devices/<device_id>/settings', methods=['GET', 'POST'])
+def stream_settings(device_id=None):
+    """Get or update a drive's stream quality settings"""
+    player = get_player(device_id)
     if request.method == 'POST':
         data = request.json
         if data:
@@ -755,13 +1605,13 @@ def stream_settings():
             if 'format' in data:
                 # Validate format
                 fmt = data['format']
-                if fmt in ['mp3', 'flac', 'wav']:
+                if fmt in STREAM_FORMATS:
                     player.stream_settings['format'] = fmt
             
             if 'bitrate' in data:
                 # Validate bitrate (32k-320k) - only for MP3
                 bitrate = data['bitrate']
-                if bitrate in ['32k', '64k', '96k', '128k', '192k', '256k', '320k']:
+                if bitrate in MP3_BITRATES:
                     player.stream_settings['bitrate'] = bitrate
             
             if 'buffer_size' in data:
@@ -781,14 +1631,198 @@ def stream_settings():
                 preload = int(data['preload_seconds'])
                 if 0 <= preload <= 10:
                     player.stream_settings['preload_seconds'] = preload
+            
+            # WAV is mostly served without an encoder
+            if player.stream_settings['format'] != 'wav':
+                player.encoders.warm(player.encoder_args(player.stream_settings['format']))
     
     return jsonify(player.stream_settings)
 
+@app.route('/api/rip', methods=['GET', 'POST'])
+@app.route('/api/devices/<device_id>/rip', methods=['GET', 'POST'])
+def rip(device_id=None):
+    """Start ripping the disc to the library (POST), or list rip jobs (GET)
+
+    POST takes an optional JSON body ``{"formats": ["flac", "mp3"], "bitrate": "192k"}``;
+    FLAC is always included. Progress is also published as ``rip`` events.
+    """
+    if request.method == 'GET':
+        return jsonify({'success': True, 'jobs': players.rips.list()})
+    
+    player = get_player(device_id)
+    if not player.cd_device:
+        return jsonify({'success': False, 'error': 'No CD device selected'}), 400
+    if not player.toc:
+        player.read_toc()
+    if not player.toc or not player.toc.audio_tracks():
+        return jsonify({'success': False, 'error': 'No audio CD in the drive'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    formats = data.get('formats', list(RIP_FORMATS))
+    if not isinstance(formats, list) or not set(formats) <= set(RIP_FORMATS):
+        return jsonify({'success': False, 'error': f'Formats must be a list of {", ".join(RIP_FORMATS)}'}), 400
+    formats = ['flac'] + [fmt for fmt in formats if fmt != 'flac']
+    bitrate = data.get('bitrate', player.stream_settings['bitrate'])
+    if bitrate not in MP3_BITRATES:
+        return jsonify({'success': False, 'error': 'Invalid bitrate'}), 400
+    
+    job = players.rips.start(player, formats, bitrate)
+    return jsonify({'success': True, 'job': job.to_dict()}), 202
+
+@app.route('/api/rip/<job_id>', methods=['GET', 'DELETE'])
+def rip_job(job_id):
+    """Progress of a rip job, or cancel it (DELETE)"""
+    job = players.rips.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown rip job: {job_id}'}), 404
+    if request.method == 'DELETE':
+        job.cancel()
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/image', methods=['GET', 'POST'])
+@app.route('/api/devices/<device_id>/image', methods=['GET', 'POST'])
+def image(device_id=None):
+    """Capture the disc to a BIN/CUE image in the archive (POST), or list captures and images (GET)
+
+    POST reads the whole disc once; a disc that already has an image is
+    not read again unless the JSON body has ``"force": true``. Progress is
+    also published as ``image`` events.
+    """
+    if request.method == 'GET':
+        return jsonify({'success': True, 'jobs': players.captures.list(), 'images': players.images.summary()})
+    
+    player = get_player(device_id)
+    if not player.cd_device:
+        return jsonify({'success': False, 'error': 'No CD device selected'}), 400
+    if not player.source.is_drive:
+        return jsonify({'success': False, 'error': 'Only discs in a drive can be captured'}), 400
+    if not player.track_info:
+        # The TOC and the metadata that go with the image
+        player.get_cd_info()
+    if not player.toc or not player.toc.audio_tracks():
+        return jsonify({'success': False, 'error': 'No audio CD in the drive'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    if players.images.get(player.disc_id) and not data.get('force'):
+        return jsonify({'success': True, 'job': None, 'disc_id': player.disc_id,
+                        'image': players.images.get(player.disc_id)})
+    
+    job = players.captures.start(player)
+    return jsonify({'success': True, 'job': job.to_dict()}), 202
+
+@app.route('/api/image/<job_id>', methods=['GET', 'DELETE'])
+def image_job(job_id):
+    """Progress of an image capture, or cancel it (DELETE)"""
+    job = players.captures.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Unknown capture: {job_id}'}), 404
+    if request.method == 'DELETE':
+        job.cancel()
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/streams')
+@app.route('/api/devices/<device_id>/streams')
+def streams(device_id=None):
+    """List the running shared stream pipelines (of every drive unless one is given)"""
+    selected = [get_player(device_id)] if device_id else players.all_players()
+    pipelines = []
+    for player in selected:
+        pipelines.extend(player.broadcasts.stats())
+    return jsonify({'success': True, 'pipelines': pipelines})
+
+@app.route('/api/cache-stats', methods=['GET', 'DELETE'])
+def cache_stats():
+    """Get disc metadata and PCM cache statistics, or clear the caches"""
+    if request.method == 'DELETE':
+        # ?cache=discs or ?cache=pcm clears just one of them
+        which = request.args.get('cache')
+        if which in (None, 'discs'):
+            players.disc_cache.invalidate()
+            # Ask GNUDB and MusicBrainz again about discs they did not know
+            players.cddb.clear_misses()
+            players.musicbrainz.clear()
+        if which in (None, 'pcm'):
+            players.pcm_cache.clear()
+    return jsonify(component_stats())
+
+def component_stats():
+    """Statistics of the shared caches, lookup clients, encoder pool and audio sources"""
+    return {
+        'discs': players.disc_cache.stats(),
+        'gnudb': players.cddb.stats(),
+        'musicbrainz': players.musicbrainz.stats(),
+        'pcm': players.pcm_cache.stats(),
+        'hls': players.hls.stats(),
+        'encoders': players.encoders.stats(),
+        # Read throughput of each drive, image and FLAC directory
+        'sources': source_stats()
+    }
+
+def source_stats():
+    """Read statistics of every player's source and of the archived images drives read instead"""
+    stats = {}
+    for player in players.all_players():
+        if player.source:
+            stats[player.device_id] = player.source.stats()
+        if player.image_source:
+            stats[f'{player.device_id}/image'] = player.image_source.stats()
+    return stats
+
+metrics.REGISTRY.register_collector(component_stats)
+metrics.REGISTRY.register_collector(lambda: {'log': log_system.stats()})
+
+@app.route('/api/logging', methods=['GET', 'POST'])
+def logging_settings():
+    """Get or change log levels at runtime
+
+    POST ``{"level": "DEBUG"}`` sets the level of all WebCD logging, or of
+    one logger with ``"logger": "webcd.cddb"``; ``"sample_every": N`` logs
+    one in N per-chunk stream events (logger webcd.stream.chunks).
+    """
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            if 'level' in data:
+                log_system.set_level(data['level'], data.get('logger', 'webcd'))
+            if 'sample_every' in data:
+                log_system.set_sample_every(data['sample_every'])
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        log.info("Log settings changed", extra={'settings': data})
+    return jsonify(dict(log_system.stats(), success=True, levels=log_system.levels(),
+                        file=log_system.path, format=log_system.format))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Process metrics and the component statistics in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/debug-cd')
-def debug_cd():
-    """Debug endpoint to see raw CD tool outputs"""
+@app.route('/api/devices/<device_id>/debug-cd')
+def debug_cd(device_id=None):
+    """Debug endpoint to see the TOC and, with ?raw=1, raw CD tool outputs"""
+    player = get_player(device_id)
     debug_info = {}
     
+    # Native TOC read (or the image's), cdparanoia -Q as a fallback
+    toc = None
+    if player.source:
+        try:
+            toc = player.source.read_toc()
+        except OSError:
+            toc = player.source.probe_toc()
+        debug_info['source'] = player.source.stats()
+    if toc:
+        debug_info['toc'] = toc.to_dict()
+        debug_info['freedb_id'] = toc.freedb_id()
+        debug_info['musicbrainz_id'] = toc.musicbrainz_id()
+        debug_info['cd_discid_output'] = toc.cd_discid_output()
+    else:
+        debug_info['toc'] = None
+    
+    if request.args.get('raw') != '1' or not (player.source and player.source.is_drive):
+        return jsonify(debug_info)
+    
     # Try cd-discid
     try:
         cmd = ['cd-discid', player.cd_device]
@@ -827,9 +1861,41 @@ def debug_cd():
         
     return jsonify(debug_info)
 
+def parse_range_header(header, total):
+    """Parse a single "bytes=start-end" Range header into an inclusive (start, end)
+
+    Returns None when there is no usable range (serve the whole body) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    if first:
+        start = int(first)
+        end = int(last) if last else total - 1
+    elif last:
+        # Suffix range: the final N bytes
+        start = max(total - int(last), 0)
+        end = total - 1
+    else:
+        return None
+    if start >= total or end < start:
+        raise ValueError('Unsatisfiable range')
+    return start, min(end, total - 1)
+
 @app.route('/api/stream/<int:track>')
-def stream_track(track):
-    """Stream audio data for a specific track"""
+@app.route('/api/devices/<device_id>/stream/<int:track>')
+def stream_track(track, device_id=None):
+    """Stream audio data for a specific track
+
+    ``?start=<seconds>`` starts playback part way into the track and
+    ``?format=``/``?bitrate=`` pick this listener's quality. WAV streams
+    have a known size, so they also honour HTTP Range requests, unless they
+    join a read of the track still going on. The next track is prefetched
+    during the last seconds of this one.
+    """
+    started = time.monotonic()
+    player = get_player(device_id)
     
     # Determine MIME type based on format
     format_to_mime = {
@@ -838,127 +1904,217 @@ def stream_track(track):
         'wav': 'audio/wav'
     }
     
-    selected_format = player.stream_settings.get('format', 'mp3')
+    selected_format, bitrate = stream_quality(player)
     mime_type = format_to_mime.get(selected_format, 'audio/mpeg')
     
-    # Add cache headers for better mobile performance
-    def generate():
-        # For CD audio, we need to specify the track differently
-        # Track selection in ffmpeg for CD audio uses -ss (seek start)
-        # We'll use cdparanoia for more reliable track extraction
+    start = request.args.get('start', 0, type=float)
+    if not math.isfinite(start):
+        return jsonify({'success': False, 'error': 'Invalid start position'}), 400
+    
+    # Seek position in sectors, no further than the end of the track
+    cached_pcm, pcm_size = player.pcm_source(track)
+    start = max(start, 0) * FRAMES_PER_SECOND
+    if pcm_size is not None:
+        start = min(start, pcm_size // BYTES_PER_SECTOR)
+    elif not math.isfinite(start):
+        return jsonify({'success': False, 'error': 'Invalid start position'}), 400
+    # Rounded down to a whole CD sector
+    start_sector = int(start)
+    
+    def generate(body, source):
+        return player.listener_stream(body, track, started, selected_format, source)
+    
+    def wav_body(body_start, body_end, pcm_start):
+        """WAV header plus PCM for the inclusive byte range of the WAV file"""
+        header = wav_header(pcm_size - pcm_start)
+        if body_start < len(header):
+            yield header[body_start:body_end + 1]
+        pcm_from = max(body_start - len(header), 0)
+        pcm_to = body_end - len(header) + 1
+        if pcm_to > pcm_from:
+            yield from player.read_pcm(track, cached_pcm, pcm_size, pcm_start + pcm_from, pcm_to - pcm_from)
+    
+    def prefetched_wav(broadcaster):
+        yield wav_header(pcm_size)
+        yield from broadcaster.subscribe()
+    
+    def file_body(path, body_start, length):
+        with open(path, 'rb') as f:
+            f.seek(body_start)
+            yield from read_chunks(f, player.chunk_size, limit=length)
+    
+    # Ripped tracks are sent as the library's files, with no drive access
+    library_path = None if start_sector else player.library_file(track, selected_format, bitrate)
+    if library_path:
+        total = os.path.getsize(library_path)
+        try:
+            byte_range = parse_range_header(request.headers.get('Range'), total)
+        except ValueError:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{total}'
+            return response
         
-        # First try cdparanoia which handles CD tracks better
+        body_start, body_end = byte_range or (0, total - 1)
+        body = file_body(library_path, body_start, body_end - body_start + 1)
+        response = Response(generate(body, 'library'),
+                            status=206 if byte_range else 200, mimetype=mime_type)
+        response.headers['Content-Length'] = str(body_end - body_start + 1)
+        if byte_range:
+            response.headers['Content-Range'] = f'bytes {body_start}-{body_end}/{total}'
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+    
+    # WAV with a known size is built here directly from PCM, which gives
+    # exact Content-Length and lets browsers seek with Range requests
+    if selected_format == 'wav' and player.direct_wav(track, cached_pcm, pcm_size):
+        pcm_start = start_sector * BYTES_PER_SECTOR
+        total = WAV_HEADER_SIZE + pcm_size - pcm_start
         try:
-            # Build cdparanoia command based on settings
-            cmd = ['cdparanoia', '-d', player.cd_device, '-r']
-            
-            # Apply paranoia mode settings
-            if player.stream_settings['paranoia_mode'] == 'fast':
-                cmd.extend(['-Z', '-Y', '--never-skip=10'])
-            elif player.stream_settings['paranoia_mode'] == 'normal':
-                cmd.extend(['-Y', '--never-skip=20'])
-            # 'paranoid' mode uses default settings (no flags)
-            
-            cmd.extend([str(track), '-'])  # track number and output to stdout
-            
-            # Pipe cdparanoia output to ffmpeg for encoding
-            cdp_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-            
-            # Build FFmpeg command based on selected format
-            ffmpeg_cmd = [
-                'ffmpeg',
-                '-f', 's16le',  # raw PCM input
-                '-ar', '44100',  # sample rate
-                '-ac', '2',  # stereo
-                '-i', '-',  # input from stdin
-            ]
-            
-            if selected_format == 'mp3':
-                ffmpeg_cmd.extend([
-                    '-acodec', 'mp3',
-                    '-ab', player.stream_settings['bitrate'],
-                    '-bufsize', player.stream_settings['buffer_size'],
-                    '-maxrate', player.stream_settings['bitrate'],
-                    '-f', 'mp3'
-                ])
-            elif selected_format == 'flac':
-                ffmpeg_cmd.extend([
-                    '-acodec', 'flac',
-                    '-compression_level', '5',  # 0-12, 5 is default
-                    '-f', 'flac'
-                ])
-            elif selected_format == 'wav':
-                ffmpeg_cmd.extend([
-                    '-acodec', 'pcm_s16le',
-                    '-f', 'wav'
-                ])
-            
-            ffmpeg_cmd.append('-')  # output to stdout
-            
-            ffmpeg_process = subprocess.Popen(
-                ffmpeg_cmd, 
-                stdin=cdp_process.stdout,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL
-            )
-            
-            cdp_process.stdout.close()  # Allow cdparanoia to receive SIGPIPE
-            
-            try:
-                while True:
-                    data = ffmpeg_process.stdout.read(4096)
-                    if not data:
-                        break
-                    yield data
-            finally:
-                cdp_process.terminate()
-                ffmpeg_process.terminate()
-                
-        except Exception as e:
-            # Fallback to direct ffmpeg if cdparanoia fails
-            print(f"cdparanoia failed: {e}, falling back to ffmpeg")
-            
-            cmd = [
-                'ffmpeg',
-                '-f', 'libcdio',
-                '-i', player.cd_device,
-                '-map', f'0:a:{track-1}',  # Map audio track (0-indexed)
-            ]
-            
-            if selected_format == 'mp3':
-                cmd.extend([
-                    '-acodec', 'mp3',
-                    '-ab', player.stream_settings.get('bitrate', '192k'),
-                    '-f', 'mp3'
-                ])
-            elif selected_format == 'flac':
-                cmd.extend([
-                    '-acodec', 'flac',
-                    '-compression_level', '5',
-                    '-f', 'flac'
-                ])
-            elif selected_format == 'wav':
-                cmd.extend([
-                    '-acodec', 'pcm_s16le',
-                    '-f', 'wav'
-                ])
-            
-            cmd.append('-')
-            
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            try:
-                while True:
-                    data = process.stdout.read(4096)
-                    if not data:
-                        break
-                    yield data
-            finally:
-                process.terminate()
+            byte_range = parse_range_header(request.headers.get('Range'), total)
+        except ValueError:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f'bytes */{total}'
+            return response
+        
+        body_start, body_end = byte_range or (0, total - 1)
+        player.schedule_prefetch(track, (pcm_start + max(body_start - WAV_HEADER_SIZE, 0)) / BYTES_PER_SECOND,
+                                 selected_format, bitrate)
+        
+        prefetched = None
+        if not cached_pcm and not pcm_start and (body_start, body_end) == (0, total - 1):
+            # The whole track, possibly already being read by a prefetch or local playback
+            prefetched = player.broadcasts.find(player.pcm_key(track))
+            if prefetched and not prefetched.has_start():
+                prefetched = None
+        if prefetched:
+            # A read still going on may end short: no promised length, and no ranges
+            response = Response(generate(prefetched_wav(prefetched), 'wav'), mimetype=mime_type)
+            response.headers['Accept-Ranges'] = 'none'
+        else:
+            body = wav_body(body_start, body_end, pcm_start)
+            response = Response(generate(body, 'wav'), status=206 if byte_range else 200, mimetype=mime_type)
+            response.headers['Content-Length'] = str(body_end - body_start + 1)
+            if byte_range:
+                response.headers['Content-Range'] = f'bytes {body_start}-{body_end}/{total}'
+            response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
     
-    response = Response(generate(), mimetype=mime_type)
+    # Listeners of the same track and quality share one cdparanoia/ffmpeg pipeline
+    broadcaster = player.shared_stream(track, selected_format, start_sector, cached_pcm, pcm_size, bitrate)
+    player.schedule_prefetch(track, start_sector / FRAMES_PER_SECOND, selected_format, bitrate)
+    
+    response = Response(generate(broadcaster.subscribe(), 'encoded'), mimetype=mime_type)
     # Add headers for better mobile streaming
-    response.headers['Accept-Ranges'] = 'none'  # We don't support range requests yet
+    # Encoded size is unknown, so seeking goes through ?start= instead of ranges
+    response.headers['Accept-Ranges'] = 'none'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+def start_hls(player, track):
+    """Start segmenting a track for HLS if needed; a 404 response if the track is unknown"""
+    cached_pcm, pcm_size = player.pcm_source(track)
+    if not player.disc_id or pcm_size is None:
+        abort(make_response(jsonify({'success': False, 'error': f'Unknown track: {track}'}), 404))
+    player.hls.ensure(player.disc_id, track,
+                      lambda: player.read_pcm(track, cached_pcm, pcm_size, 0, pcm_size))
+
+@app.route('/api/hls/<int:track>/master.m3u8')
+@app.route('/api/devices/<device_id>/hls/<int:track>/master.m3u8')
+def hls_master(track, device_id=None):
+    """HLS master playlist of a track: one AAC rendition per configured bitrate
+
+    The track's PCM is read once and encoded to every rendition together;
+    segments are kept on disk, so later plays and seeks need no drive access.
+    """
+    player = get_player(device_id)
+    start_hls(player, track)
+    response = Response(player.hls.master_playlist(), mimetype='application/vnd.apple.mpegurl')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/hls/<int:track>/<bitrate>/<name>')
+@app.route('/api/devices/<device_id>/hls/<int:track>/<bitrate>/<name>')
+def hls_file(track, bitrate, name, device_id=None):
+    """A rendition's playlist (index.m3u8) or one of its segments"""
+    player = get_player(device_id)
+    # Also restarts segmenting of a track that was evicted meanwhile
+    start_hls(player, track)
+    path = player.hls.wait_for(player.disc_id, track, bitrate, name)
+    if path is None:
+        return jsonify({'success': False, 'error': f'No such HLS file: {bitrate}/{name}'}), 404
+    
+    if name == 'index.m3u8':
+        with open(path) as f:
+            response = Response(f.read(), mimetype='application/vnd.apple.mpegurl')
+        # Playlists grow until the track is fully segmented
+        complete = player.hls.is_complete(player.disc_id, track)
+        response.headers['Cache-Control'] = 'public, max-age=86400' if complete else 'no-cache'
+        return response
+    
+    # Segments never change once written, so caches may keep them
+    response = send_file(path, mimetype='video/mp2t', conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+@app.route('/api/album-stream')
+@app.route('/api/devices/<device_id>/album-stream')
+def stream_album(device_id=None):
+    """Stream the disc as one continuous, gapless stream
+
+    ``?track=<n>`` starts at track n (default: the first audio track) and
+    ``?format=``/``?bitrate=`` pick the quality. The X-Track-Offsets header lists where each track starts, as
+    ``track:seconds`` pairs. The listener counts as one of the first track's.
+    """
+    started = time.monotonic()
+    player = get_player(device_id)
+    if not player.toc:
+        return jsonify({'success': False, 'error': 'No disc TOC available'}), 404
+    
+    audio_tracks = player.toc.audio_tracks()
+    first = request.args.get('track', audio_tracks[0] if audio_tracks else 1, type=int)
+    tracks = [t for t in audio_tracks if t >= first]
+    if not tracks:
+        return jsonify({'success': False, 'error': f'No audio tracks from track {first}'}), 404
+    
+    format_to_mime = {
+        'mp3': 'audio/mpeg',
+        'flac': 'audio/flac',
+        'wav': 'audio/wav'
+    }
+    selected_format, bitrate = stream_quality(player)
+    mime_type = format_to_mime.get(selected_format, 'audio/mpeg')
+    
+    offsets = []
+    pcm_size = 0
+    for track in tracks:
+        offsets.append(f'{track}:{pcm_size / BYTES_PER_SECOND:.3f}')
+        pcm_size += player.pcm_source(track)[1]
+    
+    if selected_format == 'wav' and all(player.direct_wav(t, *player.pcm_source(t)) for t in tracks):
+        # Plain PCM behind one header, so the track boundaries are sample exact
+        def wav_album():
+            yield wav_header(pcm_size)
+            yield from player.album_pcm(tracks)
+        response = Response(player.listener_stream(wav_album(), tracks[0], started, selected_format, 'wav'),
+                            mimetype=mime_type)
+        response.headers['Content-Length'] = str(WAV_HEADER_SIZE + pcm_size)
+    else:
+        key = (player.cd_device, 'album', selected_format, bitrate if selected_format == 'mp3' else None, tracks[0])
+        broadcaster = player.broadcasts.get(
+            key, lambda: player.encode_album(tracks, selected_format, bitrate),
+            fmt=selected_format, align=4 if selected_format == 'wav' else 1,
+            skip_ahead=selected_format == 'mp3'
+        )
+        response = Response(player.listener_stream(broadcaster.subscribe(), tracks[0], started, selected_format,
+                                                   'encoded'), mimetype=mime_type)
+    
+    response.headers['X-Track-Offsets'] = ','.join(offsets)
+    response.headers['Accept-Ranges'] = 'none'
     response.headers['Cache-Control'] = 'no-cache'
     response.headers['X-Content-Type-Options'] = 'nosniff'
     return response
@@ -966,6 +2122,7 @@ def stream_track(track):
 if __name__ == '__main__':
     # Check if running in production (systemd) or development
     import os
+    players.warm_encoders()
     if os.environ.get('FLASK_ENV') == 'development':
         app.run(debug=True, host='0.0.0.0', port=5000)
     else:
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark: GNUDB lookups against a local fake CDDBP server.
+
+The fake server answers like gnudb.gnudb.org, with ``--rtt-ms`` of delay
+per response (the connection's round trip), and holds one disc whose
+entry is far longer than a single recv() would return. The client looks
+the disc up ``--lookups`` times with a new connection per lookup (pool
+size 0, as before) and with pooled connections, then looks up an unknown
+disc repeatedly to show the negative cache:
+
+    python3 benchmarks/cddb_bench.py --lookups 20 --rtt-ms 40
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cddb import CDDBClient  # noqa: E402
+
+DISC_ID = 'a10b1d0c'
+TRACKS = 40
+
+
+def disc_entry():
+    lines = ['# xmcd', '#', f'DISCID={DISC_ID}', 'DTITLE=Fake Artist / Fake Album', 'DYEAR=1999',
+             'DGENRE=Test']
+    for i in range(TRACKS):
+        # Long titles continue on a second line with the same key
+        lines.append(f'TTITLE{i}=Track {i + 1} ' + 'x' * 200)
+        lines.append(f'TTITLE{i}= (continued)')
+    return lines
+
+
+class FakeCDDBHandler(socketserver.StreamRequestHandler):
+    def send(self, *lines):
+        time.sleep(self.server.rtt)
+        self.wfile.write(''.join(line + '\r\n' for line in lines).encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.send('201 fake CDDBP server v1.0 ready at ' + time.ctime())
+        for raw in self.rfile:
+            command = raw.decode().strip().split()
+            if command[:2] == ['cddb', 'hello']:
+                self.send('200 Hello and welcome')
+            elif command[:1] == ['proto']:
+                self.send('201 OK, CDDB protocol level now: 6')
+            elif command[:2] == ['cddb', 'query']:
+                if command[2] == DISC_ID:
+                    self.send('210 Found exact matches, list follows (until terminating `.\')',
+                              f'rock {DISC_ID} Fake Artist / Fake Album', '.')
+                else:
+                    self.send('202 No match found')
+            elif command[:2] == ['cddb', 'read']:
+                self.send(f'210 {command[2]} {command[3]} CD database entry follows (until terminating `.\')',
+                          *disc_entry(), '.')
+            elif command[:1] == ['quit']:
+                self.send('230 Goodbye')
+                return
+            else:
+                self.send('500 Unrecognized command')
+
+
+class FakeCDDBServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, rtt):
+        super().__init__(('127.0.0.1', 0), FakeCDDBHandler)
+        self.rtt = rtt
+        self.connections = 0
+
+
+def timed_lookups(client, disc_id, count):
+    offsets = [150 + i * 15000 for i in range(TRACKS)]
+    times = []
+    result = None
+    for _ in range(count):
+        start = time.monotonic()
+        result = client.lookup(disc_id, offsets, 2400)
+        times.append(time.monotonic() - start)
+    return times, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lookups', type=int, default=20)
+    parser.add_argument('--rtt-ms', type=float, default=40)
+    args = parser.parse_args()
+
+    server = FakeCDDBServer(args.rtt_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    print(f"{args.lookups} lookups, {args.rtt_ms:g} ms per server response\n")
+    print(f"{'client':<22}{'mean':>9}{'first':>9}{'connections':>13}  result")
+    for name, pool_size in (('new connection', 0), ('pooled', 2)):
+        client = CDDBClient('127.0.0.1', port, pool_size=pool_size)
+        connections = server.connections
+        times, result = timed_lookups(client, DISC_ID, args.lookups)
+        album, titles = result
+        complete = len(titles) == TRACKS and all(t.endswith('(continued)') for t in titles.values())
+        print(f"{name:<22}{sum(times) / len(times) * 1000:>6.0f} ms{times[0] * 1000:>6.0f} ms"
+              f"{server.connections - connections:>13}  {album['artist']} / {album['album']}, "
+              f"{len(titles)} titles{'' if complete else ' (TRUNCATED)'}")
+        client.close()
+
+    client = CDDBClient('127.0.0.1', port)
+    times, result = timed_lookups(client, 'deadbeef', args.lookups)
+    stats = client.stats()
+    print(f"{'unknown disc':<22}{sum(times) / len(times) * 1000:>6.0f} ms{times[0] * 1000:>6.0f} ms"
+          f"{stats['connections']:>13}  {result}, {stats['negative_hits']} answered by the negative cache")
+
+
+if __name__ == '__main__':
+    main()
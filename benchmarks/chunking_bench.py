@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: 4096 byte read() loop vs streamio.read_chunks.
+
+Streams a file of raw PCM, once read directly (like the PCM cache) and once
+through a pipe from `cat` (like cdparanoia or ffmpeg output), and reports
+per streamed MB: read() syscalls, chunks handed to the HTTP server (one
+write each) and CPU time of this process.
+
+    python3 benchmarks/chunking_bench.py --size 200
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamio import grow_pipe, read_chunks  # noqa: E402
+
+MB = 1024 * 1024
+
+
+class CountingRaw(io.RawIOBase):
+    """Unbuffered reader over a file descriptor that counts read() syscalls"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        self.reads += 1
+        return os.readv(self.fd, [buffer])
+
+    def fileno(self):
+        return self.fd
+
+
+def small_reads(stream, chunk_size):
+    """The previous stream loop"""
+    while True:
+        data = stream.read(4096)
+        if not data:
+            break
+        yield data
+
+
+def open_source(kind, path):
+    """(buffered stream, counting raw reader, cleanup) for a file or a pipe from cat"""
+    if kind == 'file':
+        raw = CountingRaw(os.open(path, os.O_RDONLY))
+        return io.BufferedReader(raw), raw, lambda: os.close(raw.fd)
+    read_fd, write_fd = os.pipe()
+    cat = subprocess.Popen(['cat', path], stdout=write_fd)
+    os.close(write_fd)
+    raw = CountingRaw(read_fd)
+
+    def cleanup():
+        cat.wait()
+        os.close(read_fd)
+    return io.BufferedReader(raw), raw, cleanup
+
+
+def run(kind, path, reader, chunk_size):
+    stream, raw, cleanup = open_source(kind, path)
+    if kind == 'pipe' and reader is read_chunks:
+        grow_pipe(raw, chunk_size)
+    cpu_start = time.process_time()
+    chunks = 0
+    size = 0
+    for data in reader(stream, chunk_size):
+        chunks += 1
+        size += len(data)
+    cpu = time.process_time() - cpu_start
+    cleanup()
+    mb = size / MB
+    return raw.reads / mb, chunks / mb, cpu / mb * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=100, help='MB to stream')
+    parser.add_argument('--chunk-sizes', default='64k,256k,1024k')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile() as f:
+        block = os.urandom(MB)
+        for _ in range(args.size):
+            f.write(block)
+        f.flush()
+
+        print(f"{'source':<7}{'reader':<22}{'reads/MB':>10}{'chunks/MB':>11}{'CPU ms/MB':>11}")
+        for kind in ('file', 'pipe'):
+            rows = [('read(4096)', small_reads, 4096)]
+            for size in args.chunk_sizes.split(','):
+                nbytes = int(size.rstrip('k')) * 1024
+                rows.append((f'read_chunks({size})', read_chunks, nbytes))
+            for name, reader, chunk_size in rows:
+                reads, chunks, cpu = run(kind, f.name, reader, chunk_size)
+                print(f"{kind:<7}{name:<22}{reads:>10.1f}{chunks:>11.1f}{cpu:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Benchmark: time to first byte of /api/stream with and without warm encoders.
+
+Tracks of a synthetic disc are put in the PCM cache, so no drive is
+involved and the time to first byte is dominated by starting ffmpeg.
+Each track is streamed once through /api/stream, first with an encoder
+pool of size 0 (ffmpeg started per stream, as before) and then with a
+warm pool, pausing ``--pause`` seconds between streams as a listener
+would between tracks. How long ffmpeg takes to start depends mostly on
+the machine (a dynamically linked ffmpeg on a small ARM board takes
+100-300 ms, a static one on a desktop a few ms); ``--startup-ms`` adds a
+delay before every ffmpeg start to model the slower case. Needs ffmpeg
+in PATH:
+
+    python3 benchmarks/encoder_pool_bench.py --streams 10 --startup-ms 200
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline_bench import synthetic_wav  # noqa: E402
+
+
+def first_byte(client, player, track, fmt):
+    """Seconds from the request to the first byte of encoded audio"""
+    requested = time.monotonic()
+    response = client.get(f'/api/devices/{player.device_id}/stream/{track}?format={fmt}',
+                          buffered=False)
+    for data in response.response:
+        if data:
+            break
+    elapsed = time.monotonic() - requested
+    response.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--streams', type=int, default=10, help='streams per format and pool size')
+    parser.add_argument('--seconds', type=int, default=5, help='length of each track')
+    parser.add_argument('--pool-size', type=int, default=1)
+    parser.add_argument('--pause', type=float, default=0.5, help='seconds between streams')
+    parser.add_argument('--formats', default='mp3,flac')
+    parser.add_argument('--startup-ms', type=float, default=0, help='extra delay before ffmpeg starts')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['WEBCD_CACHE_DIR'] = tmp
+    os.environ['WEBCD_DEVICE_MONITOR'] = '0'
+    os.environ['WEBCD_PREFETCH_SECONDS'] = '0'
+    import app
+    from cdtoc import Toc
+    from encoder_pool import EncoderPool
+    from pcm_cache import BYTES_PER_SECTOR, WAV_HEADER_SIZE
+
+    wav_path = os.path.join(tmp, 'signal.wav')
+    synthetic_wav(wav_path, args.seconds)
+    with open(wav_path, 'rb') as f:
+        track_pcm = f.read()[WAV_HEADER_SIZE:]
+    sectors = len(track_pcm) // BYTES_PER_SECTOR
+    track_pcm = track_pcm[:sectors * BYTES_PER_SECTOR]
+    ffmpeg = 'ffmpeg'
+    if args.startup_ms:
+        ffmpeg = os.path.join(tmp, 'slow-ffmpeg')
+        with open(ffmpeg, 'w') as f:
+            f.write(f'#!/bin/sh\nsleep {args.startup_ms / 1000:.3f}\nexec ffmpeg "$@"\n')
+        os.chmod(ffmpeg, 0o755)
+    start = time.monotonic()
+    subprocess.run([ffmpeg, '-version'], stdout=subprocess.DEVNULL, check=True)
+    startup = time.monotonic() - start
+    device = os.path.join(tmp, 'sr9')
+    open(device, 'wb').close()
+
+    app.players.set_default_device(device)
+    player = app.players.get()
+    tracks = list(range(1, args.streams + 1))
+    player.toc = Toc(1, len(tracks), [i * sectors for i in range(len(tracks))], len(tracks) * sectors)
+    client = app.app.test_client()
+
+    print(f"{args.streams} streams per run from the PCM cache, {args.pause:g} s apart; "
+          f"'ffmpeg -version' takes {startup * 1000:.0f} ms\n")
+    print(f"{'format':<7}{'pool':<6}{'TTFB (median)':>15}{'TTFB (max)':>12}"
+          f"{'spawn ms':>10}{'wait ms':>9}{'warm hits':>11}")
+    for fmt in args.formats.split(','):
+        for size in (0, args.pool_size):
+            pool = EncoderPool(size=size, ffmpeg=ffmpeg)
+            app.players.encoders = player.encoders = pool
+            pool.warm(player.encoder_args(fmt))
+            # A new disc ID each run, so no stream joins one of the previous run
+            player.disc_id = f'pool{fmt}{size}'
+            for track in tracks:
+                writer = player.pcm_cache.writer(player.disc_id, track, len(track_pcm))
+                writer.write(track_pcm)
+                writer.commit()
+            time.sleep(args.pause)
+            times = []
+            for track in tracks:
+                times.append(first_byte(client, player, track, fmt))
+                time.sleep(args.pause)
+            stats = pool.stats()
+            pool.close()
+            print(f"{fmt:<7}{size:<6}{statistics.median(times) * 1000:>12.0f} ms"
+                  f"{max(times) * 1000:>9.0f} ms{stats['spawn_ms_avg']:>10.1f}"
+                  f"{stats['wait_ms_avg']:>9.1f}{stats['warm_hits']:>6}/{len(times)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""A simulated CD drive: stand-in cdparanoia, cd-discid and eject executables.
+
+FakeDrive writes a disc (raw PCM, one synthetic test signal or WAV fixture
+per track) into a directory, together with executables that answer like
+the real tools for that disc: ``cdparanoia -Q`` prints its TOC,
+``cdparanoia -d <device> <span> -`` writes the span's PCM at ``speed``
+times real time after ``seek_ms`` of spin-up, ``cd-discid`` prints the
+disc ID line and ``eject`` succeeds. Put ``bin_dir`` first on PATH and
+use ``device`` as the drive, e.g. for a server to benchmark by hand:
+
+    python3 benchmarks/fake_drive.py /tmp/fakedrive --tracks 8 --seconds 30
+    PATH=/tmp/fakedrive/bin:$PATH WEBCD_DEVICE=/tmp/fakedrive/sr0 python3 server.py
+"""
+import argparse
+import json
+import os
+import re
+import stat
+import sys
+import time
+import wave
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+from cdtoc import Toc  # noqa: E402
+from pcm_cache import BYTES_PER_SECTOR, BYTES_PER_SECOND, WAV_HEADER_SIZE  # noqa: E402
+from pipeline_bench import synthetic_wav  # noqa: E402
+
+TOOLS = ('cdparanoia', 'cd-discid', 'eject')
+# cdparanoia writes what it read in one go, a few dozen sectors
+WRITE_SIZE = 25 * BYTES_PER_SECTOR
+
+
+class FakeDrive:
+    """A disc image plus the tools to read it, in ``directory``"""
+
+    def __init__(self, directory, tracks=8, seconds=30, wavs=(), speed=8.0, seek_ms=300):
+        self.directory = os.path.abspath(directory)
+        self.bin_dir = os.path.join(self.directory, 'bin')
+        self.device = os.path.join(self.directory, 'sr0')
+        self.config_path = os.path.join(self.directory, 'drive.json')
+        os.makedirs(self.bin_dir, exist_ok=True)
+
+        offsets = []
+        with open(self.device, 'wb') as disc:
+            for i in range(max(tracks, len(wavs))):
+                offsets.append(disc.tell() // BYTES_PER_SECTOR)
+                disc.write(self._track_pcm(wavs[i] if i < len(wavs) else None, seconds, i))
+            leadout = disc.tell() // BYTES_PER_SECTOR
+        self.toc = Toc(1, len(offsets), offsets, leadout)
+        with open(self.config_path, 'w') as f:
+            json.dump({'device': self.device, 'offsets': offsets, 'leadout': leadout,
+                       'speed': speed, 'seek_ms': seek_ms}, f)
+        for tool in TOOLS:
+            path = os.path.join(self.bin_dir, tool)
+            with open(path, 'w') as f:
+                f.write(f'#!{sys.executable}\n'
+                        f'import sys\n'
+                        f'sys.path.insert(0, {BENCHMARKS!r})\n'
+                        f'import fake_drive\n'
+                        f'sys.exit(fake_drive.run_tool({tool!r}, {self.config_path!r}, sys.argv[1:]))\n')
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def _track_pcm(self, wav_path, seconds, index):
+        """Whole sectors of a track's PCM; synthetic tracks differ in their first byte"""
+        if wav_path:
+            with wave.open(wav_path, 'rb') as w:
+                if (w.getnchannels(), w.getsampwidth(), w.getframerate()) != (2, 2, 44100):
+                    raise ValueError(f'{wav_path}: not 16 bit stereo 44.1 kHz (CD audio)')
+                pcm = w.readframes(w.getnframes())
+        else:
+            path = os.path.join(self.directory, 'signal.wav')
+            if not os.path.exists(path) or os.path.getsize(path) != WAV_HEADER_SIZE + seconds * BYTES_PER_SECOND:
+                synthetic_wav(path, seconds)
+            with open(path, 'rb') as f:
+                pcm = bytes([index % 256]) + f.read()[WAV_HEADER_SIZE + 1:]
+        return pcm[:len(pcm) // BYTES_PER_SECTOR * BYTES_PER_SECTOR]
+
+    def environ(self, base=None):
+        """Environment with the fake tools first on PATH and the fake drive as WEBCD_DEVICE"""
+        env = dict(os.environ if base is None else base)
+        env['PATH'] = self.bin_dir + os.pathsep + env.get('PATH', '')
+        env['WEBCD_DEVICE'] = self.device
+        return env
+
+
+def toc_listing(toc):
+    """The table `cdparanoia -Q` prints to stderr"""
+    lines = ['cdparanoia III release 10.2 (September 11, 2008)', '',
+             'Table of contents (audio tracks only):',
+             'track        length               begin        copy pre ch',
+             '===========================================================']
+    for number in range(toc.first_track, toc.last_track + 1):
+        start, length = toc.track_sectors(number)
+        lines.append(f'{number:3d}.  {length:7d} [{msf(length)}]  {start:7d} [{msf(start)}]    no   no  2')
+    lines.append(f'TOTAL  {toc.leadout:7d} [{msf(toc.leadout)}]    (audio only)')
+    return '\n'.join(lines) + '\n'
+
+
+def msf(sectors):
+    seconds, frames = divmod(sectors, 75)
+    return f'{seconds // 60:02d}:{seconds % 60:02d}.{frames:02d}'
+
+
+def parse_span(span, toc):
+    """(first sector, sector count) of a cdparanoia span: "3", "3-5" or "3[0:01:02.10]-3" """
+    match = re.fullmatch(r'(\d+)(?:\[(\d+):(\d+):(\d+)\.(\d+)\])?(?:-(\d+))?', span)
+    if not match:
+        raise ValueError(f'Bad span: {span}')
+    first = int(match.group(1))
+    last = int(match.group(6) or first)
+    start = toc.track_sectors(first)[0]
+    if match.group(2) is not None:
+        hours, minutes, seconds, frames = (int(match.group(i)) for i in range(2, 6))
+        start += ((hours * 60 + minutes) * 60 + seconds) * 75 + frames
+    last_start, last_length = toc.track_sectors(last)
+    return start, last_start + last_length - start
+
+
+def run_tool(tool, config_path, argv):
+    """Entry point of the fake executables; returns the exit status"""
+    with open(config_path) as f:
+        config = json.load(f)
+    toc = Toc(1, len(config['offsets']), config['offsets'], config['leadout'])
+    device = argv[argv.index('-d') + 1] if '-d' in argv else (argv[0] if argv else config['device'])
+    if os.path.abspath(device) != config['device']:
+        sys.stderr.write(f'Unable to open disc {device}\n')
+        return 1
+    if tool == 'cd-discid':
+        print(toc.cd_discid_output())
+        return 0
+    if tool == 'eject':
+        return 0
+    if '-Q' in argv:
+        sys.stderr.write(toc_listing(toc))
+        return 0
+
+    spans = [arg for arg in argv if re.match(r'\d', arg)]
+    start, length = parse_span(spans[-1] if spans else '1', toc)
+    # A real drive spins up and seeks before the first sector arrives
+    time.sleep(config['seek_ms'] / 1000)
+    seconds_per_byte = 1 / (BYTES_PER_SECOND * config['speed'])
+    began = time.monotonic()
+    sent = 0
+    out = sys.stdout.buffer
+    try:
+        with open(config['device'], 'rb') as disc:
+            disc.seek(start * BYTES_PER_SECTOR)
+            remaining = length * BYTES_PER_SECTOR
+            while remaining > 0:
+                data = disc.read(min(WRITE_SIZE, remaining))
+                if not data:
+                    break
+                out.write(data)
+                out.flush()
+                sent += len(data)
+                remaining -= len(data)
+                ahead = began + sent * seconds_per_byte - time.monotonic()
+                if ahead > 0:
+                    time.sleep(ahead)
+    except BrokenPipeError:
+        # The reader went away, as when WebCD stops a stream
+        return 0
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('directory')
+    parser.add_argument('--tracks', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=30, help='length of each synthetic track')
+    parser.add_argument('--wav', action='append', default=[], help='WAV fixture for the next track')
+    parser.add_argument('--speed', type=float, default=8, help='read speed (x real time)')
+    parser.add_argument('--seek-ms', type=float, default=300, help='spin-up/seek time of each read')
+    args = parser.parse_args()
+    drive = FakeDrive(args.directory, args.tracks, args.seconds, args.wav, args.speed, args.seek_ms)
+    print(f"Disc {drive.toc.freedb_id()}: {drive.toc.track_count} tracks in {drive.device}")
+    print(f"PATH={drive.bin_dir}:$PATH WEBCD_DEVICE={drive.device} python3 server.py")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Benchmark: the gap between tracks, with and without prefetching.
+
+A synthetic disc (a raw PCM file with a fake TOC) is read through a fake
+CDROMREADAUDIO ioctl that behaves like a slow drive: reads run at
+``--speed`` times real time, and a read that does not directly continue
+the previous one (a seek, or a drive left idle) first costs ``--seek-ms``.
+A simulated listener plays the tracks one after another through
+/api/stream, asking for track n+1 when track n has finished playing, and
+the time to the first audio of track n+1 is the gap it hears. Then the
+whole disc is fetched from /api/album-stream and compared with the disc:
+
+    python3 benchmarks/gap_bench.py --tracks 3 --seconds 8 --window 3
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline_bench import fake_read_audio, synthetic_wav  # noqa: E402
+
+
+class SlowDrive:
+    """CDROMREADAUDIO against a raw PCM file, with a drive's seek time and read speed"""
+
+    # A drive left alone this long has to spin up and find its place again
+    IDLE_TIME = 0.5
+
+    def __init__(self, speed, seek_time):
+        self.speed = speed
+        self.seek_time = seek_time
+        self.next_lba = None
+        self.last_read = 0
+        self.lock = threading.Lock()
+
+    def ioctl(self, fd, request, arg):
+        from cdaudio import unpack_read_audio
+        lba, nframes, _ = unpack_read_audio(arg)
+        # One head, so concurrent readers queue up behind each other
+        with self.lock:
+            delay = nframes / 75 / self.speed
+            if lba != self.next_lba or time.monotonic() - self.last_read > self.IDLE_TIME:
+                delay += self.seek_time
+            self.next_lba = lba + nframes
+            time.sleep(delay)
+            self.last_read = time.monotonic()
+            return fake_read_audio(fd, request, arg)
+
+
+def play_tracks(client, player, tracks, duration, header_size):
+    """Play ``tracks`` back to back; the time to the first audio of each later track is its gap"""
+    gaps = []
+    for track in tracks:
+        requested = time.monotonic()
+        response = client.get(f'/api/devices/{player.device_id}/stream/{track}', buffered=False)
+        received = 0
+        first_byte = None
+        for data in response.response:
+            received += len(data)
+            if first_byte is None and received > header_size:
+                first_byte = time.monotonic()
+        response.close()
+        if track != tracks[0]:
+            gaps.append(first_byte - requested)
+        # The listener asks for the next track once this one has played
+        time.sleep(max(first_byte + duration - time.monotonic(), 0))
+    return gaps
+
+
+def decoded_samples(data, fmt):
+    import av
+    with av.open(io.BytesIO(data), format=fmt) as container:
+        return sum(frame.samples for frame in container.decode(audio=0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tracks', type=int, default=3)
+    parser.add_argument('--seconds', type=int, default=8, help='length of each track')
+    parser.add_argument('--window', type=float, default=3, help='prefetch window in seconds')
+    parser.add_argument('--speed', type=float, default=4, help='drive read speed (x real time)')
+    parser.add_argument('--seek-ms', type=float, default=800, help='seek / spin-up time')
+    parser.add_argument('--formats', default='wav,mp3')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['WEBCD_CACHE_DIR'] = tmp
+    os.environ['WEBCD_DEVICE_MONITOR'] = '0'
+    # Read the fake drive with CDROMREADAUDIO; encode with PyAV if installed
+    os.environ['WEBCD_INPROCESS_PIPELINE'] = '1'
+    import app
+    from cdtoc import Toc
+    from pcm_cache import BYTES_PER_SECTOR, WAV_HEADER_SIZE
+    from sources import DriveSource
+
+    drive = SlowDrive(args.speed, args.seek_ms / 1000)
+
+    # The disc: one test signal per track, each a whole number of sectors
+    wav_path = os.path.join(tmp, 'signal.wav')
+    synthetic_wav(wav_path, args.seconds)
+    with open(wav_path, 'rb') as f:
+        track_pcm = f.read()[WAV_HEADER_SIZE:]
+    sectors = len(track_pcm) // BYTES_PER_SECTOR
+    disc = b''.join(bytes([t]) + track_pcm[1:sectors * BYTES_PER_SECTOR] for t in range(args.tracks))
+    device = os.path.join(tmp, 'sr9')
+    with open(device, 'wb') as f:
+        f.write(disc)
+
+    app.players.set_default_device(device)
+    player = app.players.get()
+    player.source = DriveSource(device, player.device_id, inprocess=True, ioctl=drive.ioctl)
+    # Reads go by the source's TOC
+    player.toc = player.source.toc = Toc(1, args.tracks, [i * sectors for i in range(args.tracks)],
+                                         args.tracks * sectors)
+    client = app.app.test_client()
+    tracks = list(range(1, args.tracks + 1))
+
+    print(f"Disc: {args.tracks} x {args.seconds} s, drive at {args.speed:g}x with "
+          f"{args.seek_ms:g} ms seeks, prefetch window {args.window:g} s\n")
+    print(f"{'format':<7}{'prefetch':<10}{'gap (mean)':>12}{'gap (max)':>12}")
+    for fmt in args.formats.split(','):
+        client.post('/api/settings', json={'format': fmt})
+        for window in (0, args.window):
+            app.PREFETCH_SECONDS = window
+            # A new disc ID each run, so nothing comes from the PCM cache
+            player.disc_id = f'gap{fmt}{window:g}'
+            gaps = play_tracks(client, player, tracks, sectors / 75,
+                               WAV_HEADER_SIZE if fmt == 'wav' else 0)
+            print(f"{fmt:<7}{'on' if window else 'off':<10}"
+                  f"{sum(gaps) / len(gaps) * 1000:>9.0f} ms{max(gaps) * 1000:>9.0f} ms")
+
+    print(f"\n{'format':<7}{'album stream':<30}")
+    for fmt in args.formats.split(','):
+        client.post('/api/settings', json={'format': fmt})
+        player.disc_id = f'album{fmt}'
+        data = client.get('/api/album-stream').data
+        if fmt == 'wav':
+            result = 'identical to the disc PCM' if data[WAV_HEADER_SIZE:] == disc else 'PCM DIFFERS'
+        else:
+            try:
+                extra = decoded_samples(data, fmt) - len(disc) // 4
+                result = f'{extra:+d} samples against the disc (encoder delay and padding)'
+            except ImportError:
+                result = f'{len(data)} bytes (install PyAV to check the length)'
+        print(f"{fmt:<7}{result}")
+
+
+if __name__ == '__main__':
+    main()
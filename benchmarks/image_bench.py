@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Benchmark: concurrent streams served from archived disc images.
+
+Builds ``--discs`` images the way /api/image captures them (disc.bin,
+disc.cue and disc.json per disc) and starts ``--streams`` readers at once,
+each at a random second of a random track of a random disc, reading
+``--seconds`` of audio as fast as it can through sources.ImageSource.
+Reports time to first audio and the total throughput, also as a number of
+real time streams. With ``--drive`` the same reads go to one simulated
+drive (benchmarks/fake_drive.py) for comparison:
+
+    python3 benchmarks/image_bench.py --discs 200 --streams 100 --drive
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+sys.path.insert(0, BENCHMARKS)
+
+from cdtoc import Toc  # noqa: E402
+from disc_images import IMAGE_NAME, SHEET_NAME, INFO_NAME, cue_sheet  # noqa: E402
+from pcm_cache import BYTES_PER_SECTOR, BYTES_PER_SECOND  # noqa: E402
+from sources import DriveSource, ImageSource  # noqa: E402
+
+
+def build_archive(directory, discs, tracks, seconds):
+    """Directories of ``discs`` images of ``tracks`` tracks of ``seconds`` each"""
+    sectors = seconds * 75
+    # Different bytes per disc, without generating every disc's audio
+    block = os.urandom(sectors * BYTES_PER_SECTOR)
+    paths = []
+    for n in range(discs):
+        path = os.path.join(directory, f'disc{n:04d}')
+        os.makedirs(path, exist_ok=True)
+        toc = Toc(1, tracks, [150 + i * sectors for i in range(tracks)], 150 + tracks * sectors)
+        with open(os.path.join(path, IMAGE_NAME), 'wb') as f:
+            for i in range(tracks):
+                f.write(bytes([n % 256, i % 256]) + block[2:])
+        with open(os.path.join(path, INFO_NAME), 'w') as f:
+            json.dump({'toc': toc.to_dict()}, f)
+        with open(os.path.join(path, SHEET_NAME), 'w') as f:
+            f.write(cue_sheet(toc, toc.audio_tracks(), 150))
+        paths.append(path)
+    return paths
+
+
+def run_streams(sources, streams, seconds, chunk_size, seed=1):
+    """Times to first audio, total bytes and wall time of ``streams`` concurrent readers"""
+    ttfb = []
+    total = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(streams + 1)
+
+    def stream(n):
+        rng = random.Random(seed + n)
+        source = rng.choice(sources)
+        track = rng.choice(source.toc.audio_tracks())
+        length = source.toc.track_sectors(track)[1]
+        start_sector = rng.randrange(0, max(length - seconds * 75, 1), 75)
+        barrier.wait()
+        began = time.monotonic()
+        first = None
+        sent = 0
+        chunks = source.read_track(track, start_sector, chunk_size=chunk_size)
+        try:
+            for data in chunks:
+                if first is None:
+                    first = time.monotonic() - began
+                sent += len(data)
+                if sent >= seconds * BYTES_PER_SECOND:
+                    break
+        finally:
+            chunks.close()
+        with lock:
+            ttfb.append(first)
+            total[0] += sent
+
+    threads = [threading.Thread(target=stream, args=(n,)) for n in range(streams)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    began = time.monotonic()
+    for thread in threads:
+        thread.join()
+    return ttfb, total[0], time.monotonic() - began
+
+
+def report(name, ttfb, total, elapsed):
+    ttfb.sort()
+    p95 = ttfb[min(len(ttfb) - 1, int(len(ttfb) * 0.95))]
+    rate = total / elapsed
+    print(f"{name:<8}{statistics.median(ttfb) * 1000:>9.1f} ms{p95 * 1000:>9.1f} ms{ttfb[-1] * 1000:>9.1f} ms"
+          f"{rate / 1e6:>10.1f} MB/s{rate / BYTES_PER_SECOND:>10.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--discs', type=int, default=50)
+    parser.add_argument('--tracks', type=int, default=4)
+    parser.add_argument('--track-seconds', type=int, default=20)
+    parser.add_argument('--streams', type=int, default=50)
+    parser.add_argument('--seconds', type=int, default=5, help='audio read per stream')
+    parser.add_argument('--chunk-size', type=int, default=256 * 1024)
+    parser.add_argument('--drive', action='store_true', help='also read from a simulated drive')
+    parser.add_argument('--speed', type=float, default=8, help='simulated drive speed (x real time)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='webcd-image-bench-') as tmp:
+        paths = build_archive(os.path.join(tmp, 'images'), args.discs, args.tracks, args.track_seconds)
+        images = [ImageSource(path) for path in paths]
+        print(f"{args.streams} streams over {args.discs} images, {args.seconds} s of audio each\n")
+        print(f"{'source':<8}{'median':>12}{'p95':>12}{'max':>12}{'throughput':>15}{'streams':>11}")
+        report('image', *run_streams(images, args.streams, args.seconds, args.chunk_size))
+
+        if args.drive:
+            from fake_drive import FakeDrive
+            drive = FakeDrive(os.path.join(tmp, 'drive'), args.tracks, args.track_seconds, speed=args.speed)
+            os.environ['PATH'] = drive.bin_dir + os.pathsep + os.environ.get('PATH', '')
+            source = DriveSource(drive.device)
+            source.probe_toc()
+            report('drive', *run_streams([source], args.streams, args.seconds, args.chunk_size))
+
+
+if __name__ == '__main__':
+    main()
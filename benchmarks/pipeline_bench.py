@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Benchmark: cdparanoia|ffmpeg subprocess pipeline vs the in-process pipeline.
+
+A WAV file stands in for the drive. The subprocess pipeline streams its PCM
+through `cat` (in place of cdparanoia) and a tee thread into ffmpeg, and
+reads ffmpeg's output the way /api/stream does. The in-process pipeline
+reads it with cdaudio.SectorReader through a fake CDROMREADAUDIO ioctl
+and encodes with PyAV. Both report time to first byte and CPU time (this
+process plus its children) per stream:
+
+    python3 benchmarks/pipeline_bench.py --wav some.wav --streams 5
+"""
+import argparse
+import ctypes
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import encoder  # noqa: E402
+from cdaudio import SectorReader, unpack_read_audio  # noqa: E402
+from pcm_cache import BYTES_PER_SECTOR, tee_pcm  # noqa: E402
+
+ENCODER_ARGS = {
+    'mp3': ['-acodec', 'mp3', '-ab', '192k', '-bufsize', '256k', '-maxrate', '192k', '-f', 'mp3'],
+    'flac': ['-acodec', 'flac', '-compression_level', '5', '-f', 'flac'],
+    'wav': ['-acodec', 'pcm_s16le', '-f', 'wav'],
+}
+
+
+def fake_read_audio(fd, request, arg):
+    """CDROMREADAUDIO against a raw PCM file: copy the sectors to the caller's buffer"""
+    lba, nframes, address = unpack_read_audio(arg)
+    data = os.pread(fd, nframes * BYTES_PER_SECTOR, lba * BYTES_PER_SECTOR)
+    ctypes.memmove(address, data, len(data))
+    return arg
+
+
+def cpu_time():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_usage.ru_utime + self_usage.ru_stime
+            + children.ru_utime + children.ru_stime)
+
+
+def subprocess_stream(pcm_path, fmt, ffmpeg):
+    cat = subprocess.Popen(['cat', pcm_path], stdout=subprocess.PIPE)
+    ffmpeg_process = subprocess.Popen(
+        [ffmpeg, '-loglevel', 'quiet', '-f', 's16le', '-ar', '44100', '-ac', '2', '-i', '-']
+        + ENCODER_ARGS[fmt] + ['-'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    threading.Thread(target=tee_pcm, args=(cat.stdout, ffmpeg_process.stdin), daemon=True).start()
+    try:
+        while True:
+            data = ffmpeg_process.stdout.read(4096)
+            if not data:
+                break
+            yield data
+    finally:
+        cat.wait()
+        ffmpeg_process.wait()
+
+
+def inprocess_stream(pcm_path, fmt, sectors):
+    reader = SectorReader(pcm_path, 0, sectors, ioctl=fake_read_audio)
+    yield from encoder.encode_pcm(reader, fmt, '192k')
+
+
+def measure(make_stream):
+    cpu_start = cpu_time()
+    start = time.monotonic()
+    first_byte = None
+    size = 0
+    for data in make_stream():
+        if first_byte is None:
+            first_byte = time.monotonic() - start
+        size += len(data)
+    return first_byte, time.monotonic() - start, cpu_time() - cpu_start, size
+
+
+def synthetic_wav(path, seconds):
+    """A stereo 44.1 kHz test signal (a slowly changing sawtooth)"""
+    frame = bytearray()
+    for i in range(44100):
+        sample = ((i * 7) % 2000 - 1000) * 8
+        frame += sample.to_bytes(2, 'little', signed=True) * 2
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        for _ in range(seconds):
+            w.writeframes(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--wav', help='16 bit stereo 44.1 kHz WAV file (default: 3 minute test signal)')
+    parser.add_argument('--formats', default='mp3,flac,wav')
+    parser.add_argument('--streams', type=int, default=3, help='runs per pipeline and format')
+    parser.add_argument('--ffmpeg', default='ffmpeg')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = args.wav
+        if not wav_path:
+            wav_path = os.path.join(tmp, 'test.wav')
+            synthetic_wav(wav_path, 180)
+        with wave.open(wav_path, 'rb') as w:
+            if (w.getnchannels(), w.getsampwidth(), w.getframerate()) != (2, 2, 44100):
+                sys.exit('The WAV file must be 16 bit stereo at 44.1 kHz (CD audio)')
+            pcm = w.readframes(w.getnframes())
+        # Whole sectors, like a track on the disc
+        sectors = len(pcm) // BYTES_PER_SECTOR
+        pcm_path = os.path.join(tmp, 'drive.pcm')
+        with open(pcm_path, 'wb') as f:
+            f.write(pcm[:sectors * BYTES_PER_SECTOR])
+        print(f"Source: {sectors / 75:.0f} s of audio, {args.streams} streams per row\n")
+
+        pipelines = [('subprocess', lambda fmt: lambda: subprocess_stream(pcm_path, fmt, args.ffmpeg))]
+        if encoder.av is not None:
+            pipelines.append(('in-process', lambda fmt: lambda: inprocess_stream(pcm_path, fmt, sectors)))
+        else:
+            print("PyAV is not installed, only measuring the subprocess pipeline\n")
+
+        print(f"{'format':<7}{'pipeline':<12}{'first byte':>12}{'wall':>10}{'CPU/stream':>12}{'output':>12}")
+        for fmt in args.formats.split(','):
+            for name, factory in pipelines:
+                runs = [measure(factory(fmt)) for _ in range(args.streams)]
+                first_byte = sorted(r[0] for r in runs)[len(runs) // 2]
+                wall = sum(r[1] for r in runs) / len(runs)
+                cpu = sum(r[2] for r in runs) / len(runs)
+                size = runs[-1][3]
+                print(f"{fmt:<7}{name:<12}{first_byte * 1000:>9.1f} ms{wall:>8.2f} s"
+                      f"{cpu:>10.2f} s{size / 1024 / 1024:>8.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
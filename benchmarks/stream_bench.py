@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""Benchmark suite: a real WebCD server against a simulated drive, with comparable reports.
+
+Starts ``server.py`` (gunicorn + gevent when installed) on a free port with
+the fake cdparanoia/cd-discid/eject tools of fake_drive.py first on PATH,
+so nothing touches real hardware or the network (GNUDB and MusicBrainz
+point at closed local ports). It then measures:
+
+- /api/cd-info and /api/devices: latency and requests per second at each
+  ``--levels`` concurrency
+- /api/stream for each of ``--formats`` at each ``--stream-levels``
+  concurrency, every stream on its own track with the PCM cache cleared
+  first: time to the first byte of audio, throughput per stream, and CPU
+  seconds of the server and its cdparanoia/ffmpeg children per stream
+  (the fake cdparanoia is a Python process, so this overstates CPU a
+  little compared with a real drive)
+- the concurrency limit of each: the highest level tested with no errors
+  and a p95 latency (time to first byte for streams) under ``--slo-ms``
+
+``--json`` saves the results with the commit they were measured at, and
+``--compare`` prints the change against an earlier report, exiting with
+status 1 if anything got worse by more than ``--tolerance`` percent:
+
+    python3 benchmarks/stream_bench.py --json before.json
+    git checkout my-branch
+    python3 benchmarks/stream_bench.py --compare before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+from fake_drive import FakeDrive  # noqa: E402
+from pcm_cache import WAV_HEADER_SIZE  # noqa: E402
+from stream_load import percentile  # noqa: E402
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+# Whether a larger value of a metric is an improvement
+HIGHER_IS_BETTER = ('per_second', 'limit', 'mb_s')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_cpu(pid):
+    """CPU seconds of a process and its reaped children, from /proc/<pid>/stat"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rpartition(')')[2].split()
+    except OSError:
+        return 0.0, None
+    # Fields 14-17 (utime, stime, cutime, cstime), counted after the command name
+    return sum(int(x) for x in fields[11:15]) / CLOCK_TICKS, int(fields[1])
+
+
+def tree_cpu(root):
+    """CPU seconds used so far by ``root`` and all its descendants, alive or reaped"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            cpu, ppid = process_cpu(entry)
+            if ppid is not None:
+                parents[int(entry)] = (ppid, cpu)
+    total = 0.0
+    for pid, (ppid, cpu) in parents.items():
+        ancestor = pid
+        while ancestor in parents and ancestor != root:
+            ancestor = parents[ancestor][0]
+        if ancestor == root:
+            total += cpu
+    return total
+
+
+class Server:
+    """server.py in a subprocess, serving the fake drive"""
+
+    def __init__(self, drive, directory, extra_env=()):
+        self.port = free_port()
+        env = drive.environ()
+        env.update({
+            'WEBCD_HOST': '127.0.0.1',
+            'WEBCD_PORT': str(self.port),
+            'WEBCD_CACHE_DIR': os.path.join(directory, 'cache'),
+            'WEBCD_DEVICE_MONITOR': '0',
+            'WEBCD_OUTPUT': 'null',
+            'WEBCD_LOG_LEVEL': 'WARNING',
+            # Lookups fail at once instead of going out to the internet
+            'WEBCD_GNUDB_HOST': '127.0.0.1',
+            'WEBCD_GNUDB_PORT': str(free_port()),
+            'WEBCD_MUSICBRAINZ_HOST': f'127.0.0.1:{free_port()}',
+        })
+        env.update(extra_env)
+        self.log = open(os.path.join(directory, 'server.log'), 'wb')
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'server.py')], env=env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {self.process.returncode}, see {self.log.name}')
+            try:
+                status, _ = self.request('GET', '/api/status')
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('Server did not start')
+
+    def request(self, method, path, timeout=30):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=timeout)
+        try:
+            connection.request(method, path)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+def run_concurrently(count, func):
+    """Run ``func(i)`` for i in range(count) on as many threads at once; their results"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = func(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def bench_endpoint(server, path, concurrency, requests_each):
+    """Latency and rate of ``concurrency`` clients each making ``requests_each`` requests"""
+    def client(_):
+        latencies, errors = [], 0
+        for _ in range(requests_each):
+            start = time.monotonic()
+            try:
+                status, _ = server.request('GET', path)
+            except OSError:
+                status = None
+            if status == 200:
+                latencies.append(time.monotonic() - start)
+            else:
+                errors += 1
+        return latencies, errors
+
+    start = time.monotonic()
+    results = run_concurrently(concurrency, client)
+    elapsed = time.monotonic() - start
+    latencies = [latency for result in results for latency in result[0]]
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'errors': sum(result[1] for result in results),
+    }
+
+
+def bench_streams(server, fmt, concurrency, tracks, track_seconds):
+    """``concurrency`` whole-track streams at once, each on its own track while there are enough"""
+    server.request('DELETE', '/api/cache-stats?cache=pcm')
+    # WAV headers go out before any audio has been read
+    header_size = WAV_HEADER_SIZE if fmt == 'wav' else 0
+
+    def listener(i):
+        track = i % tracks + 1
+        start = time.monotonic()
+        connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=60)
+        try:
+            connection.request('GET', f'/api/stream/{track}?format={fmt}')
+            response = connection.getresponse()
+            if response.status != 200:
+                return None
+            first_byte = None
+            size = 0
+            while True:
+                data = response.read1(65536)
+                if not data:
+                    break
+                size += len(data)
+                if first_byte is None and size > header_size:
+                    first_byte = time.monotonic()
+        except OSError:
+            return None
+        finally:
+            connection.close()
+        if first_byte is None:
+            return None
+        return first_byte - start, size, time.monotonic() - first_byte
+
+    cpu_start = tree_cpu(server.process.pid)
+    results = run_concurrently(concurrency, listener)
+    # Let the last pipelines exit and be counted
+    time.sleep(0.5)
+    cpu = tree_cpu(server.process.pid) - cpu_start
+    done = [result for result in results if result]
+    ttfb = [result[0] for result in done]
+    throughput = [result[1] / result[2] / 1e6 for result in done if result[2] > 0]
+    return {
+        'ttfb_p50_ms': round(percentile(ttfb, 50) * 1000, 1) if ttfb else None,
+        'ttfb_p95_ms': round(percentile(ttfb, 95) * 1000, 1) if ttfb else None,
+        'stream_mb_s': round(sum(throughput) / len(throughput), 2) if throughput else None,
+        'cpu_s_per_stream': round(cpu / concurrency, 3),
+        # CPU time per second of audio, as a percentage of one core
+        'cpu_pct_of_realtime': round(cpu / (concurrency * track_seconds) * 100, 2),
+        'errors': concurrency - len(done),
+    }
+
+
+def limit(rows, latency_key, slo_ms):
+    """Highest concurrency level with no errors and p95 latency within the SLO"""
+    best = 0
+    for level, row in sorted(rows.items()):
+        if row['errors'] or row[latency_key] is None or row[latency_key] > slo_ms:
+            break
+        best = level
+    return best
+
+
+def flatten(results):
+    """{'streams.mp3.4.ttfb_p50_ms': value, ...}"""
+    flat = {}
+    for section, groups in results.items():
+        for name, rows in groups.items():
+            for level, row in rows.items():
+                if isinstance(row, dict):
+                    for key, value in row.items():
+                        flat[f'{section}.{name}.{level}.{key}'] = value
+                else:
+                    flat[f'{section}.{name}.{level}'] = row
+    return flat
+
+
+def commit():
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return head + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, tolerance):
+    """Print the change of every metric; the number that got worse by more than ``tolerance`` %"""
+    before, after = flatten(old['results']), flatten(new['results'])
+    print(f"\nCompared with {old.get('commit')} ({old.get('date')}):")
+    regressions = 0
+    for key in sorted(set(before) & set(after)):
+        a, b = before[key], after[key]
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or a == b:
+            continue
+        if key.endswith('.errors'):
+            worse = b > a
+            change = f'{a} -> {b}'
+        else:
+            delta = (b - a) / a * 100 if a else float('inf')
+            worse = -delta > tolerance if key.endswith(HIGHER_IS_BETTER) else delta > tolerance
+            change = f'{a} -> {b} ({delta:+.0f}%)'
+        regressions += worse
+        print(f"  {'WORSE' if worse else '     '} {key:<48} {change}")
+    print(f"{regressions} metric(s) worse by more than {tolerance:g}%")
+    return regressions
+
+
+def print_table(title, rows, columns):
+    print(f"\n{title}")
+    print(f"  {'level':>5}" + ''.join(f'{column:>22}' for column in columns))
+    for level, row in rows.items():
+        print(f"  {level:>5}" + ''.join(f'{"-" if row[c] is None else row[c]:>22}' for c in columns))
+
+
+def levels(value):
+    return [int(x) for x in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--formats', default='mp3,flac,wav')
+    parser.add_argument('--levels', type=levels, default=[1, 8, 32], help='client counts for the API endpoints')
+    parser.add_argument('--requests', type=int, default=10, help='requests per endpoint client')
+    parser.add_argument('--stream-levels', type=levels, default=[1, 4, 8], help='concurrent stream counts')
+    parser.add_argument('--seconds', type=int, default=20, help='length of each track')
+    parser.add_argument('--wav', action='append', default=[], help='WAV fixture for the next track')
+    parser.add_argument('--speed', type=float, default=8, help='fake drive read speed (x real time)')
+    parser.add_argument('--seek-ms', type=float, default=300, help='fake drive spin-up/seek time')
+    parser.add_argument('--slo-ms', type=float, default=2000, help='p95 latency limit for the limits')
+    parser.add_argument('--env', action='append', default=[], help='extra server setting, NAME=value')
+    parser.add_argument('--json', help='write the report here')
+    parser.add_argument('--compare', help='earlier --json report to compare with')
+    parser.add_argument('--tolerance', type=float, default=10, help='percent change counted as worse')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tracks = max(max(args.stream_levels), len(args.wav))
+        drive = FakeDrive(os.path.join(tmp, 'drive'), tracks, args.seconds, args.wav, args.speed, args.seek_ms)
+        server = Server(drive, tmp, dict(setting.split('=', 1) for setting in args.env))
+        try:
+            server.wait_ready()
+            # The first scan reads the TOC; later ones are what the levels measure
+            server.request('GET', '/api/cd-info')
+            results = {'endpoints': {}, 'streams': {}, 'limits': {}}
+            for path in ('/api/cd-info', '/api/devices'):
+                rows = {level: bench_endpoint(server, path, level, args.requests) for level in args.levels}
+                results['endpoints'][path] = rows
+                results['limits'][path] = {'concurrency_limit': limit(rows, 'p95_ms', args.slo_ms)}
+                print_table(f"GET {path}", rows, ['p50_ms', 'p95_ms', 'requests_per_second', 'errors'])
+            track_seconds = drive.toc.track_sectors(1)[1] / 75
+            for fmt in args.formats.split(','):
+                rows = {level: bench_streams(server, fmt, level, tracks, track_seconds)
+                        for level in args.stream_levels}
+                results['streams'][fmt] = rows
+                results['limits'][f'stream-{fmt}'] = {'concurrency_limit': limit(rows, 'ttfb_p95_ms', args.slo_ms)}
+                print_table(f"GET /api/stream ({fmt}, one track per stream, cold cache)", rows,
+                            ['ttfb_p50_ms', 'ttfb_p95_ms', 'stream_mb_s', 'cpu_s_per_stream',
+                             'cpu_pct_of_realtime', 'errors'])
+        finally:
+            server.stop()
+
+    print("\nConcurrency limits (p95 within {:g} ms, no errors): {}".format(
+        args.slo_ms, ', '.join(f"{name} {row['concurrency_limit']}" for name, row in results['limits'].items())))
+    report = {
+        'commit': commit(),
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        # JSON turns the level keys into strings
+        report = json.loads(json.dumps(report))
+        if compare(old, report, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
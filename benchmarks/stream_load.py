@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Load test: how many long-lived stream/SSE connections a WebCD server holds.
+
+Opens ``--connections`` concurrent requests to ``--path`` (by default the
+/api/events SSE stream, which needs no disc), keeps them reading for
+``--hold`` seconds and meanwhile probes /api/status to see whether the
+server still answers short requests. Compare the development server with
+the production mode:
+
+    python3 app.py                 # Flask development server
+    python3 server.py              # gunicorn + gevent
+    python3 benchmarks/stream_load.py --connections 500
+
+Use e.g. ``--path /api/stream/1`` to hold real audio streams, and
+``--pid`` to report the server's peak thread count and memory.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+async def open_stream(host, port, path, timeout, hold_until, result):
+    """One long-lived GET; records time to the first body byte and bytes read"""
+    start = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        result['refused'] += 1
+        return
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        # Headers, then the first chunk of body
+        header = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+        if not header.startswith(b'HTTP/1.1 200') and not header.startswith(b'HTTP/1.0 200'):
+            result['errors'] += 1
+            return
+        data = await asyncio.wait_for(reader.read(65536), timeout)
+        if not data:
+            result['errors'] += 1
+            return
+        result['first_byte'].append(time.monotonic() - start)
+        received = len(data)
+        while time.monotonic() < hold_until:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), hold_until - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+            received += len(data)
+        result['bytes'] += received
+        result['held'] += 1
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        result['timeouts'] += 1
+    finally:
+        writer.close()
+
+
+async def probe(host, port, timeout):
+    """Latency of one short /api/status request, or None if it failed"""
+    start = time.monotonic()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            writer.write(f'GET /api/status HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return None
+    return time.monotonic() - start
+
+
+def server_usage(pid):
+    """(threads, RSS in MiB) of a local server process from /proc"""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.split():
+                    usage[key] = value.split()[0]
+    except OSError:
+        return None
+    return int(usage.get('Threads', 0)), int(usage.get('VmRSS', 0)) / 1024
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def ms(value):
+    return '-' if value is None else f'{value * 1000:.0f} ms'
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    result = {'refused': 0, 'errors': 0, 'timeouts': 0, 'held': 0, 'bytes': 0, 'first_byte': []}
+    hold_until = time.monotonic() + args.ramp + args.hold
+
+    streams = []
+    for i in range(args.connections):
+        streams.append(asyncio.ensure_future(
+            open_stream(host, port, args.path, args.timeout, hold_until, result)))
+        # Spread connection attempts over the ramp-up time
+        await asyncio.sleep(args.ramp / args.connections)
+
+    probes = []
+    peak = None
+    while time.monotonic() < hold_until:
+        probes.append(await probe(host, port, args.timeout))
+        if args.pid:
+            usage = server_usage(args.pid)
+            if usage and (peak is None or usage > peak):
+                peak = usage
+        await asyncio.sleep(0.5)
+    await asyncio.gather(*streams)
+
+    answered = [p for p in probes if p is not None]
+    print(f"Connections requested:     {args.connections} x {args.path}")
+    print(f"Held for the whole test:   {result['held']}")
+    print(f"Refused / errors / stalled: {result['refused']} / {result['errors']} / {result['timeouts']}")
+    print(f"Time to first byte:        p50 {ms(percentile(result['first_byte'], 50))}, "
+          f"p95 {ms(percentile(result['first_byte'], 95))}")
+    print(f"Received:                  {result['bytes'] / 1024 / 1024:.1f} MiB")
+    print(f"/api/status while loaded:  {len(answered)}/{len(probes)} answered, "
+          f"p50 {ms(percentile(answered, 50))}, max {ms(max(answered) if answered else None)}")
+    if peak:
+        print(f"Server peak:               {peak[0]} threads, {peak[1]:.0f} MiB RSS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base URL')
+    parser.add_argument('--path', default='/api/events', help='streaming endpoint to hold open')
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--ramp', type=float, default=5.0, help='seconds to open all connections over')
+    parser.add_argument('--hold', type=float, default=10.0, help='seconds to keep them open')
+    parser.add_argument('--timeout', type=float, default=10.0, help='per request timeout')
+    parser.add_argument('--pid', type=int, help='server process to report resource usage for')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
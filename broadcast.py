@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import metrics
+
+log = logging.getLogger('webcd.broadcast')
+
+# Cap on how much of an encoded stream is scanned for its container header
+MAX_HEADER_BYTES = 65536
+
+
+def header_length(fmt, data):
+    """Length of the container header at the start of an encoded stream.
+
+    Late joiners need this preamble (FLAC metadata blocks, WAV chunks up to
+    'data') before they can decode from the middle. Returns None while more
+    data is needed and 0 for headerless formats such as MP3.
+    """
+    if fmt == 'flac':
+        # "fLaC", then metadata blocks: 1 bit last-block flag, 7 bit type, 24 bit length
+        pos = 4
+        while True:
+            if len(data) < pos + 4:
+                return None
+            last = data[pos] & 0x80
+            pos += 4 + int.from_bytes(data[pos + 1:pos + 4], 'big')
+            if last:
+                return pos if len(data) >= pos else None
+    if fmt == 'wav':
+        # "RIFF" size "WAVE", then chunks until 'data'
+        pos = 12
+        while True:
+            if len(data) < pos + 8:
+                return None
+            chunk_id = data[pos:pos + 4]
+            size = int.from_bytes(data[pos + 4:pos + 8], 'little')
+            if chunk_id == b'data':
+                return pos + 8
+            pos += 8 + size + (size & 1)
+    return 0
+
+
+class Broadcaster:
+    """Runs one encoding pipeline and fans its output out to many listeners.
+
+    Output chunks go into a ring buffer of about ``ring_bytes``; each
+    subscriber reads from the ring at its own pace and a late joiner starts
+    from the oldest buffered chunk (after the format's header). While the
+    ring is full the producer waits for the slowest subscriber, so every
+    subscriber gets every byte. Only with ``skip_ahead`` (MP3 live streams,
+    whose frames decode on their own) does it wait at most ``stall_timeout``
+    seconds and then overwrite what the slowest subscriber has not read,
+    which skips it ahead; skips are logged and counted. The pipeline stops
+    ``idle_timeout`` seconds after the last subscriber leaves.
+
+    A broadcaster can also be started before anyone listens (prefetching):
+    it then fills the ring and waits, keeping everything from the first
+    byte, and gives up if nobody subscribes within ``prebuffer_timeout``.
+    """
+
+    def __init__(self, key, source, fmt=None, ring_bytes=8 * 1024 * 1024, align=1, skip_ahead=False,
+                 stall_timeout=10.0, idle_timeout=5.0, prebuffer_timeout=None, on_finish=None):
+        self.key = key
+        self.source = source
+        self.fmt = fmt
+        self.ring_bytes = ring_bytes
+        self.align = align
+        self.skip_ahead = skip_ahead
+        self.stall_timeout = stall_timeout
+        self.idle_timeout = idle_timeout
+        self.prebuffer_timeout = prebuffer_timeout
+        self.on_finish = on_finish
+
+        self.ring = deque()  # (sequence number, bytes)
+        self.buffered = 0
+        self.next_seq = 0
+        self.preamble = b''
+        self.positions = {}  # subscriber id -> next sequence number to read
+        self.last_subscriber_left = None
+        self.created = time.monotonic()
+        self.subscribed = False
+        self.done = False
+        self.bytes_produced = 0
+        self.bytes_skipped = 0  # overwritten before a subscriber read them
+        self.cond = threading.Condition()
+        self.thread = None
+
+    @property
+    def subscriber_count(self):
+        with self.cond:
+            return len(self.positions)
+
+    def expired(self):
+        """Finished, and a new listener could no longer get the whole stream from it"""
+        with self.cond:
+            # A finished prefetch still holds everything for its first listener
+            return self.done and (self.subscribed or self._idle())
+
+    def has_start(self):
+        """Whether a new subscriber would still get the stream from its first byte"""
+        with self.cond:
+            if self.ring:
+                return self.ring[0][0] == 0
+            return self.next_seq == 0 and not self.done
+
+    def start(self):
+        """Start the producer; called by the first subscriber, or early to prefetch"""
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f'broadcast-{self.key}', daemon=True)
+                self.thread.start()
+
+    def _idle(self):
+        if self.positions:
+            return False
+        if self.last_subscriber_left is not None:
+            return time.monotonic() - self.last_subscriber_left > self.idle_timeout
+        # Prefetched, and nobody came to listen
+        return (not self.subscribed and self.prebuffer_timeout is not None
+                and time.monotonic() - self.created > self.prebuffer_timeout)
+
+    def _run(self):
+        pending = b''
+        header_done = False
+        try:
+            for data in self.source:
+                with self.cond:
+                    if self._idle():
+                        break
+                pending += data
+
+                if not header_done:
+                    length = header_length(self.fmt, pending)
+                    if length is None and len(pending) < MAX_HEADER_BYTES:
+                        continue
+                    header_done = True
+                    if length:
+                        self.preamble = pending[:length]
+                        self._append(self.preamble)
+                        pending = pending[length:]
+
+                # Keep chunk boundaries on whole sample frames for raw formats
+                cut = len(pending) - len(pending) % self.align
+                if cut:
+                    self._append(pending[:cut])
+                    pending = pending[cut:]
+            if pending:
+                self._append(pending)
+        except Exception as e:
+            log.error("Broadcast %s failed: %s", self.key, e)
+        finally:
+            close = getattr(self.source, 'close', None)
+            if close:
+                close()
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+            if self.on_finish and self.expired():
+                self.on_finish(self)
+
+    def _append(self, chunk):
+        with self.cond:
+            # A prefetch keeps all of its output until the first listener arrives
+            while (not self.subscribed and self.buffered + len(chunk) > self.ring_bytes
+                   and self.ring and not self._idle()):
+                self.cond.wait(1.0)
+
+            # Wait for the slowest listener rather than overwrite what it has not read
+            deadline = time.monotonic() + self.stall_timeout if self.skip_ahead else None
+            while (self.buffered + len(chunk) > self.ring_bytes and self.ring
+                   and self.positions and min(self.positions.values()) <= self.ring[0][0]
+                   and (deadline is None or time.monotonic() < deadline)):
+                self.cond.wait(1.0 if deadline is None else deadline - time.monotonic())
+
+            self.ring.append((self.next_seq, chunk))
+            self.buffered += len(chunk)
+            self.next_seq += 1
+            self.bytes_produced += len(chunk)
+            while self.buffered > self.ring_bytes and len(self.ring) > 1:
+                seq, old = self.ring[0]
+                unread = self.positions and min(self.positions.values()) <= seq
+                if unread and not self.skip_ahead:
+                    break
+                self.ring.popleft()
+                self.buffered -= len(old)
+                if unread:
+                    self.bytes_skipped += len(old)
+                    metrics.BROADCAST_SKIPPED_BYTES.inc(len(old), format=self.fmt or 'pcm')
+            self.cond.notify_all()
+
+    def subscribe(self):
+        """Generator of this broadcast's output for one listener"""
+        sub_id = object()
+        with self.cond:
+            position = self.ring[0][0] if self.ring else self.next_seq
+            self.positions[sub_id] = position
+            self.subscribed = True
+            self.cond.notify_all()
+            self.start()
+        try:
+            # Joined after the header scrolled out of the ring
+            if position > 0 and self.preamble:
+                yield self.preamble
+
+            while True:
+                with self.cond:
+                    while position >= self.next_seq and not self.done:
+                        self.cond.wait(1.0)
+                    if position >= self.next_seq and self.done:
+                        return
+                    first = self.ring[0][0]
+                    if position < first:
+                        # Fell too far behind (skip_ahead only): go on from the oldest chunk still buffered
+                        log.warning("Listener of %s fell behind and skipped %d chunks", self.key,
+                                    first - position)
+                        position = first
+                    chunks = [chunk for seq, chunk in self.ring if seq >= position]
+                    position = self.next_seq
+                    self.positions[sub_id] = position
+                    self.cond.notify_all()
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            with self.cond:
+                self.positions.pop(sub_id, None)
+                if not self.positions:
+                    self.last_subscriber_left = time.monotonic()
+                self.cond.notify_all()
+                finished = self.done
+            if finished and self.on_finish:
+                self.on_finish(self)
+
+
+class BroadcastRegistry:
+    """Shares one running Broadcaster per key between concurrent requests"""
+
+    def __init__(self):
+        self.broadcasters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, source_factory, **kwargs):
+        """Return the live broadcaster for ``key``, starting one from ``source_factory()`` if needed"""
+        with self.lock:
+            self._prune()
+            broadcaster = self.broadcasters.get(key)
+            if broadcaster is None or broadcaster.expired():
+                broadcaster = Broadcaster(key, source_factory(), on_finish=self._finished, **kwargs)
+                self.broadcasters[key] = broadcaster
+            return broadcaster
+
+    def find(self, key):
+        """The live broadcaster for ``key``, or None"""
+        with self.lock:
+            broadcaster = self.broadcasters.get(key)
+            return broadcaster if broadcaster is not None and not broadcaster.expired() else None
+
+    def _finished(self, broadcaster):
+        with self.lock:
+            if self.broadcasters.get(broadcaster.key) is broadcaster:
+                del self.broadcasters[broadcaster.key]
+
+    def _prune(self):
+        """Drop prefetched broadcasts that nobody came to listen to"""
+        for key, broadcaster in list(self.broadcasters.items()):
+            if broadcaster.expired():
+                del self.broadcasters[key]
+
+    def stats(self):
+        with self.lock:
+            self._prune()
+            broadcasters = list(self.broadcasters.values())
+        return [{
+            'key': list(b.key),
+            'subscribers': b.subscriber_count,
+            'prefetching': not b.subscribed,
+            'bytes_produced': b.bytes_produced,
+            'bytes_skipped': b.bytes_skipped,
+            'buffered_bytes': b.buffered
+        } for b in broadcasters]
@@ -0,0 +1,102 @@
+import ctypes
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:  # Not available on non-Unix platforms
+    fcntl = None
+
+from cdtoc import CDROM_LBA
+from pcm_cache import BYTES_PER_SECTOR
+
+# Linux CDROM ioctl (linux/cdrom.h)
+CDROMREADAUDIO = 0x530e
+# The kernel rejects reads of more than one second (75 frames) at a time
+MAX_FRAMES_PER_READ = 75
+
+# struct cdrom_read_audio { union cdrom_addr addr; __u8 addr_format;
+#                           int nframes; __u8 *buf; }  (native alignment)
+READ_AUDIO_FORMAT = '@iBiP'
+
+
+def unpack_read_audio(request):
+    """(lba, nframes, buffer address) of a CDROMREADAUDIO request, for fake drives"""
+    lba, _, nframes, address = struct.unpack(READ_AUDIO_FORMAT, request)
+    return lba, nframes, address
+
+
+class SectorReader:
+    """Reads a span of audio sectors straight from the drive with CDROMREADAUDIO.
+
+    The kernel copies sectors into one reusable buffer, so extraction needs
+    no cdparanoia process and no pipe. There is no paranoia-style
+    verification: a sector that still fails after ``retries`` attempts is
+    replaced by silence and counted in ``skipped``, as with cdparanoia -Z;
+    failed single-sector attempts are counted in ``retried``.
+    ``ioctl`` can be replaced (same signature as fcntl.ioctl) to read from a
+    fake device. OSError is raised if not even the first sectors can be read.
+    """
+
+    def __init__(self, device_path, start, length, frames_per_read=MAX_FRAMES_PER_READ,
+                 retries=3, ioctl=None):
+        if ioctl is None:
+            if fcntl is None:
+                raise OSError('CDROM ioctls are not available on this platform')
+            ioctl = fcntl.ioctl
+        self.device_path = device_path
+        self.start = start
+        self.length = length
+        self.frames_per_read = min(frames_per_read, MAX_FRAMES_PER_READ)
+        self.retries = retries
+        self.ioctl = ioctl
+        self.buffer = bytearray(self.frames_per_read * BYTES_PER_SECTOR)
+        self.address = ctypes.addressof(
+            (ctypes.c_char * len(self.buffer)).from_buffer(self.buffer))
+        self.skipped = 0
+        self.retried = 0
+        self.bytes_read = 0
+
+    def _read(self, fd, lba, nframes, offset=0):
+        request = struct.pack(READ_AUDIO_FORMAT, lba, CDROM_LBA, nframes,
+                              self.address + offset)
+        self.ioctl(fd, CDROMREADAUDIO, request)
+
+    def _read_sectors(self, fd, lba, nframes):
+        """Fallback after a failed bulk read: one sector at a time, with retries"""
+        for i in range(nframes):
+            offset = i * BYTES_PER_SECTOR
+            for _ in range(self.retries):
+                try:
+                    self._read(fd, lba + i, 1, offset)
+                    break
+                except OSError:
+                    self.retried += 1
+                    continue
+            else:
+                self.buffer[offset:offset + BYTES_PER_SECTOR] = bytes(BYTES_PER_SECTOR)
+                self.skipped += 1
+
+    def __iter__(self):
+        """Yield the span's PCM, up to ``frames_per_read`` sectors at a time"""
+        fd = os.open(self.device_path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            lba = self.start
+            end = self.start + self.length
+            while lba < end:
+                nframes = min(self.frames_per_read, end - lba)
+                try:
+                    self._read(fd, lba, nframes)
+                except OSError:
+                    skipped = self.skipped
+                    self._read_sectors(fd, lba, nframes)
+                    if lba == self.start and self.skipped - skipped == nframes:
+                        # Nothing readable at all: the drive can't do audio reads
+                        raise
+                size = nframes * BYTES_PER_SECTOR
+                self.bytes_read += size
+                lba += nframes
+                yield bytes(self.buffer[:size])
+        finally:
+            os.close(fd)
+
@@ -0,0 +1,284 @@
+import logging
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+log = logging.getLogger('webcd.cddb')
+
+# Sent in the CDDB handshake: user, host, client name and version
+HELLO = ('webcd', 'localhost', 'WebCD', '1.0')
+# Protocol level 6: UTF-8 responses
+PROTO_LEVEL = 6
+
+
+class CDDBError(Exception):
+    """A CDDB server refused a command or broke the protocol"""
+
+
+class ConnectionClosed(CDDBError):
+    """The server closed the connection (idle timeout or too many clients)"""
+
+
+def parse_response(lines):
+    """(code, header text, data lines) of a response given as a list of lines"""
+    if not lines or not lines[0][:3].isdigit():
+        raise CDDBError(f'Bad response: {lines[0] if lines else "(empty)"}')
+    header = lines[0]
+    data = []
+    code = int(header[:3])
+    # x1x responses are followed by data lines up to a lone '.'
+    if code // 10 % 10 == 1:
+        for line in lines[1:]:
+            if line == '.':
+                break
+            data.append(line)
+    return code, header[4:].strip(), data
+
+
+def parse_entry(lines):
+    """(album_info, {track number: title}) from the lines of an xmcd disc entry, or None"""
+    fields = {}
+    for line in lines:
+        if line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        # Long values continue on further lines with the same key
+        fields[key] = fields.get(key, '') + value
+    title = fields.get('DTITLE', '').strip()
+    tracks = {}
+    for key, value in fields.items():
+        match = re.fullmatch(r'TTITLE(\d+)', key)
+        if match:
+            tracks[int(match.group(1)) + 1] = value.strip()
+    if not title or not tracks:
+        return None
+    # Format: "Artist / Album"
+    if ' / ' in title:
+        artist, album = title.split(' / ', 1)
+        album_info = {'artist': artist.strip(), 'album': album.strip()}
+    else:
+        album_info = {'album': title, 'artist': 'Unknown Artist'}
+    if fields.get('DYEAR', '').strip():
+        album_info['year'] = fields['DYEAR'].strip()
+    if fields.get('DGENRE', '').strip():
+        album_info['genre'] = fields['DGENRE'].strip()
+    album_info['source'] = 'GNUDB'
+    return album_info, tracks
+
+
+class CDDBConnection:
+    """One CDDBP session: connected, greeted and switched to UTF-8, reading whole lines"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile('rb')
+        self.encoding = 'utf-8'
+        self.last_used = time.monotonic()
+        try:
+            code, text, _ = self.response()
+            if code not in (200, 201):
+                raise CDDBError(f'Server refused the connection: {code} {text}')
+            code, text, _ = self.command('cddb hello ' + ' '.join(HELLO))
+            # 402: already shook hands
+            if code not in (200, 402):
+                raise CDDBError(f'Handshake failed: {code} {text}')
+            code, _, _ = self.command(f'proto {PROTO_LEVEL}')
+            if code not in (200, 201, 502):
+                # Older servers send ISO-8859-1
+                self.encoding = 'latin-1'
+        except Exception:
+            self.close()
+            raise
+
+    def readline(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionClosed('Connection closed by the server')
+        return line.rstrip(b'\r\n').decode(self.encoding, errors='replace')
+
+    def response(self):
+        lines = [self.readline()]
+        if lines[0][:3].isdigit() and int(lines[0][:3]) // 10 % 10 == 1:
+            while lines[-1] != '.':
+                lines.append(self.readline())
+        return parse_response(lines)
+
+    def command(self, command):
+        self.sock.sendall(command.encode(self.encoding) + b'\r\n')
+        response = self.response()
+        self.last_used = time.monotonic()
+        return response
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class CDDBClient:
+    """GNUDB/FreeDB client over CDDBP (port 8880) or CDDB over HTTP.
+
+    CDDBP sessions stay open after a lookup and are reused by the next one
+    for up to ``idle_timeout`` seconds, which saves the connection and the
+    hello/proto handshake; over HTTP one keep-alive session is reused.
+    Network and server errors are retried ``retries`` times with a short
+    backoff. Discs the server does not know are remembered for
+    ``negative_ttl`` seconds, so they are not asked for again on every
+    rescan.
+    """
+
+    def __init__(self, host, port=8880, protocol='cddbp', timeout=10, retries=2, pool_size=2,
+                 idle_timeout=30, negative_ttl=3600, max_misses=512):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.negative_ttl = negative_ttl
+        self.max_misses = max_misses
+        self.idle = []  # open CDDBP connections, most recently used last
+        self.misses = OrderedDict()  # query -> time the server had no match
+        self.lock = threading.Lock()
+        self.session = requests.Session() if protocol == 'http' else None
+        self.stats_counters = {'lookups': 0, 'found': 0, 'not_found': 0, 'negative_hits': 0,
+                               'errors': 0, 'retries': 0, 'connections': 0, 'reused': 0}
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.stats_counters[name] += amount
+
+    def _acquire(self, fresh=False):
+        """(connection, reused) from the idle connections or a new one"""
+        now = time.monotonic()
+        with self.lock:
+            while self.idle and not fresh:
+                connection = self.idle.pop()
+                if now - connection.last_used < self.idle_timeout:
+                    self.stats_counters['reused'] += 1
+                    return connection, True
+                connection.close()
+        self._count('connections')
+        return CDDBConnection(self.host, self.port, self.timeout), False
+
+    def _release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.pool_size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def http_command(self, command):
+        """Send one command as a CDDB over HTTP request and return (code, header text, data lines)"""
+        url = f'http://{self.host}:{self.port}/~cddb/cddb.cgi'
+        response = self.session.get(url, timeout=self.timeout, params={
+            'cmd': command, 'hello': ' '.join(HELLO), 'proto': PROTO_LEVEL})
+        response.raise_for_status()
+        response.encoding = 'utf-8'
+        return parse_response(response.text.splitlines())
+
+    def _lookup(self, query):
+        """Query and read on one connection (or HTTP session)"""
+        if self.session is not None:
+            return self._read_match(self.http_command(query), self.http_command)
+
+        connection, reused = self._acquire()
+        try:
+            try:
+                response = connection.command(query)
+            except (OSError, ConnectionClosed):
+                if not reused:
+                    raise
+                # The server dropped the idle connection: once more on a fresh one
+                connection.close()
+                connection, _ = self._acquire(fresh=True)
+                response = connection.command(query)
+            result = self._read_match(response, connection.command)
+        except Exception:
+            connection.close()
+            raise
+        self._release(connection)
+        return result
+
+    def _read_match(self, response, command):
+        """Read the first match of a query response with ``command``; None if nothing matched"""
+        code, text, lines = response
+        if code == 202:
+            return None
+        if code == 200:
+            # "200 genre discid Artist / Album"
+            match = text
+        elif code in (210, 211):
+            # Exact or inexact matches, one per line; take the first
+            match = lines[0] if lines else ''
+        else:
+            raise CDDBError(f'Query failed: {code} {text}')
+        parts = match.split(' ', 2)
+        if len(parts) < 2:
+            raise CDDBError(f'Bad match: {match}')
+        code, text, lines = command(f'cddb read {parts[0]} {parts[1]}')
+        if code != 210:
+            raise CDDBError(f'Read failed: {code} {text}')
+        return parse_entry(lines)
+
+    def lookup(self, disc_id, offsets, seconds):
+        """(album_info, {track number: title}) of a disc, or None if the server has no match
+
+        ``offsets`` are the tracks' start frames and ``seconds`` the disc
+        length, as printed by cd-discid. Raises CDDBError or OSError once
+        all retries failed.
+        """
+        query = f"cddb query {disc_id} {len(offsets)} {' '.join(map(str, offsets))} {seconds}"
+        self._count('lookups')
+        with self.lock:
+            missed = self.misses.get(query)
+            if missed is not None and time.monotonic() - missed < self.negative_ttl:
+                self.stats_counters['negative_hits'] += 1
+                return None
+
+        for attempt in range(self.retries + 1):
+            try:
+                result = self._lookup(query)
+                break
+            except (OSError, CDDBError, requests.RequestException) as e:
+                if attempt == self.retries:
+                    self._count('errors')
+                    raise
+                log.warning("GNUDB lookup failed (%s), retrying", e, extra={'disc_id': disc_id})
+                self._count('retries')
+                time.sleep(0.5 * (attempt + 1))
+
+        with self.lock:
+            if result is None:
+                self.stats_counters['not_found'] += 1
+                self.misses[query] = time.monotonic()
+                self.misses.move_to_end(query)
+                while len(self.misses) > self.max_misses:
+                    self.misses.popitem(last=False)
+            else:
+                self.stats_counters['found'] += 1
+                self.misses.pop(query, None)
+        return result
+
+    def clear_misses(self):
+        """Forget the discs the server had no match for, so they are asked for again"""
+        with self.lock:
+            self.misses.clear()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.stats_counters, protocol=self.protocol, host=self.host, port=self.port,
+                        idle_connections=len(self.idle), cached_misses=len(self.misses))
@@ -0,0 +1,312 @@
+import os
+import re
+import struct
+import base64
+import hashlib
+import subprocess
+
+try:
+    import fcntl
+except ImportError:  # Not available on non-Unix platforms
+    fcntl = None
+
+import metrics
+
+# Linux CDROM ioctls (linux/cdrom.h)
+CDROMREADTOCHDR = 0x5305
+CDROMREADTOCENTRY = 0x5306
+CDROM_DRIVE_STATUS = 0x5326
+CDROM_DISC_STATUS = 0x5327
+
+CDROM_LBA = 0x01
+CDROM_LEADOUT = 0xAA
+CDROM_DATA_TRACK = 0x04
+
+# CDROM_DRIVE_STATUS results
+CDS_NO_INFO = 0
+CDS_NO_DISC = 1
+CDS_TRAY_OPEN = 2
+CDS_DRIVE_NOT_READY = 3
+CDS_DISC_OK = 4
+
+# struct cdrom_tochdr { __u8 cdth_trk0; __u8 cdth_trk1; }
+TOCHDR_FORMAT = '=BB'
+# struct cdrom_tocentry { __u8 track; __u8 adr:4, ctrl:4; __u8 format;
+#                         union cdrom_addr addr; __u8 datamode; }
+TOCENTRY_FORMAT = '=BBBxiBxxx'
+
+FRAMES_PER_SECOND = 75
+# Every disc starts with a 2 second pregap that CDDB and MusicBrainz count
+LEAD_IN_FRAMES = 150
+# Gap between the audio session and the data session on enhanced CDs
+DATA_SESSION_GAP = 11400
+
+# Known TOC -> disc ID pairs, checked by `python3 cdtoc.py --check`.
+# Offsets and lead-out are as MusicBrainz writes them (lead-in included).
+KNOWN_DISC_IDS = [
+    # Example from the MusicBrainz "Disc ID Calculation" documentation
+    {
+        'toc': '1 6 95462 150 15363 32314 46592 63414 80489',
+        'musicbrainz_id': '49HHV7Eb8UKF3aQiNmu1GR8vKTY-',
+        'freedb_id': '3404f606',
+    },
+    # libdiscid's test_put
+    {
+        'toc': '1 22 303602 150 9700 25887 39297 53795 63735 77517 94877 107270 123552 135522 '
+               '148422 161197 174790 192022 205545 218010 228700 239590 255470 266932 288750',
+        'musicbrainz_id': 'xUp1F2NkfP8s8jaeFn_Av3jNEI4-',
+        'freedb_id': '370fce16',
+    },
+    # python-discid's test disc
+    {
+        'toc': '1 15 258725 150 17510 33275 45910 57805 78310 94650 109580 132010 149160 '
+               '165115 177710 203325 215555 235590',
+        'musicbrainz_id': 'TqvKjMu7dMliSfmVEBtrL7sBSno-',
+        'freedb_id': 'b60d770f',
+    },
+]
+
+
+class Toc:
+    """Table of contents of an audio CD.
+
+    ``offsets`` are the starting LBAs of each track (without the 150 frame
+    lead-in) and ``leadout`` is the LBA of the lead-out, exactly as returned
+    by CDROMREADTOCENTRY.
+    """
+
+    def __init__(self, first_track, last_track, offsets, leadout, data_tracks=()):
+        self.first_track = first_track
+        self.last_track = last_track
+        self.offsets = list(offsets)
+        self.leadout = leadout
+        self.data_tracks = set(data_tracks)
+
+    @property
+    def track_count(self):
+        return self.last_track - self.first_track + 1
+
+    def track_numbers(self):
+        return list(range(self.first_track, self.last_track + 1))
+
+    def audio_tracks(self):
+        return [n for n in self.track_numbers() if n not in self.data_tracks]
+
+    def track_sectors(self, track_number):
+        """Return the (start LBA, length in sectors) of a track"""
+        index = track_number - self.first_track
+        start = self.offsets[index]
+        if index + 1 < len(self.offsets):
+            end = self.offsets[index + 1]
+            # The last audio track before a data session ends at the session gap
+            if track_number + 1 in self.data_tracks and track_number not in self.data_tracks:
+                end -= DATA_SESSION_GAP
+        else:
+            end = self.leadout
+        return start, end - start
+
+    def tracks(self):
+        """Track list in the format used by CDPlayer.track_info"""
+        tracks = []
+        for number in self.audio_tracks():
+            _, length = self.track_sectors(number)
+            seconds = length // FRAMES_PER_SECOND
+            tracks.append({
+                'number': number,
+                'title': f'Track {number}',
+                'duration': f"{seconds // 60:02d}:{seconds % 60:02d}"
+            })
+        return tracks
+
+    def freedb_id(self):
+        """CDDB/FreeDB disc ID as an 8 digit hex string"""
+        def digit_sum(n):
+            return sum(int(d) for d in str(n))
+
+        n = sum(digit_sum((offset + LEAD_IN_FRAMES) // FRAMES_PER_SECOND) for offset in self.offsets)
+        t = ((self.leadout + LEAD_IN_FRAMES) // FRAMES_PER_SECOND
+             - (self.offsets[0] + LEAD_IN_FRAMES) // FRAMES_PER_SECOND)
+        return '%08x' % ((n % 0xff) << 24 | t << 8 | self.track_count)
+
+    def _musicbrainz_layout(self):
+        """First/last audio track and lead-out as MusicBrainz sees them"""
+        last = self.last_track
+        leadout = self.leadout
+        # Enhanced CDs: drop trailing data tracks and end the audio at the session gap
+        while last in self.data_tracks and last > self.first_track:
+            leadout = self.offsets[last - self.first_track] - DATA_SESSION_GAP
+            last -= 1
+        return self.first_track, last, leadout
+
+    def musicbrainz_id(self):
+        """MusicBrainz disc ID (base64 SHA-1 of the TOC)"""
+        first, last, leadout = self._musicbrainz_layout()
+        data = '%02X%02X%08X' % (first, last, leadout + LEAD_IN_FRAMES)
+        for number in range(1, 100):
+            if first <= number <= last:
+                data += '%08X' % (self.offsets[number - self.first_track] + LEAD_IN_FRAMES)
+            else:
+                data += '%08X' % 0
+        digest = base64.b64encode(hashlib.sha1(data.encode('ascii')).digest()).decode('ascii')
+        return digest.replace('+', '.').replace('/', '_').replace('=', '-')
+
+    def musicbrainz_toc(self):
+        """TOC string for MusicBrainz ``toc=`` fuzzy lookups"""
+        first, last, leadout = self._musicbrainz_layout()
+        offsets = [self.offsets[n - self.first_track] + LEAD_IN_FRAMES for n in range(first, last + 1)]
+        return ' '.join(str(x) for x in [first, last, leadout + LEAD_IN_FRAMES] + offsets)
+
+    def cd_discid_output(self):
+        """The same line `cd-discid` would print, as used for GNUDB queries"""
+        offsets = [offset + LEAD_IN_FRAMES for offset in self.offsets]
+        total_seconds = (self.leadout + LEAD_IN_FRAMES) // FRAMES_PER_SECOND
+        return ' '.join([self.freedb_id(), str(self.track_count)]
+                        + [str(x) for x in offsets] + [str(total_seconds)])
+
+    @classmethod
+    def from_musicbrainz_toc(cls, toc_string):
+        """Inverse of musicbrainz_toc(): "first last leadout offset1 offset2 ..." """
+        values = [int(x) for x in toc_string.split()]
+        first, last, leadout = values[:3]
+        offsets = [offset - LEAD_IN_FRAMES for offset in values[3:]]
+        return cls(first, last, offsets, leadout - LEAD_IN_FRAMES)
+
+    def to_dict(self):
+        return {
+            'first_track': self.first_track,
+            'last_track': self.last_track,
+            'offsets': self.offsets,
+            'leadout': self.leadout,
+            'data_tracks': sorted(self.data_tracks)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['first_track'], data['last_track'], data['offsets'],
+                   data['leadout'], data.get('data_tracks', ()))
+
+    def __eq__(self, other):
+        return isinstance(other, Toc) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'Toc({self.first_track}, {self.last_track}, {self.offsets!r}, {self.leadout})'
+
+
+def read_toc(device_path, ioctl=None):
+    """Read the TOC straight from the drive with the CDROM ioctls.
+
+    ``ioctl`` can be replaced (same signature as fcntl.ioctl) to read from a
+    fake device.  Raises OSError if the device cannot be read.
+    """
+    if ioctl is None:
+        if fcntl is None:
+            raise OSError('CDROM ioctls are not available on this platform')
+        ioctl = fcntl.ioctl
+
+    fd = os.open(device_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        header = ioctl(fd, CDROMREADTOCHDR, struct.pack(TOCHDR_FORMAT, 0, 0))
+        first_track, last_track = struct.unpack(TOCHDR_FORMAT, header)
+        if first_track == 0 or last_track < first_track:
+            raise OSError('Invalid TOC header')
+
+        offsets = []
+        data_tracks = []
+        for number in list(range(first_track, last_track + 1)) + [CDROM_LEADOUT]:
+            request = struct.pack(TOCENTRY_FORMAT, number, 0, CDROM_LBA, 0, 0)
+            entry = ioctl(fd, CDROMREADTOCENTRY, request)
+            _, adr_ctrl, _, lba, _ = struct.unpack(TOCENTRY_FORMAT, entry)
+            if number == CDROM_LEADOUT:
+                leadout = lba
+            else:
+                offsets.append(lba)
+                # ctrl is the high nibble of the adr/ctrl byte
+                if (adr_ctrl >> 4) & CDROM_DATA_TRACK:
+                    data_tracks.append(number)
+    finally:
+        os.close(fd)
+
+    return Toc(first_track, last_track, offsets, leadout, data_tracks)
+
+
+def drive_status(device_path, ioctl=None):
+    """Return the CDROM_DRIVE_STATUS code for a device (CDS_*)"""
+    if ioctl is None:
+        if fcntl is None:
+            raise OSError('CDROM ioctls are not available on this platform')
+        ioctl = fcntl.ioctl
+
+    fd = os.open(device_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        return ioctl(fd, CDROM_DRIVE_STATUS, 0)
+    finally:
+        os.close(fd)
+
+
+def parse_cdparanoia_toc(output):
+    """Build a Toc from `cdparanoia -Q` output (which it writes to stderr)"""
+    offsets = []
+    numbers = []
+    leadout = None
+    for line in output.split('\n'):
+        # "  1.    33027 [07:20.27]        0 [00:00.00]    no   no  2"
+        match = re.match(r'\s+(\d+)\.\s+(\d+)\s+\[[\d:.]+\]\s+(\d+)\s+\[', line)
+        if match:
+            numbers.append(int(match.group(1)))
+            offsets.append(int(match.group(3)))
+            leadout = int(match.group(3)) + int(match.group(2))
+    if not offsets:
+        return None
+    return Toc(numbers[0], numbers[-1], offsets, leadout)
+
+
+def read_toc_subprocess(device_path, timeout=5):
+    """Fallback TOC reader using `cdparanoia -Q`"""
+    try:
+        result = metrics.run(['cdparanoia', '-Q', '-d', device_path],
+                             capture_output=True, text=True, timeout=timeout)
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+    return parse_cdparanoia_toc(result.stderr)
+
+
+def check_known_disc_ids():
+    """Verify the disc ID calculations against KNOWN_DISC_IDS, returning the failures"""
+    failures = []
+    for vector in KNOWN_DISC_IDS:
+        toc = Toc.from_musicbrainz_toc(vector['toc'])
+        checks = [('musicbrainz_id', toc.musicbrainz_id()),
+                  ('musicbrainz_toc', toc.musicbrainz_toc())]
+        if 'freedb_id' in vector:
+            checks.append(('freedb_id', toc.freedb_id()))
+        expected = dict(vector, musicbrainz_toc=vector['toc'])
+        for name, value in checks:
+            if value != expected[name]:
+                failures.append(f"{vector['toc']}: {name} {value} != {expected[name]}")
+    return failures
+
+
+def get_toc(device_path):
+    """Read the TOC natively, falling back to cdparanoia"""
+    try:
+        return read_toc(device_path)
+    except OSError:
+        return read_toc_subprocess(device_path)
+
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] == ['--check']:
+        failures = check_known_disc_ids()
+        for failure in failures:
+            print(failure)
+        print(f'{len(KNOWN_DISC_IDS) - len(failures)}/{len(KNOWN_DISC_IDS)} known disc IDs OK'
+              if not failures else 'FAILED')
+        sys.exit(1 if failures else 0)
+
+    device = sys.argv[1] if len(sys.argv) > 1 else '/dev/cdrom'
+    toc = get_toc(device)
+    if toc is None:
+        sys.exit(f'Unable to read TOC from {device}')
+    print(toc.cd_discid_output())
+    print(f'MusicBrainz disc ID: {toc.musicbrainz_id()}')
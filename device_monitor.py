@@ -0,0 +1,206 @@
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+from cdtoc import drive_status, CDS_DISC_OK, CDS_NO_DISC, CDS_TRAY_OPEN
+
+log = logging.getLogger('webcd.device_monitor')
+
+# Netlink protocol for kernel uevents (linux/netlink.h)
+NETLINK_KOBJECT_UEVENT = 15
+
+COMMON_DEVICES = ['/dev/cdrom', '/dev/dvd', '/dev/sr0', '/dev/sr1', '/dev/sr2']
+
+
+def parse_uevent(data):
+    """Turn a raw kernel uevent ("action@devpath\\0KEY=value\\0...") into a dict"""
+    parts = data.split(b'\0')
+    env = {}
+    if b'@' in parts[0]:
+        action, _, devpath = parts[0].decode('utf-8', 'replace').partition('@')
+        env['ACTION'] = action
+        env['DEVPATH'] = devpath
+    for part in parts[1:]:
+        key, sep, value = part.decode('utf-8', 'replace').partition('=')
+        if sep:
+            env[key] = value
+    return env
+
+
+def ioctl_media_status(device_path):
+    """True/False from CDROM_DRIVE_STATUS, or None if the drive can't say"""
+    try:
+        status = drive_status(device_path)
+    except OSError:
+        return None
+    if status == CDS_DISC_OK:
+        return True
+    if status in (CDS_NO_DISC, CDS_TRAY_OPEN):
+        return False
+    return None
+
+
+class DeviceMonitor:
+    """Keeps an in-memory registry of optical drives up to date in the background.
+
+    Drive hotplug and media changes arrive as kernel uevents over netlink;
+    between events the drives are polled with the CDROM_DRIVE_STATUS ioctl,
+    which never spins up the disc. ``probe(device_path)`` builds the info dict
+    for a new drive and ``on_change(kind, info)`` is called with kind
+    'added', 'removed' or 'media' whenever the registry changes ('rescan',
+    with no info, after a full rescan, which reports the drives it no longer
+    found as 'removed' first).
+    """
+
+    def __init__(self, probe, on_change=None, poll_interval=2.0, media_status=ioctl_media_status):
+        self.probe = probe
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self.media_status = media_status
+        self.registry = {}  # real path -> device info, in discovery order
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def devices(self):
+        """Snapshot of the registered devices"""
+        with self.lock:
+            return [dict(info) for info in self.registry.values()]
+
+    def find(self, device_path):
+        with self.lock:
+            info = self.registry.get(os.path.realpath(device_path))
+            return dict(info) if info else None
+
+    def rescan(self):
+        """Full scan of /dev and /sys/block, replacing the registry"""
+        candidates = [d for d in COMMON_DEVICES if os.path.exists(d)]
+        try:
+            for name in sorted(os.listdir('/sys/block')):
+                if name.startswith('sr') and os.path.exists(f'/dev/{name}'):
+                    candidates.append(f'/dev/{name}')
+        except OSError:
+            pass
+
+        registry = {}
+        for device_path in candidates:
+            real_path = os.path.realpath(device_path)
+            if real_path in registry:
+                continue
+            info = self.probe(device_path)
+            if info:
+                registry[info['real_path']] = info
+
+        with self.lock:
+            changed = registry != self.registry
+            gone = [info for real_path, info in self.registry.items() if real_path not in registry]
+            self.registry = registry
+        for info in gone:
+            self._notify('removed', info)
+        if changed:
+            self._notify('rescan', None)
+        return self.devices()
+
+    def add(self, device_path):
+        real_path = os.path.realpath(device_path)
+        with self.lock:
+            if real_path in self.registry:
+                return
+        info = self.probe(device_path)
+        if not info:
+            return
+        with self.lock:
+            self.registry[info['real_path']] = info
+        self._notify('added', info)
+
+    def remove(self, device_path):
+        real_path = os.path.realpath(device_path)
+        with self.lock:
+            info = self.registry.pop(real_path, None)
+        if info:
+            self._notify('removed', info)
+
+    def set_media(self, device_path, has_media):
+        """Record a media change (e.g. after we ejected the disc ourselves)"""
+        with self.lock:
+            info = self.registry.get(os.path.realpath(device_path))
+            if info is None or info['has_media'] == has_media:
+                return
+            info['has_media'] = has_media
+            info = dict(info)
+        self._notify('media', info)
+
+    def handle_uevent(self, env):
+        """Apply one parsed uevent; also the entry point for simulated events"""
+        name = env.get('DEVNAME', '')
+        if env.get('SUBSYSTEM') != 'block' or not os.path.basename(name).startswith('sr'):
+            return
+        device_path = name if name.startswith('/') else f'/dev/{name}'
+        action = env.get('ACTION')
+
+        if action == 'add':
+            self.add(device_path)
+        elif action == 'remove':
+            self.remove(device_path)
+        elif action == 'change':
+            if env.get('DISK_EJECT_REQUEST') == '1':
+                self.set_media(device_path, False)
+            elif env.get('DISK_MEDIA_CHANGE') == '1':
+                has_media = self.media_status(device_path)
+                if has_media is not None:
+                    self.set_media(device_path, has_media)
+
+    def poll(self):
+        """Re-check media status of every registered drive via ioctl"""
+        for info in self.devices():
+            has_media = self.media_status(info['device'])
+            if has_media is not None:
+                self.set_media(info['device'], has_media)
+
+    def _notify(self, kind, info):
+        if self.on_change:
+            try:
+                self.on_change(kind, info)
+            except Exception as e:
+                log.error("Device change handler failed: %s", e)
+
+    def _open_netlink(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            # Multicast group 1 carries the kernel's own uevents
+            sock.bind((0, 1))
+            return sock
+        except (AttributeError, OSError) as e:
+            log.info("Netlink uevents unavailable (%s), polling drives instead", e)
+            return None
+
+    def run(self):
+        sock = self._open_netlink()
+        # Polled on schedule however many unrelated uevents arrive meanwhile
+        next_poll = time.monotonic() + self.poll_interval
+        try:
+            while not self.stop_event.is_set():
+                timeout = max(next_poll - time.monotonic(), 0)
+                if sock is not None:
+                    readable, _, _ = select.select([sock], [], [], timeout)
+                    if readable:
+                        self.handle_uevent(parse_uevent(sock.recv(65536)))
+                else:
+                    self.stop_event.wait(timeout)
+                if time.monotonic() >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + self.poll_interval
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='device-monitor', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
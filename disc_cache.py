@@ -0,0 +1,150 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+
+def default_cache_dir():
+    """Pick a writable directory for WebCD's persistent caches"""
+    # Explicit override first, then systemd's CacheDirectory=, then XDG
+    cache_dir = os.environ.get('WEBCD_CACHE_DIR') or os.environ.get('CACHE_DIRECTORY')
+    if not cache_dir:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(base, 'webcd')
+    return cache_dir
+
+
+class DiscCache:
+    """Persistent SQLite cache of disc TOC, track list and album info keyed by disc ID.
+
+    Entries expire after ``ttl`` seconds unless they were set manually via
+    /api/set-album, and the table is bounded to ``max_entries`` rows with the
+    least recently used discs evicted first.
+    """
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600, max_entries=1000):
+        if path is None:
+            path = os.path.join(default_cache_dir(), 'discs.sqlite3')
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS discs (
+                disc_id TEXT PRIMARY KEY,
+                toc TEXT,
+                tracks TEXT NOT NULL,
+                album TEXT,
+                manual INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        ''')
+        self.db.commit()
+
+    def get(self, disc_id):
+        """Return the cached entry for a disc ID, or None on a miss"""
+        if not disc_id:
+            return None
+
+        with self.lock:
+            row = self.db.execute(
+                'SELECT toc, tracks, album, manual, created FROM discs WHERE disc_id = ?',
+                (disc_id,)
+            ).fetchone()
+
+            now = time.time()
+            if row is None or (not row[3] and now - row[4] > self.ttl):
+                if row is not None:
+                    self.db.execute('DELETE FROM discs WHERE disc_id = ?', (disc_id,))
+                    self.db.commit()
+                self.misses += 1
+                return None
+
+            self.db.execute('UPDATE discs SET accessed = ? WHERE disc_id = ?', (now, disc_id))
+            self.db.commit()
+            self.hits += 1
+
+        return {
+            'disc_id': disc_id,
+            'toc': json.loads(row[0]) if row[0] else None,
+            'tracks': json.loads(row[1]),
+            'album': json.loads(row[2]) if row[2] else None,
+            'manual': bool(row[3])
+        }
+
+    def put(self, disc_id, tracks, album=None, toc=None, manual=False):
+        """Store (or replace) the entry for a disc ID"""
+        if not disc_id:
+            return
+
+        now = time.time()
+        with self.lock:
+            # Never let an automatic lookup overwrite a manual override
+            if not manual:
+                row = self.db.execute(
+                    'SELECT manual FROM discs WHERE disc_id = ?', (disc_id,)
+                ).fetchone()
+                if row and row[0]:
+                    return
+
+            self.db.execute(
+                'INSERT OR REPLACE INTO discs (disc_id, toc, tracks, album, manual, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (disc_id,
+                 json.dumps(toc) if toc is not None else None,
+                 json.dumps(tracks),
+                 json.dumps(album) if album is not None else None,
+                 1 if manual else 0,
+                 now, now)
+            )
+            self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now):
+        """Drop expired entries, then the least recently used beyond max_entries"""
+        self.db.execute('DELETE FROM discs WHERE manual = 0 AND created < ?', (now - self.ttl,))
+        count = self.db.execute('SELECT COUNT(*) FROM discs').fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            # Automatic entries go before manual overrides
+            self.db.execute(
+                'DELETE FROM discs WHERE disc_id IN '
+                '(SELECT disc_id FROM discs ORDER BY manual ASC, accessed ASC LIMIT ?)',
+                (excess,)
+            )
+
+    def invalidate(self, disc_id=None):
+        """Forget one disc, or everything when no disc ID is given"""
+        with self.lock:
+            if disc_id:
+                self.db.execute('DELETE FROM discs WHERE disc_id = ?', (disc_id,))
+            else:
+                self.db.execute('DELETE FROM discs')
+            self.db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self.lock:
+            entries = self.db.execute('SELECT COUNT(*) FROM discs').fetchone()[0]
+            manual = self.db.execute('SELECT COUNT(*) FROM discs WHERE manual = 1').fetchone()[0]
+            hits, misses = self.hits, self.misses
+
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'entries': entries,
+            'manual_entries': manual,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'path': self.path
+        }
@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from disc_cache import default_cache_dir
+from pcm_cache import BYTES_PER_SECTOR, BYTES_PER_SECOND
+from cdtoc import FRAMES_PER_SECOND
+
+log = logging.getLogger('webcd.images')
+
+# Files of a captured disc, in <archive>/<disc ID>/
+IMAGE_NAME = 'disc.bin'
+SHEET_NAME = 'disc.cue'
+INFO_NAME = 'disc.json'
+
+
+def msf(sectors):
+    """Sectors -> CUE sheet "mm:ss:ff" """
+    seconds, frames = divmod(sectors, FRAMES_PER_SECOND)
+    return f'{seconds // 60:02d}:{seconds % 60:02d}:{frames:02d}'
+
+
+def quote(value):
+    """A CUE sheet string: double quotes are not allowed inside one"""
+    return '"' + str(value).replace('"', "'").replace('\n', ' ') + '"'
+
+
+def cue_sheet(toc, tracks, first_sector, track_info=(), album=None):
+    """CUE sheet of an image holding ``tracks`` of ``toc`` from LBA ``first_sector`` on"""
+    titles = {info.get('number'): info.get('title') for info in track_info}
+    lines = [f'REM DISCID {toc.freedb_id().upper()}', 'REM COMMENT "WebCD"']
+    if album:
+        if album.get('artist'):
+            lines.append(f"PERFORMER {quote(album['artist'])}")
+        if album.get('album'):
+            lines.append(f"TITLE {quote(album['album'])}")
+    lines.append(f'FILE "{IMAGE_NAME}" BINARY')
+    for number in tracks:
+        lines.append(f'  TRACK {number:02d} AUDIO')
+        if titles.get(number):
+            lines.append(f'    TITLE {quote(titles[number])}')
+        lines.append(f'    INDEX 01 {msf(toc.track_sectors(number)[0] - first_sector)}')
+    return '\n'.join(lines) + '\n'
+
+
+class ImageArchive:
+    """Discs captured to BIN/CUE images: <directory>/<disc ID>/disc.bin, disc.cue and disc.json
+
+    disc.json holds the disc's exact TOC and its track list and album info,
+    so an image is served under the disc's own ID and metadata, without
+    the drive and without lookups (see sources.ImageSource).
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.environ.get('WEBCD_IMAGE_DIR') or os.path.join(default_cache_dir(), 'images')
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def disc_dir(self, disc_id):
+        return os.path.join(self.directory, disc_id)
+
+    def get(self, disc_id):
+        """Directory of a disc's complete image, or None"""
+        if not disc_id:
+            return None
+        path = self.disc_dir(disc_id)
+        # The sheet is written last
+        return path if os.path.exists(os.path.join(path, SHEET_NAME)) else None
+
+    def list(self):
+        """Directories of all complete images"""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError:
+            return []
+        return [self.disc_dir(name) for name in names if self.get(name)]
+
+    def info(self, disc_id):
+        """What disc.json says about a captured disc, or None"""
+        try:
+            with open(os.path.join(self.disc_dir(disc_id), INFO_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def summary(self):
+        """Short description of every image, for /api/image"""
+        images = []
+        for path in self.list():
+            info = self.info(os.path.basename(path)) or {}
+            album = info.get('album') or {}
+            images.append({
+                'disc_id': os.path.basename(path),
+                'artist': album.get('artist'),
+                'album': album.get('album'),
+                'tracks': len(info.get('tracks') or []),
+                'bytes': info.get('sectors', 0) * BYTES_PER_SECTOR,
+                'captured': info.get('captured'),
+            })
+        return images
+
+
+class CaptureJob:
+    """Captures a whole disc to a BIN/CUE image in one sequential read.
+
+    The drive reads every audio track back to back into disc.bin, with no
+    seeks between tracks; disc.json gets the TOC and the track list and
+    album info known when the read ends (lookups run during the read).
+    The files are written under temporary names and the sheet is renamed
+    into place last, so a cancelled or failed capture leaves no image.
+    """
+
+    def __init__(self, player, archive, on_progress=None, on_done=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.device = player.cd_device
+        self.device_id = player.device_id
+        self.disc_id = player.disc_id
+        self.toc = player.toc
+        self.player = player
+        self.archive = archive
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.tracks = self.toc.audio_tracks()
+        # Every audio track, from the first one's start to the last one's end
+        self.first_sector = self.toc.track_sectors(self.tracks[0])[0]
+        last_start, last_length = self.toc.track_sectors(self.tracks[-1])
+        self.sectors_total = last_start + last_length - self.first_sector
+
+        self.state = 'queued'
+        self.error = None
+        self.cancelled = False
+        self.sectors_read = 0
+        self.started = None
+        self.finished = None
+
+    @property
+    def path(self):
+        return self.archive.disc_dir(self.disc_id)
+
+    def to_dict(self):
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0
+        return {
+            'id': self.id,
+            'device': self.device,
+            'device_id': self.device_id,
+            'disc_id': self.disc_id,
+            'state': self.state,
+            'error': self.error,
+            'tracks': self.tracks,
+            'read_progress': round(self.sectors_read / self.sectors_total, 3) if self.sectors_total else 1.0,
+            # Read speed as a multiple of real time
+            'speed': round(self.sectors_read * BYTES_PER_SECTOR / elapsed / BYTES_PER_SECOND, 1) if elapsed else 0,
+            'elapsed': round(elapsed, 1)
+        }
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _set_state(self, state):
+        self.state = state
+        if self.on_progress:
+            self.on_progress(self)
+
+    def run(self):
+        self.started = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        parts = {name: os.path.join(self.path, name + '.part') for name in (IMAGE_NAME, INFO_NAME, SHEET_NAME)}
+        try:
+            self._set_state('reading')
+            player = self.player
+            # The drive itself, also when the player serves an older image of this disc
+            chunks = player.source.read(self.first_sector, self.sectors_total, chunk_size=player.chunk_size,
+                                        paranoia_mode=player.stream_settings['paranoia_mode'])
+            size = self.sectors_total * BYTES_PER_SECTOR
+            written = 0
+            last_progress = time.monotonic()
+            try:
+                with open(parts[IMAGE_NAME], 'wb') as f:
+                    for data in chunks:
+                        if self.cancelled:
+                            raise InterruptedError('Capture cancelled')
+                        data = data[:size - written]
+                        f.write(data)
+                        written += len(data)
+                        self.sectors_read = written // BYTES_PER_SECTOR
+                        if self.on_progress and time.monotonic() - last_progress >= 1:
+                            last_progress = time.monotonic()
+                            self.on_progress(self)
+                        if written >= size:
+                            break
+            finally:
+                chunks.close()
+            if written < size:
+                raise OSError(f'Drive returned {written} of {size} bytes')
+
+            # Metadata as the player knows it now, if it still has this disc
+            same_disc = player.disc_id == self.disc_id
+            track_info = player.track_info if same_disc else []
+            album = player.album_info if same_disc else None
+            info = {
+                'disc_id': self.disc_id,
+                'musicbrainz_id': self.toc.musicbrainz_id(),
+                'cd_discid': self.toc.cd_discid_output(),
+                'toc': self.toc.to_dict(),
+                'first_sector': self.first_sector,
+                'sectors': self.sectors_total,
+                'tracks': track_info,
+                'album': album,
+                'device': self.device,
+                'captured': time.time(),
+            }
+            with open(parts[INFO_NAME], 'w') as f:
+                json.dump(info, f, indent=2)
+            with open(parts[SHEET_NAME], 'w') as f:
+                f.write(cue_sheet(self.toc, self.tracks, self.first_sector, track_info, album))
+            for name in (IMAGE_NAME, INFO_NAME, SHEET_NAME):
+                os.replace(parts[name], os.path.join(self.path, name))
+            self.finished = time.time()
+            log.info("Captured disc %s to %s", self.disc_id, self.path,
+                     extra={'device': self.device, 'seconds': round(self.finished - self.started, 1)})
+            self._set_state('done')
+            if self.on_done:
+                self.on_done(self)
+        except Exception as e:
+            self.error = str(e)
+            self.finished = time.time()
+            self._set_state('cancelled' if self.cancelled else 'failed')
+        finally:
+            for part in parts.values():
+                if os.path.exists(part):
+                    os.unlink(part)
+
+
+class CaptureManager:
+    """Runs image captures, one per drive at a time"""
+
+    def __init__(self, archive, on_progress=None, on_done=None):
+        self.archive = archive
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, player):
+        """Start capturing the disc in ``player``'s drive, or return the capture already running there"""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.device == player.cd_device and job.state in ('queued', 'reading'):
+                    return job
+            job = CaptureJob(player, self.archive, on_progress=self.on_progress, on_done=self.on_done)
+            self.jobs[job.id] = job
+        threading.Thread(target=job.run, name=f'capture-{job.id}', daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
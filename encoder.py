@@ -0,0 +1,86 @@
+try:
+    import av
+except ImportError:  # PyAV is optional; without it streams are encoded by ffmpeg
+    av = None
+
+# Stream format -> (container format, codec)
+FORMATS = {
+    'mp3': ('mp3', 'libmp3lame'),
+    'flac': ('flac', 'flac'),
+    'wav': ('wav', 'pcm_s16le'),
+}
+
+
+def available(fmt):
+    """True if ``fmt`` can be encoded in-process"""
+    return av is not None and fmt in FORMATS
+
+
+def parse_bitrate(bitrate):
+    """'192k' -> 192000"""
+    bitrate = str(bitrate).lower()
+    if bitrate.endswith('k'):
+        return int(bitrate[:-1]) * 1000
+    return int(bitrate)
+
+
+class _Output:
+    """Write-only file object collecting what the muxer produces"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def encode_pcm(chunks, fmt, bitrate='192k'):
+    """Encode raw CD PCM chunks (16 bit stereo, 44.1 kHz) with PyAV, yielding encoded bytes.
+
+    Output is the same as ffmpeg writing the format to a pipe, so a FLAC
+    or WAV header carries no total length.
+    """
+    container_format, codec = FORMATS[fmt]
+    output = _Output()
+    container = av.open(output, mode='w', format=container_format)
+    try:
+        stream = container.add_stream(codec, rate=44100, layout='stereo')
+        if fmt == 'mp3':
+            stream.bit_rate = parse_bitrate(bitrate)
+
+        pts = 0
+        remainder = b''
+        for chunk in chunks:
+            if remainder:
+                chunk = remainder + chunk
+            # Frames hold whole samples (4 bytes each)
+            usable = len(chunk) - len(chunk) % 4
+            chunk, remainder = chunk[:usable], chunk[usable:]
+            if not chunk:
+                continue
+            samples = len(chunk) // 4
+            frame = av.AudioFrame(format='s16', layout='stereo', samples=samples)
+            frame.planes[0].update(chunk)
+            frame.sample_rate = 44100
+            frame.pts = pts
+            pts += samples
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            data = output.take()
+            if data:
+                yield data
+
+        # Flush the encoder's buffered samples
+        for packet in stream.encode(None):
+            container.mux(packet)
+    finally:
+        container.close()
+    data = output.take()
+    if data:
+        yield data
@@ -0,0 +1,169 @@
+import logging
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+log = logging.getLogger('webcd.encoder_pool')
+
+# ffmpeg reading raw CD PCM from stdin; the output options and '-' follow
+INPUT_ARGS = ['-f', 's16le', '-ar', '44100', '-ac', '2', '-i', '-']
+# Longest wait for a new encoder to block on its empty stdin
+READY_TIMEOUT = 10
+
+
+def wait_ready(process, timeout=READY_TIMEOUT):
+    """Wait until ``process`` sleeps reading a pipe (its stdin), as far as /proc tells"""
+    deadline = time.monotonic() + timeout
+    while process.poll() is None and time.monotonic() < deadline:
+        try:
+            with open(f'/proc/{process.pid}/wchan') as f:
+                if 'pipe' in f.read():
+                    return
+        except OSError:
+            # No /proc: the time to start the process is all that can be measured
+            return
+        time.sleep(0.005)
+
+
+class EncoderPool:
+    """Keeps idle ffmpeg encoders running so a stream does not wait for one to start.
+
+    Encoders are keyed by their output options (format, bitrate, ...) and
+    sit blocked on an empty stdin until a stream takes one and feeds it PCM.
+    Every acquire starts a replacement in the background, so ``size``
+    encoders per key stay warm; the least recently used keys beyond
+    ``max_keys`` are shut down. With ``size=0`` every stream starts its own.
+
+    ``stats()`` reports the idle encoders, how long pool encoders took from
+    start until they waited for input (spawn), and how long streams waited
+    for an encoder: nothing on a warm hit, a process start on a cold one.
+    """
+
+    def __init__(self, size=1, max_keys=4, ffmpeg='ffmpeg'):
+        self.size = size
+        self.max_keys = max_keys
+        self.ffmpeg = ffmpeg
+        self.idle = OrderedDict()  # output options -> [Popen], least recently used first
+        self.refilling = set()
+        self.lock = threading.Lock()
+        self.spawned = 0
+        self.spawn_seconds = 0.0
+        self.last_spawn_seconds = 0.0
+        self.spawn_errors = 0
+        self.warm_hits = 0
+        self.cold_starts = 0
+        self.wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+
+    def command(self, output_args):
+        return [self.ffmpeg, '-loglevel', 'quiet'] + INPUT_ARGS + list(output_args) + ['-']
+
+    def _spawn(self, key):
+        return metrics.popen(self.command(key), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL)
+
+    def acquire(self, output_args):
+        """An ffmpeg process encoding stdin with ``output_args`` to stdout, warm if one is idle"""
+        key = tuple(output_args)
+        start = time.monotonic()
+        process = None
+        with self.lock:
+            idle = self.idle.get(key, [])
+            while idle and process is None:
+                candidate = idle.pop()
+                if candidate.poll() is None:
+                    process = candidate
+            if key in self.idle:
+                self.idle.move_to_end(key)
+        warm = process is not None
+        if not warm:
+            process = self._spawn(key)
+        wait = time.monotonic() - start
+        with self.lock:
+            if warm:
+                self.warm_hits += 1
+            else:
+                self.cold_starts += 1
+            self.wait_seconds += wait
+            self.last_wait_seconds = wait
+        self.warm(output_args)
+        return process
+
+    def warm(self, output_args):
+        """Start idle encoders for ``output_args`` in the background, up to the pool size"""
+        key = tuple(output_args)
+        if shutil.which(self.ffmpeg) is None:
+            # Nothing to keep warm; streams report the missing ffmpeg themselves
+            return
+        with self.lock:
+            if self.size <= 0 or key in self.refilling:
+                return
+            self.refilling.add(key)
+        threading.Thread(target=self._refill, args=(key,), name='encoder-pool', daemon=True).start()
+
+    def _refill(self, key):
+        try:
+            while True:
+                with self.lock:
+                    idle = self.idle.setdefault(key, [])
+                    self.idle.move_to_end(key)
+                    if len(idle) >= self.size:
+                        break
+                start = time.monotonic()
+                process = self._spawn(key)
+                wait_ready(process)
+                elapsed = time.monotonic() - start
+                with self.lock:
+                    self.spawned += 1
+                    self.spawn_seconds += elapsed
+                    self.last_spawn_seconds = elapsed
+                    self.idle.setdefault(key, []).append(process)
+            self._trim()
+        except OSError as e:
+            with self.lock:
+                self.spawn_errors += 1
+            log.error("Cannot start ffmpeg: %s", e)
+        finally:
+            with self.lock:
+                self.refilling.discard(key)
+
+    def _trim(self):
+        """Shut down the encoders of the least recently used keys beyond max_keys"""
+        stale = []
+        with self.lock:
+            while len(self.idle) > self.max_keys:
+                _, processes = self.idle.popitem(last=False)
+                stale.extend(processes)
+        for process in stale:
+            process.kill()
+            process.wait()
+
+    def close(self):
+        with self.lock:
+            processes = [p for idle in self.idle.values() for p in idle]
+            self.idle.clear()
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    def stats(self):
+        with self.lock:
+            requests = self.warm_hits + self.cold_starts
+            return {
+                'size': self.size,
+                'idle': sum(len(idle) for idle in self.idle.values()),
+                'keys': [' '.join(key) for key in self.idle],
+                'spawned': self.spawned,
+                'spawn_errors': self.spawn_errors,
+                'spawn_ms_avg': round(self.spawn_seconds / self.spawned * 1000, 2) if self.spawned else 0.0,
+                'spawn_ms_last': round(self.last_spawn_seconds * 1000, 2),
+                'warm_hits': self.warm_hits,
+                'cold_starts': self.cold_starts,
+                'warm_hit_rate': round(self.warm_hits / requests, 3) if requests else 0.0,
+                'wait_ms_avg': round(self.wait_seconds / requests * 1000, 2) if requests else 0.0,
+                'wait_ms_last': round(self.last_wait_seconds * 1000, 2)
+            }
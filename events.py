@@ -0,0 +1,68 @@
+import json
+import queue
+import threading
+
+
+class EventBus:
+    """In-process publish/subscribe hub that feeds the /api/events SSE stream.
+
+    Each subscriber gets its own bounded queue; a client that stops reading
+    only loses its own events and never blocks the publisher.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def publish(self, event, data):
+        """Send an event to every subscriber"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait((event, data))
+            except queue.Full:
+                # Slow client: drop the event rather than stall the producer
+                pass
+
+    def stream(self, keepalive=15, initial=()):
+        """Generator of Server-Sent Events for one client.
+
+        ``initial`` is a list of (event, data) pairs sent before any live
+        events, so a new client starts from the current state.
+        """
+        q = self.subscribe()
+        try:
+            # Tell the browser how long to wait before reconnecting
+            yield 'retry: 3000\n\n'
+            for event, data in initial:
+                yield self.format(event, data)
+            while True:
+                try:
+                    event, data = q.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                yield self.format(event, data)
+        finally:
+            self.unsubscribe(q)
+
+    @staticmethod
+    def format(event, data):
+        return f'event: {event}\ndata: {json.dumps(data)}\n\n'
@@ -0,0 +1,182 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+import metrics
+from disc_cache import default_cache_dir
+from encoder import parse_bitrate
+from pcm_cache import feed_pcm
+
+log = logging.getLogger('webcd.hls')
+
+# Segment length; shorter gives finer seeking, longer fewer requests
+SEGMENT_SECONDS = 6
+# How long a request waits for the segmenter to write the file it wants
+FILE_TIMEOUT = 30
+# Written once every rendition of a track is finished; holds the bitrates
+COMPLETE_MARKER = 'complete'
+
+SEGMENT_NAME = re.compile(r'^seg\d{5}\.ts$')
+
+
+class HLSCache:
+    """HLS renditions of tracks (AAC in MPEG-TS), encoded once and kept on disk.
+
+    One ffmpeg process per track reads the track's PCM once and writes every
+    bitrate's playlist and segments to <directory>/<disc ID>/<NN>/<bitrate>/.
+    Requests for files that are not written yet wait for the segmenter, so
+    playback can start after the first segment. Finished tracks are evicted,
+    least recently played first, once the cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, directory=None, bitrates=('64k', '128k', '256k'), max_bytes=1024 ** 3,
+                 segment_seconds=SEGMENT_SECONDS):
+        if directory is None:
+            directory = os.environ.get('WEBCD_HLS_CACHE_DIR') or os.path.join(default_cache_dir(), 'hls')
+        self.directory = directory
+        self.bitrates = list(bitrates)
+        self.max_bytes = max_bytes
+        self.segment_seconds = segment_seconds
+        self.jobs = {}  # (disc ID, track) -> segmenter thread
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def track_dir(self, disc_id, track):
+        return os.path.join(self.directory, disc_id, f'{track:02d}')
+
+    def is_complete(self, disc_id, track):
+        try:
+            with open(os.path.join(self.track_dir(disc_id, track), COMPLETE_MARKER)) as f:
+                return f.read() == ','.join(self.bitrates)
+        except OSError:
+            return False
+
+    def is_running(self, disc_id, track):
+        with self.lock:
+            return (disc_id, track) in self.jobs
+
+    def ensure(self, disc_id, track, pcm_factory):
+        """Start segmenting a track from ``pcm_factory()`` unless it is done or in progress"""
+        key = (disc_id, track)
+        if self.is_complete(disc_id, track):
+            # Mark as recently played for eviction
+            os.utime(os.path.join(self.track_dir(disc_id, track), COMPLETE_MARKER))
+            return
+        with self.lock:
+            if key in self.jobs:
+                return
+            thread = threading.Thread(target=self._run, args=(key, pcm_factory()),
+                                      name=f'hls-{disc_id}-{track}', daemon=True)
+            self.jobs[key] = thread
+        self._evict()
+        thread.start()
+
+    def _run(self, key, pcm):
+        track_dir = self.track_dir(*key)
+        finished = []
+
+        def source():
+            yield from pcm
+            finished.append(True)
+
+        # Leftovers of an interrupted run or of other bitrates
+        shutil.rmtree(track_dir, ignore_errors=True)
+        os.makedirs(track_dir)
+        cmd = ['ffmpeg', '-loglevel', 'error', '-f', 's16le', '-ar', '44100', '-ac', '2', '-i', '-']
+        for _ in self.bitrates:
+            cmd.extend(['-map', '0:a'])
+        cmd.extend(['-c:a', 'aac'])
+        for i, bitrate in enumerate(self.bitrates):
+            cmd.extend([f'-b:a:{i}', bitrate])
+        cmd.extend([
+            '-f', 'hls',
+            '-hls_time', str(self.segment_seconds),
+            # Growing playlists while encoding, closed with ENDLIST at the end
+            '-hls_playlist_type', 'event',
+            # Files only appear once they are completely written
+            '-hls_flags', 'temp_file',
+            '-var_stream_map', ' '.join(f'a:{i},name:{b}' for i, b in enumerate(self.bitrates)),
+            '-hls_segment_filename', os.path.join(track_dir, '%v', 'seg%05d.ts'),
+            os.path.join(track_dir, '%v', 'index.m3u8')
+        ])
+        try:
+            process = metrics.popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE)
+            feeder = threading.Thread(target=feed_pcm, args=(source(), process.stdin),
+                                      name=f'hls-feed-{key[1]}', daemon=True)
+            feeder.start()
+            # Not communicate(): that would close stdin under the feeder
+            errors = process.stderr.read()
+            process.wait()
+            feeder.join()
+            if process.returncode != 0:
+                raise RuntimeError(errors.decode(errors='replace').strip() or f'exit status {process.returncode}')
+            if not finished:
+                raise RuntimeError('the PCM source ended early')
+            with open(os.path.join(track_dir, COMPLETE_MARKER), 'w') as f:
+                f.write(','.join(self.bitrates))
+        except Exception as e:
+            log.error("HLS segmenting of %s failed: %s", key, e)
+            shutil.rmtree(track_dir, ignore_errors=True)
+        finally:
+            with self.lock:
+                self.jobs.pop(key, None)
+
+    def master_playlist(self):
+        """Master playlist listing one rendition per bitrate"""
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+        for bitrate in self.bitrates:
+            # Bandwidth includes about 10% MPEG-TS overhead
+            lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={parse_bitrate(bitrate) * 11 // 10},'
+                         f'CODECS="mp4a.40.2"')
+            lines.append(f'{bitrate}/index.m3u8')
+        return '\n'.join(lines) + '\n'
+
+    def wait_for(self, disc_id, track, bitrate, name, timeout=FILE_TIMEOUT):
+        """Path of a rendition's playlist or segment once it exists, or None"""
+        if bitrate not in self.bitrates or not (name == 'index.m3u8' or SEGMENT_NAME.match(name)):
+            return None
+        path = os.path.join(self.track_dir(disc_id, track), bitrate, name)
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(path):
+            if not self.is_running(disc_id, track) or time.monotonic() > deadline:
+                return path if os.path.exists(path) else None
+            time.sleep(0.1)
+        return path
+
+    def _evict(self):
+        """Remove finished tracks, least recently played first, while over max_bytes"""
+        finished = []
+        total = 0
+        for disc_id in os.listdir(self.directory):
+            disc_dir = os.path.join(self.directory, disc_id)
+            if not os.path.isdir(disc_dir):
+                continue
+            for name in os.listdir(disc_dir):
+                track_dir = os.path.join(disc_dir, name)
+                size = sum(os.path.getsize(os.path.join(root, f))
+                           for root, _, files in os.walk(track_dir) for f in files)
+                total += size
+                marker = os.path.join(track_dir, COMPLETE_MARKER)
+                if os.path.exists(marker):
+                    finished.append((os.path.getmtime(marker), track_dir, size))
+        for _, track_dir, size in sorted(finished):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(track_dir, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            running = len(self.jobs)
+        return {
+            'bitrates': self.bitrates,
+            'segment_seconds': self.segment_seconds,
+            'segmenting': running,
+            'max_bytes': self.max_bytes,
+            'directory': self.directory
+        }
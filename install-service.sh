@@ -120,7 +120,7 @@ Group=cdrom
 WorkingDirectory=$INSTALL_DIR
 Environment="PATH=$INSTALL_DIR/venv/bin:/usr/local/bin:/usr/bin:/bin"
 Environment="PYTHONPATH=$INSTALL_DIR"
-ExecStart=$INSTALL_DIR/venv/bin/python $INSTALL_DIR/app.py
+ExecStart=$INSTALL_DIR/venv/bin/python $INSTALL_DIR/server.py
 Restart=always
 RestartSec=10
 
@@ -130,6 +130,7 @@ PrivateTmp=true
 ProtectSystem=strict
 ProtectHome=true
 ReadWritePaths=/tmp
+CacheDirectory=webcd
 ReadOnlyPaths=$INSTALL_DIR
 # Allow access to CD devices
 DeviceAllow=/dev/cdrom rw
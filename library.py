@@ -0,0 +1,303 @@
+import concurrent.futures
+import json
+import multiprocessing
+import operator
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from array import array
+
+try:
+    import numpy
+except ImportError:  # Optional; checksums fall back to pure Python
+    numpy = None
+
+import encoder
+from disc_cache import default_cache_dir
+from pcm_cache import BYTES_PER_SECTOR
+from streamio import read_chunks
+
+# AccurateRip ignores the first and last five sectors of a disc (drive offsets)
+ACCURATERIP_SKIP = 5 * 588
+# Samples per checksum step in the pure Python implementation
+CHECKSUM_BLOCK = 588 * 75
+
+# Formats a disc can be ripped to; FLAC is always kept as the lossless copy
+RIP_FORMATS = ('flac', 'mp3')
+
+
+def accuraterip_checksums(pcm, first_track=False, last_track=False):
+    """AccurateRip v1 and v2 checksums of one track's raw PCM, as 8 digit hex strings.
+
+    Each stereo sample is read as a little endian 32 bit word and weighted
+    by its 1-based position in the track. As in AccurateRip, the first 5
+    sectors (less one sample) of the disc's first track and the last 5
+    sectors of its last track are left out. No drive read offset is applied,
+    so the values only match the AccurateRip database for offset-0 drives.
+    """
+    count = len(pcm) // 4
+    start = ACCURATERIP_SKIP if first_track else 1
+    end = count - ACCURATERIP_SKIP if last_track else count
+    if end < start:
+        return '00000000', '00000000'
+
+    if numpy is not None:
+        samples = numpy.frombuffer(pcm, dtype='<u4', count=count)[start - 1:end].astype(numpy.uint64)
+        products = samples * numpy.arange(start, end + 1, dtype=numpy.uint64)
+        v1 = int(products.sum(dtype=numpy.uint64)) & 0xFFFFFFFF
+        v2 = (v1 + int((products >> numpy.uint64(32)).sum(dtype=numpy.uint64))) & 0xFFFFFFFF
+        return f'{v1:08x}', f'{v2:08x}'
+
+    samples = array('I')
+    samples.frombytes(pcm[:count * 4])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    total = high = 0
+    for block in range(start, end + 1, CHECKSUM_BLOCK):
+        block_end = min(block + CHECKSUM_BLOCK, end + 1)
+        products = list(map(operator.mul, samples[block - 1:block_end - 1], range(block, block_end)))
+        total += sum(products)
+        high += sum(map(operator.rshift, products, [32] * len(products)))
+    # v2 adds the high and low 32 bits of every product
+    v1 = total & 0xFFFFFFFF
+    v2 = (v1 + high) & 0xFFFFFFFF
+    return f'{v1:08x}', f'{v2:08x}'
+
+
+def encode_file(pcm_path, out_path, fmt, bitrate='192k', ffmpeg='ffmpeg'):
+    """Encode a raw PCM file to ``out_path``, in-process with PyAV if available"""
+    part_path = out_path + '.part'
+    if encoder.available(fmt):
+        with open(pcm_path, 'rb') as source, open(part_path, 'wb') as output:
+            for data in encoder.encode_pcm(read_chunks(source, 1024 * 1024), fmt, bitrate):
+                output.write(data)
+    else:
+        cmd = [ffmpeg, '-y', '-loglevel', 'error', '-f', 's16le', '-ar', '44100', '-ac', '2',
+               '-i', pcm_path]
+        if fmt == 'mp3':
+            cmd.extend(['-acodec', 'mp3', '-ab', bitrate])
+        else:
+            cmd.extend(['-acodec', 'flac', '-compression_level', '5'])
+        cmd.extend(['-f', fmt, part_path])
+        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE)
+    os.replace(part_path, out_path)
+
+
+def process_track(pcm_path, outputs, first_track, last_track):
+    """Pool worker: checksum one extracted track and encode it to each (fmt, bitrate, path)"""
+    with open(pcm_path, 'rb') as f:
+        v1, v2 = accuraterip_checksums(f.read(), first_track, last_track)
+    for fmt, bitrate, out_path in outputs:
+        encode_file(pcm_path, out_path, fmt, bitrate)
+    return {'accuraterip_v1': v1, 'accuraterip_v2': v2}
+
+
+class Library:
+    """Discs ripped to encoded files: <directory>/<disc ID>/NN.flac, NN-<bitrate>.mp3 and rip.json"""
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.environ.get('WEBCD_LIBRARY_DIR') or os.path.join(default_cache_dir(), 'library')
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def disc_dir(self, disc_id):
+        return os.path.join(self.directory, disc_id)
+
+    def path(self, disc_id, track, fmt, bitrate=None):
+        name = f'{track:02d}-{bitrate}.mp3' if fmt == 'mp3' else f'{track:02d}.{fmt}'
+        return os.path.join(self.disc_dir(disc_id), name)
+
+    def get(self, disc_id, track, fmt, bitrate=None):
+        """Path of a ripped track in ``fmt``, or None"""
+        if not disc_id or fmt not in RIP_FORMATS:
+            return None
+        path = self.path(disc_id, track, fmt, bitrate)
+        return path if os.path.exists(path) else None
+
+    def manifest(self, disc_id):
+        """What was ripped from a disc (tracks, formats and checksums), or None"""
+        try:
+            with open(os.path.join(self.disc_dir(disc_id), 'rip.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_manifest(self, disc_id, manifest):
+        path = os.path.join(self.disc_dir(disc_id), 'rip.json')
+        with open(path + '.part', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + '.part', path)
+
+
+class RipJob:
+    """Rips a whole disc: one sequential read of all audio tracks, then parallel encoding.
+
+    The drive reads the tracks back to back in a single pass, without
+    seeking between them. Each track is cut from that stream by its TOC
+    length, written to a work file and handed to the process pool as soon
+    as it is complete, so encoding overlaps the read.
+    """
+
+    def __init__(self, player, tracks, formats, bitrate, library, pool, on_progress=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.device = player.cd_device
+        self.device_id = player.device_id
+        self.disc_id = player.disc_id
+        self.toc = player.toc
+        self.player = player
+        self.tracks = tracks
+        self.formats = formats
+        self.bitrate = bitrate
+        self.library = library
+        self.pool = pool
+        self.on_progress = on_progress
+
+        self.state = 'queued'
+        self.error = None
+        self.cancelled = False
+        self.futures = {}  # encoding future -> (track, work file)
+        self.sectors_total = sum(self.toc.track_sectors(t)[1] for t in tracks)
+        self.sectors_read = 0
+        self.tracks_encoded = 0
+        self.checksums = {}
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'device': self.device,
+            'device_id': self.device_id,
+            'disc_id': self.disc_id,
+            'state': self.state,
+            'error': self.error,
+            'tracks': self.tracks,
+            'formats': self.formats,
+            'bitrate': self.bitrate,
+            'read_progress': round(self.sectors_read / self.sectors_total, 3) if self.sectors_total else 1.0,
+            'tracks_encoded': self.tracks_encoded,
+            'checksums': {str(t): c for t, c in sorted(self.checksums.items())},
+            'elapsed': round((self.finished or time.time()) - self.started, 1) if self.started else 0
+        }
+
+    def cancel(self):
+        """Stop reading and drop tracks not yet being encoded"""
+        self.cancelled = True
+        for future in list(self.futures):
+            future.cancel()
+
+    def outputs(self, track):
+        return [(fmt, self.bitrate if fmt == 'mp3' else None,
+                 self.library.path(self.disc_id, track, fmt, self.bitrate if fmt == 'mp3' else None))
+                for fmt in self.formats]
+
+    def _set_state(self, state):
+        self.state = state
+        if self.on_progress:
+            self.on_progress(self)
+
+    def run(self):
+        self.started = time.time()
+        work_dir = os.path.join(self.library.disc_dir(self.disc_id), '.rip')
+        os.makedirs(work_dir, exist_ok=True)
+        audio_tracks = self.toc.audio_tracks()
+        try:
+            self._set_state('reading')
+            chunks = self.player.extract_pcm(self.tracks[0], last_track=self.tracks[-1])
+            try:
+                pending = b''
+                for track in self.tracks:
+                    size = self.toc.track_sectors(track)[1] * BYTES_PER_SECTOR
+                    pcm_path = os.path.join(work_dir, f'{track:02d}.pcm')
+                    with open(pcm_path, 'wb') as f:
+                        written = 0
+                        while written < size:
+                            if self.cancelled:
+                                raise InterruptedError('Rip cancelled')
+                            data = pending or next(chunks, b'')
+                            if not data:
+                                raise OSError(f'Drive returned {written} of {size} bytes of track {track}')
+                            data, pending = data[:size - written], data[size - written:]
+                            f.write(data)
+                            written += len(data)
+                            self.sectors_read += len(data) // BYTES_PER_SECTOR
+                    future = self.pool.submit(process_track, pcm_path, self.outputs(track),
+                                              track == audio_tracks[0], track == audio_tracks[-1])
+                    self.futures[future] = (track, pcm_path)
+                    if self.on_progress:
+                        self.on_progress(self)
+            finally:
+                chunks.close()
+
+            self._set_state('encoding')
+            for future in concurrent.futures.as_completed(self.futures):
+                track, pcm_path = self.futures[future]
+                self.checksums[track] = future.result()
+                os.unlink(pcm_path)
+                self.tracks_encoded += 1
+                if self.on_progress:
+                    self.on_progress(self)
+
+            manifest = self.library.manifest(self.disc_id) or {'disc_id': self.disc_id, 'tracks': {}}
+            # Lets the directory be served as the disc itself (sources.FlacDirSource)
+            manifest['toc'] = self.toc.to_dict()
+            for track in self.tracks:
+                entry = manifest['tracks'].setdefault(str(track), {})
+                entry.update(self.checksums[track])
+                entry['sectors'] = self.toc.track_sectors(track)[1]
+                entry['formats'] = sorted(set(entry.get('formats', [])) | {
+                    fmt if fmt != 'mp3' else f'mp3-{self.bitrate}' for fmt in self.formats})
+            self.library.save_manifest(self.disc_id, manifest)
+            self.finished = time.time()
+            self._set_state('done')
+        except Exception as e:
+            for future in self.futures:
+                future.cancel()
+            self.error = str(e)
+            self.finished = time.time()
+            self._set_state('cancelled' if self.cancelled else 'failed')
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class RipManager:
+    """Runs rip jobs (one per drive at a time) and shares one encoding process pool between them"""
+
+    def __init__(self, library, workers=None, on_progress=None):
+        self.library = library
+        self.workers = workers or os.cpu_count() or 1
+        self.on_progress = on_progress
+        self.jobs = {}
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def start(self, player, formats, bitrate):
+        """Start ripping the disc in ``player``'s drive, or return the rip already running there"""
+        with self.lock:
+            for job in self.jobs.values():
+                if job.device == player.cd_device and job.state in ('queued', 'reading', 'encoding'):
+                    return job
+            if self.pool is None:
+                # Started from a request thread of a gevent-patched worker: forking
+                # that would hand the encoders its monkey-patched modules and hub
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            job = RipJob(player, player.toc.audio_tracks(), formats, bitrate, self.library, self.pool,
+                         on_progress=self.on_progress)
+            self.jobs[job.id] = job
+        threading.Thread(target=job.run, name=f'rip-{job.id}', daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
@@ -0,0 +1,163 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+# Records waiting for the writer thread; beyond this they are dropped
+# rather than blocking the thread that logged them
+QUEUE_SIZE = 10000
+# Per-chunk stream events: one in this many is logged
+DEFAULT_SAMPLE_EVERY = 100
+# Logger of events that happen for every chunk of every stream
+CHUNK_LOGGER = 'webcd.stream.chunks'
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+STANDARD_ATTRIBUTES = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+
+def fields(record):
+    """The structured fields passed to a log call in ``extra``"""
+    return {key: value for key, value in record.__dict__.items() if key not in STANDARD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """``time LEVEL logger: message key=value ...``"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        extra = fields(record)
+        if extra:
+            line += ' ' + ' '.join(f'{key}={value!r}' if isinstance(value, str) and ' ' in value
+                                   else f'{key}={value}' for key, value in extra.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread, dropping them when its queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class Sampler(logging.Filter):
+    """Lets one in ``every`` records of each message through, marked with ``sampled``"""
+
+    def __init__(self, every=DEFAULT_SAMPLE_EVERY):
+        super().__init__()
+        self.every = max(int(every), 1)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        with self.lock:
+            count = self.counts.get(record.msg, 0)
+            self.counts[record.msg] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class LogSystem:
+    """The ``webcd`` loggers' queue, writer thread and handlers.
+
+    A log call only merges its message and puts the record on a bounded
+    queue; a background listener writes the records to stderr (the journal
+    under systemd) and, with ``path``, to a size-rotated file. Records
+    logged while the queue is full are dropped and counted.
+    """
+
+    def __init__(self, level='INFO', path=None, max_bytes=10 * 1024 * 1024, backups=3,
+                 fmt='text', sample_every=DEFAULT_SAMPLE_EVERY):
+        formatter = JSONFormatter() if fmt == 'json' else TextFormatter()
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if path:
+            handlers.append(logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.path = path
+        self.format = fmt
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers,
+                                                       respect_handler_level=True)
+        self.sampler = Sampler(sample_every)
+        self.logger = logging.getLogger('webcd')
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(level)
+        # Not also to the root logger's handlers
+        self.logger.propagate = False
+        logging.getLogger(CHUNK_LOGGER).addFilter(self.sampler)
+        self.listener.start()
+
+    def set_level(self, level, name='webcd'):
+        """Set a ``webcd`` logger's level (a name such as DEBUG); ValueError if unknown"""
+        if name != 'webcd' and not name.startswith('webcd.'):
+            raise ValueError(f'Not a WebCD logger: {name}')
+        if not isinstance(logging.getLevelName(str(level).upper()), int):
+            raise ValueError(f'Unknown log level: {level}')
+        logging.getLogger(name).setLevel(str(level).upper())
+
+    def set_sample_every(self, every):
+        self.sampler.every = max(int(every), 1)
+
+    def levels(self):
+        """Levels set on the ``webcd`` loggers"""
+        levels = {'webcd': logging.getLevelName(self.logger.level)}
+        for name in sorted(logging.root.manager.loggerDict):
+            logger = logging.getLogger(name)
+            if name.startswith('webcd.') and logger.level != logging.NOTSET:
+                levels[name] = logging.getLevelName(logger.level)
+        return levels
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'sample_every': self.sampler.every,
+        }
+
+    def close(self):
+        self.listener.stop()
+
+
+def from_environment():
+    """A LogSystem configured by the WEBCD_LOG_* variables"""
+    return LogSystem(
+        level=os.environ.get('WEBCD_LOG_LEVEL', 'INFO').upper(),
+        path=os.environ.get('WEBCD_LOG_FILE') or None,
+        max_bytes=int(float(os.environ.get('WEBCD_LOG_MAX_MB', '10')) * 1024 * 1024),
+        backups=int(os.environ.get('WEBCD_LOG_BACKUPS', '3')),
+        fmt=os.environ.get('WEBCD_LOG_FORMAT', 'text'),
+        sample_every=int(os.environ.get('WEBCD_LOG_SAMPLE', DEFAULT_SAMPLE_EVERY)),
+    )
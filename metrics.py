@@ -0,0 +1,273 @@
+import os
+import subprocess
+import threading
+import time
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds: from a millisecond process spawn up to a slow drive spin-up
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bytes per second; CD audio plays at 176400
+THROUGHPUT_BUCKETS = (16000, 32000, 64000, 176400, 352800, 705600, 1411200, 4000000, 16000000, 64000000)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with one series per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series = {}  # label values -> value (or histogram state)
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return tuple('' if labels[name] is None else str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(name suffix, label pairs, value) of every series"""
+        with self.lock:
+            series = dict(self.series)
+        for values, value in sorted(series.items()):
+            yield '', tuple(zip(self.labelnames, values)), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            state = self.series.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, sum
+                state = self.series[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+
+    def samples(self):
+        with self.lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        for values, (counts, total) in sorted(series.items()):
+            labels = tuple(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', labels + (('le', format_value(float(bound))),), cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class Registry:
+    """The metrics of this process, rendered in the Prometheus text format.
+
+    Collectors are functions returning ``{section: stats dict}`` (the
+    components' own stats(), as /api/cache-stats shows them); their numeric
+    values are exported as untyped ``<prefix>_<section>_<key>`` samples.
+    """
+
+    def __init__(self, prefix='webcd'):
+        self.prefix = prefix
+        self.metrics = []
+        self.collectors = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.add(Counter(f'{self.prefix}_{name}', documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.add(Gauge(f'{self.prefix}_{name}', documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.add(Histogram(f'{self.prefix}_{name}', documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for section, stats in collector().items():
+                lines.extend(self.stats_lines(f'{self.prefix}_{section}', stats))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def stats_lines(name, stats):
+        lines = []
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            lines.append(f'# TYPE {name}_{key} untyped')
+            lines.append(f'{name}_{key} {format_value(value)}')
+        return lines
+
+
+REGISTRY = Registry()
+
+SUBPROCESS_SPAWN_SECONDS = REGISTRY.histogram(
+    'subprocess_spawn_seconds', 'Time to start a helper process (fork and exec)', ['command'])
+SUBPROCESS_RUN_SECONDS = REGISTRY.histogram(
+    'subprocess_run_seconds', 'Wall time of helper commands run to completion', ['command'])
+SUBPROCESS_FAILURES = REGISTRY.counter(
+    'subprocess_failures_total', 'Helper processes that could not start, timed out or exited non-zero',
+    ['command', 'reason'])
+STREAM_TTFB_SECONDS = REGISTRY.histogram(
+    'stream_ttfb_seconds', 'Time from an /api/stream or /api/album-stream request to its first byte of audio',
+    ['device', 'format', 'source'])
+STREAM_THROUGHPUT = REGISTRY.histogram(
+    'stream_throughput_bytes_per_second',
+    'Average rate of /api/stream and /api/album-stream responses after their first byte',
+    ['device', 'format', 'source'], buckets=THROUGHPUT_BUCKETS)
+STREAM_BYTES = REGISTRY.counter(
+    'stream_bytes_total', 'Audio bytes sent by /api/stream and /api/album-stream responses',
+    ['device', 'format', 'source'])
+ACTIVE_STREAMS = REGISTRY.gauge('active_streams', 'Open /api/stream and /api/album-stream responses', ['device'])
+BROADCAST_SKIPPED_BYTES = REGISTRY.counter(
+    'broadcast_skipped_bytes_total', 'Shared stream output overwritten before a slow listener read it '
+    '(MP3 live streams only)', ['format'])
+METADATA_LOOKUP_SECONDS = REGISTRY.histogram(
+    'metadata_lookup_seconds', 'Album lookup latency by server and outcome '
+    '(found, not_found, rate_limited, timeout, error)', ['source', 'outcome'])
+DISC_SCAN_SECONDS = REGISTRY.histogram(
+    'disc_scan_seconds', 'Time spent identifying an inserted disc: reading the TOC, '
+    'then resolving album metadata', ['phase'])
+DRIVE_READ_ERRORS = REGISTRY.counter(
+    'drive_read_errors_total', 'Audio read problems: sector retries, sectors replaced by silence, '
+    'failed CDROMREADAUDIO reads and failed cdparanoia runs', ['device', 'kind'])
+SOURCE_READ_BYTES = REGISTRY.counter(
+    'source_read_bytes_total', 'PCM read from audio sources (drives, disc images, FLAC directories)',
+    ['device', 'kind'])
+SOURCE_READ_SECONDS = REGISTRY.counter(
+    'source_read_seconds_total', 'Time spent waiting for audio source reads; '
+    'bytes over seconds is the read throughput', ['device', 'kind'])
+
+
+def command_name(cmd):
+    return os.path.basename(cmd[0]) if cmd else ''
+
+
+def popen(cmd, **kwargs):
+    """subprocess.Popen, recording how long the start took and failures to start"""
+    name = command_name(cmd)
+    start = time.monotonic()
+    try:
+        process = subprocess.Popen(cmd, **kwargs)
+    except OSError:
+        SUBPROCESS_FAILURES.inc(command=name, reason='spawn')
+        raise
+    SUBPROCESS_SPAWN_SECONDS.observe(time.monotonic() - start, command=name)
+    return process
+
+
+def run(cmd, **kwargs):
+    """subprocess.run, recording its wall time, timeouts and non-zero exits"""
+    name = command_name(cmd)
+    start = time.monotonic()
+    try:
+        result = subprocess.run(cmd, **kwargs)
+    except OSError:
+        SUBPROCESS_FAILURES.inc(command=name, reason='spawn')
+        raise
+    except subprocess.TimeoutExpired:
+        SUBPROCESS_FAILURES.inc(command=name, reason='timeout')
+        raise
+    except subprocess.CalledProcessError:
+        # check=True
+        SUBPROCESS_FAILURES.inc(command=name, reason='exit')
+        raise
+    finally:
+        SUBPROCESS_RUN_SECONDS.observe(time.monotonic() - start, command=name)
+    if result.returncode != 0:
+        SUBPROCESS_FAILURES.inc(command=name, reason='exit')
+    return result
+
+
+def observe_stream(chunks, started, **labels):
+    """Pass a response body through, recording its time to first byte and throughput.
+
+    ``started`` is the monotonic time the request arrived.
+    """
+    first = None
+    sent = 0
+    try:
+        for data in chunks:
+            if first is None:
+                first = time.monotonic()
+                STREAM_TTFB_SECONDS.observe(first - started, **labels)
+            sent += len(data)
+            yield data
+    finally:
+        if sent:
+            STREAM_BYTES.inc(sent, **labels)
+            elapsed = time.monotonic() - first
+            if elapsed > 0:
+                STREAM_THROUGHPUT.observe(sent / elapsed, **labels)
@@ -0,0 +1,238 @@
+import concurrent.futures
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+import musicbrainzngs
+import musicbrainzngs.musicbrainz
+
+# How long answers are reused: searches change as the database is edited,
+# releases and disc IDs rarely do
+SEARCH_TTL = 3600
+LOOKUP_TTL = 24 * 3600
+# Failures are kept briefly, so callers polling for an answer get the error
+ERROR_TTL = 5
+# Longest a request may be queued for its turn before it is refused
+MAX_QUEUE = 10
+# Soonest a caller told to come back should ask again
+POLL_INTERVAL = 1
+# Break after a 503 (the web service's "too many requests") that did not say how long
+UNAVAILABLE_BACKOFF = 5
+
+# musicbrainzngs retries 5xx answers up to 8 times itself, sleeping up to
+# about a minute on a worker and outside the token bucket. One attempt:
+# a 503 comes back to MusicBrainzClient, which backs off in the bucket.
+musicbrainzngs.musicbrainz._safe_read = functools.partial(musicbrainzngs.musicbrainz._safe_read,
+                                                          max_retries=1)
+
+
+class RateLimited(Exception):
+    """The request would have to wait longer than allowed for the rate limit"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'MusicBrainz rate limit, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class Pending(Exception):
+    """The answer is on its way; it will be cached, ask again in ``retry_after`` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'MusicBrainz request pending, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``rate`` requests per second with bursts of up to ``burst``.
+
+    Requests reserve their token in advance, so the bucket can go into
+    debt: a reservation returns how long to wait until its turn instead of
+    sleeping, and later reservations queue up behind it.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.last_sent = 0.0
+        self.resume = 0.0  # monotonic time before which nothing is sent
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_delay=None):
+        """Seconds until the reserved request may run, or None if that is more than ``max_delay``"""
+        with self.lock:
+            self._refill()
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            if max_delay is not None and delay > max_delay:
+                return None
+            self.tokens -= 1
+            return delay
+
+    def pace(self):
+        """Called just before sending: without bursts, keep sends 1/rate apart"""
+        # A request whose worker started it late would otherwise end up
+        # closer than that to the next one, on time
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                gap = self.resume - now
+                if self.burst == 1:
+                    gap = max(gap, self.last_sent + 1 / self.rate - now)
+                if gap <= 0:
+                    self.last_sent = now
+                    return
+            time.sleep(gap)
+
+    def hold(self, seconds):
+        """Send nothing for ``seconds``, reserved or not, and make new reservations wait that long"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+            self.resume = max(self.resume, time.monotonic() + seconds)
+
+    def delay(self):
+        """Seconds a request reserved now would wait"""
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+def unavailable_for(error):
+    """Seconds to wait before asking again if ``error`` is a 503 from the web service, else None"""
+    cause = getattr(error, 'cause', None)
+    if not isinstance(error, musicbrainzngs.NetworkError) or getattr(cause, 'code', None) != 503:
+        return None
+    try:
+        return max(float(cause.headers.get('Retry-After')), POLL_INTERVAL)
+    except (AttributeError, TypeError, ValueError):
+        return UNAVAILABLE_BACKOFF
+
+
+class MusicBrainzClient:
+    """musicbrainzngs calls behind a response cache, request coalescing and a rate limit.
+
+    Answers are cached by call and arguments for ``SEARCH_TTL`` or
+    ``LOOKUP_TTL`` seconds, including "not found" (404) answers. Identical
+    calls made while one is in flight share its answer. Every call to the
+    web service takes a token from a bucket of ``rate`` requests per second
+    (MusicBrainz allows one), and runs on a small worker pool at its turn.
+    The caller waits at most ``wait`` seconds for the answer (None: until
+    it comes) and otherwise gets Pending, to ask again later; by default it
+    does not wait at all, so request threads only ever return cached
+    answers. A call whose turn is more than ``max_queue`` seconds away
+    raises RateLimited at once. So does one the web service answered with
+    503, after which no call is sent for as long as it asked.
+    """
+
+    def __init__(self, rate=1.0, burst=1, max_entries=1000, workers=4, max_queue=MAX_QUEUE):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        self.max_entries = max_entries
+        self.cache = OrderedDict()  # key -> (expiry, result, exception)
+        self.inflight = {}  # key -> (Future, monotonic time of its turn)
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='musicbrainz')
+        self.stats_counters = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'rate_limited': 0,
+                               'pending': 0, 'errors': 0, 'wait_seconds': 0.0}
+
+    def search_releases(self, wait=0, **query):
+        return self.call(musicbrainzngs.search_releases, SEARCH_TTL, wait, **query)
+
+    def get_release_by_id(self, release_id, includes=(), wait=0):
+        return self.call(musicbrainzngs.get_release_by_id, LOOKUP_TTL, wait, release_id,
+                         includes=list(includes))
+
+    def get_releases_by_discid(self, disc_id, toc=None, includes=(), wait=0):
+        return self.call(musicbrainzngs.get_releases_by_discid, LOOKUP_TTL, wait, disc_id,
+                         toc=toc, includes=list(includes))
+
+    def call(self, func, ttl, wait, *args, **kwargs):
+        """``func(*args, **kwargs)`` from the cache, a call in flight, or the web service"""
+        key = (func.__name__, args, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.cache.move_to_end(key)
+                self.stats_counters['cache_hits'] += 1
+                return self._result(entry)
+            if key in self.inflight:
+                future, turn = self.inflight[key]
+                self.stats_counters['coalesced'] += 1
+            else:
+                delay = self.bucket.reserve(max_delay=self.max_queue)
+                if delay is None:
+                    self.stats_counters['rate_limited'] += 1
+                    raise RateLimited(self.bucket.delay())
+                self.stats_counters['requests'] += 1
+                self.stats_counters['wait_seconds'] += delay
+                future = concurrent.futures.Future()
+                turn = time.monotonic() + delay
+                self.inflight[key] = (future, turn)
+                self.executor.submit(self._run, key, ttl, future, delay, func, args, kwargs)
+        try:
+            return future.result(timeout=wait)
+        except concurrent.futures.TimeoutError:
+            with self.lock:
+                self.stats_counters['pending'] += 1
+            raise Pending(max(POLL_INTERVAL, turn - time.monotonic()))
+
+    @staticmethod
+    def _result(entry):
+        _, result, exception = entry
+        if exception is not None:
+            raise exception
+        return result
+
+    def _run(self, key, ttl, future, delay, func, args, kwargs):
+        time.sleep(delay)
+        self.bucket.pace()
+        try:
+            result = func(*args, **kwargs)
+            entry = (time.monotonic() + ttl, result, None)
+        except musicbrainzngs.ResponseError as e:
+            # Not found or bad request: the same answer next time
+            entry = (time.monotonic() + ttl, None, e)
+        except Exception as e:
+            retry_after = unavailable_for(e)
+            if retry_after is not None:
+                # Over the web service's limit: every call waits, this one included
+                self.bucket.hold(retry_after)
+                with self.lock:
+                    self.stats_counters['rate_limited'] += 1
+                entry = (time.monotonic() + retry_after, None, RateLimited(retry_after))
+            else:
+                # Network or server trouble: asked again after ERROR_TTL
+                with self.lock:
+                    self.stats_counters['errors'] += 1
+                entry = (time.monotonic() + ERROR_TTL, None, e)
+        with self.lock:
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+            self.inflight.pop(key, None)
+        if entry[2] is not None:
+            future.set_exception(entry[2])
+        else:
+            future.set_result(entry[1])
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.stats_counters)
+            entries = len(self.cache)
+            inflight = len(self.inflight)
+        counters['wait_seconds'] = round(counters['wait_seconds'], 2)
+        return dict(counters, entries=entries, in_flight=inflight, max_entries=self.max_entries,
+                    rate=self.bucket.rate, queue_delay=round(self.bucket.delay(), 2))
@@ -0,0 +1,169 @@
+import logging
+import subprocess
+import threading
+import time
+
+import metrics
+from pcm_cache import BYTES_PER_SECOND
+
+log = logging.getLogger('webcd.output')
+
+# Seconds of audio a sound card accepts ahead of what it plays
+SINK_BUFFER_SECONDS = 0.5
+
+
+class ProcessSink:
+    """Plays raw CD PCM through a player process reading stdin (aplay, pacat)"""
+
+    def __init__(self, name, cmd):
+        self.name = name
+        self.process = metrics.popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.DEVNULL)
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def close(self, drain=True):
+        """Stop the player, after it played what it was given if ``drain``"""
+        if drain:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=SINK_BUFFER_SECONDS + 5)
+                return
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.process.kill()
+        self.process.wait()
+
+
+class NullSink:
+    """Discards PCM at the pace a sound card would play it, for machines without one"""
+
+    name = 'null'
+
+    def __init__(self):
+        self.started = None
+        self.written = 0
+
+    def write(self, data):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.written += len(data)
+        ahead = self.started + self.written / BYTES_PER_SECOND - time.monotonic()
+        if ahead > SINK_BUFFER_SECONDS:
+            time.sleep(ahead - SINK_BUFFER_SECONDS)
+
+    def close(self, drain=True):
+        pass
+
+
+class FileSink:
+    """Appends raw PCM to a file as fast as it arrives"""
+
+    def __init__(self, path):
+        self.name = f'file:{path}'
+        self.file = open(path, 'ab')
+
+    def write(self, data):
+        self.file.write(data)
+
+    def close(self, drain=True):
+        self.file.close()
+
+
+def open_sink(spec):
+    """Open an output from its spec: alsa[:device], pulse[:sink], null or file:<path>"""
+    kind, _, arg = spec.strip().partition(':')
+    if kind == 'alsa':
+        # -f cd: 16 bit little endian, 44.1 kHz, stereo
+        return ProcessSink(spec, ['aplay', '-q', '-t', 'raw', '-f', 'cd'] + (['-D', arg] if arg else []))
+    if kind == 'pulse':
+        return ProcessSink(spec, ['pacat', '--playback', '--format=s16le', '--rate=44100', '--channels=2']
+                           + ([f'--device={arg}'] if arg else []))
+    if kind == 'null':
+        return NullSink()
+    if kind == 'file' and arg:
+        return FileSink(arg)
+    raise ValueError(f'Unknown output: {spec}')
+
+
+class LocalPlayback:
+    """Plays a drive's tracks one after another on the server's own outputs.
+
+    Each track's PCM comes from the player's shared PCM broadcast of that
+    track, which WAV, MP3 and FLAC listeners of the whole track join as
+    well, so a track is extracted once however many sinks and listeners
+    there are. That broadcast never skips: reading waits for the sinks,
+    which play in real time. The sinks stay open from track to track, which
+    keeps playback gapless, and the next track is extracted as soon as the
+    current one has been read.
+    """
+
+    def __init__(self, player, track, sinks, on_track=None, on_finish=None):
+        self.player = player
+        self.track = track
+        self.sinks = sinks
+        self.on_track = on_track
+        self.on_finish = on_finish
+        self.stopped = False
+        self.error = None
+        self.position = 0  # bytes of the current track played
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f'output-{self.player.device_id}',
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop at once; blocked writes to the sinks fail and end the playback thread"""
+        self.stopped = True
+        for sink in self.sinks:
+            sink.close(drain=False)
+
+    def to_dict(self):
+        return {
+            'outputs': [sink.name for sink in self.sinks],
+            'track': self.track,
+            'position': round(self.position / BYTES_PER_SECOND, 1),
+            'error': self.error
+        }
+
+    def _run(self):
+        track = self.track
+        broadcaster = self.player.shared_pcm(track)
+        try:
+            while track is not None and not self.stopped:
+                self.track = track
+                self.position = 0
+                if self.on_track:
+                    self.on_track(track)
+                next_track = self.player.next_audio_track(track)
+                upcoming = None
+                pcm = broadcaster.subscribe()
+                try:
+                    for data in pcm:
+                        if self.stopped:
+                            break
+                        for sink in self.sinks:
+                            sink.write(data)
+                        self.position += len(data)
+                        if upcoming is None and next_track and broadcaster.done:
+                            # Read the next track while the end of this one plays
+                            upcoming = self.player.shared_pcm(next_track)
+                            upcoming.start()
+                finally:
+                    pcm.close()
+                if upcoming is None and next_track:
+                    upcoming = self.player.shared_pcm(next_track)
+                track, broadcaster = next_track, upcoming
+        except Exception as e:
+            if not self.stopped:
+                self.error = str(e)
+                log.error("Local playback on %s failed: %s", self.player.cd_device, e)
+        finally:
+            if not self.stopped:
+                for sink in self.sinks:
+                    sink.close(drain=self.error is None)
+            if self.on_finish:
+                self.on_finish(self)
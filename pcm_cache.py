@@ -0,0 +1,255 @@
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+from disc_cache import default_cache_dir
+from streamio import POOL
+
+log = logging.getLogger('webcd.pcm_cache')
+
+# Raw CD audio: 44.1 kHz, 16 bit, stereo
+BYTES_PER_SECTOR = 2352
+BYTES_PER_SECOND = 44100 * 2 * 2
+WAV_HEADER_SIZE = 44
+
+
+def wav_header(data_size):
+    """Canonical 44 byte WAV header for CD audio with ``data_size`` bytes of PCM"""
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, 2, 44100, BYTES_PER_SECOND, 4, 16,
+        b'data', data_size
+    )
+
+
+class PCMCacheWriter:
+    """Collects one track's PCM into a temporary file until it is committed"""
+
+    def __init__(self, cache, key, path, expected_size=None):
+        self.cache = cache
+        self.key = key
+        self.path = path
+        self.part_path = path + '.part'
+        self.expected_size = expected_size
+        self.size = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(self.part_path, 'wb')
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        """Publish the file to the cache if it holds the whole track"""
+        self.file.close()
+        if self.expected_size is not None and self.size != self.expected_size:
+            log.info("Discarding %s, got %d of %d bytes", self.key, self.size, self.expected_size)
+            self._remove_part()
+            self.cache._finish(self.key, None)
+            return False
+        os.replace(self.part_path, self.path)
+        self.cache._finish(self.key, self.size)
+        return True
+
+    def abort(self):
+        self.file.close()
+        self._remove_part()
+        self.cache._finish(self.key, None)
+
+    def _remove_part(self):
+        try:
+            os.unlink(self.part_path)
+        except OSError:
+            pass
+
+
+class PCMCache:
+    """Bounded on-disk cache of raw track PCM keyed by (disc ID, track).
+
+    A track is extracted from the drive once; later streams of the same
+    track read the cached file. Least recently used tracks are evicted once
+    the total size exceeds ``max_bytes``.
+    """
+
+    def __init__(self, directory=None, max_bytes=2 * 1024 ** 3):
+        if directory is None:
+            directory = os.environ.get('WEBCD_PCM_CACHE_DIR') or os.path.join(default_cache_dir(), 'pcm')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (disc_id, track) -> size, least recently used first
+        self.populating = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_from_drive = 0
+        self.bytes_from_cache = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the index from files left by a previous run"""
+        found = []
+        for disc_id in os.listdir(self.directory):
+            disc_dir = os.path.join(self.directory, disc_id)
+            if not os.path.isdir(disc_dir):
+                continue
+            for name in os.listdir(disc_dir):
+                path = os.path.join(disc_dir, name)
+                if name.endswith('.part'):
+                    # Interrupted extraction
+                    os.unlink(path)
+                elif name.endswith('.pcm'):
+                    stat = os.stat(path)
+                    found.append((stat.st_mtime, (disc_id, int(name[:-4])), stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+        with self.lock:
+            self._evict()
+
+    def path(self, disc_id, track):
+        return os.path.join(self.directory, disc_id, f'{track:02d}.pcm')
+
+    def get(self, disc_id, track):
+        """Path of the cached PCM for a track, or None"""
+        key = (disc_id, track)
+        with self.lock:
+            size = self.entries.get(key)
+            if size is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return self.path(disc_id, track)
+
+    def size(self, disc_id, track):
+        with self.lock:
+            return self.entries.get((disc_id, track))
+
+    def writer(self, disc_id, track, expected_size=None):
+        """Start populating a track, or None if it is cached or already being written"""
+        key = (disc_id, track)
+        with self.lock:
+            if key in self.entries or key in self.populating:
+                return None
+            self.populating.add(key)
+        try:
+            return PCMCacheWriter(self, key, self.path(disc_id, track), expected_size)
+        except OSError as e:
+            log.warning("Cannot write %s: %s", key, e)
+            with self.lock:
+                self.populating.discard(key)
+            return None
+
+    def _finish(self, key, size):
+        with self.lock:
+            self.populating.discard(key)
+            if size is not None:
+                self.entries[key] = size
+                self._evict()
+
+    def _evict(self):
+        total = sum(self.entries.values())
+        while total > self.max_bytes and self.entries:
+            (disc_id, track), size = self.entries.popitem(last=False)
+            total -= size
+            try:
+                os.unlink(self.path(disc_id, track))
+            except OSError:
+                pass
+
+    def record_drive_read(self, nbytes):
+        with self.lock:
+            self.bytes_from_drive += nbytes
+
+    def record_cache_read(self, nbytes):
+        with self.lock:
+            self.bytes_from_cache += nbytes
+
+    def clear(self):
+        with self.lock:
+            keys = list(self.entries)
+            self.entries.clear()
+            for disc_id, track in keys:
+                try:
+                    os.unlink(self.path(disc_id, track))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'entries': len(self.entries),
+                'size_bytes': sum(self.entries.values()),
+                'max_bytes': self.max_bytes,
+                'populating': len(self.populating),
+                'bytes_from_drive': self.bytes_from_drive,
+                'bytes_from_cache': self.bytes_from_cache,
+                'directory': self.directory
+            }
+
+
+def tee_pcm(source, sink, writer=None, cache=None, process=None, chunk_size=65536):
+    """Copy PCM from an extractor's stdout to an encoder's stdin, filling the cache on the way.
+
+    Runs until the source ends or the sink goes away; the cache entry is
+    only committed if the extractor (``process``) exited cleanly. Data goes
+    through one pooled buffer without being copied into new objects.
+    """
+    readinto = getattr(source, 'readinto1', None) or source.readinto
+    buffer = POOL.acquire(chunk_size)
+    view = memoryview(buffer)
+    try:
+        while True:
+            n = readinto(view)
+            if not n:
+                break
+            data = view[:n]
+            if cache:
+                cache.record_drive_read(len(data))
+            if writer:
+                try:
+                    writer.write(data)
+                except OSError as e:
+                    # Cache disk trouble must not interrupt the listener
+                    log.warning("Write failed: %s", e)
+                    writer.abort()
+                    writer = None
+            sink.write(data)
+        sink.close()
+    except (BrokenPipeError, ValueError, OSError):
+        # Listener went away (encoder killed): the partial track is useless
+        if writer:
+            writer.abort()
+        return
+    finally:
+        view.release()
+        POOL.release(buffer)
+
+    if writer:
+        if process is not None and process.wait() != 0:
+            writer.abort()
+        else:
+            writer.commit()
+
+
+def feed_pcm(chunks, sink):
+    """Write PCM chunks from a generator to an encoder's stdin until either side ends"""
+    try:
+        for data in chunks:
+            sink.write(data)
+    except (BrokenPipeError, ValueError, OSError):
+        # Encoder killed: the listener went away
+        pass
+    finally:
+        chunks.close()
+        try:
+            sink.close()
+        except (BrokenPipeError, OSError):
+            pass
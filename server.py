@@ -0,0 +1,76 @@
+"""Production entry point: serves app.py with gunicorn.
+
+Streams and /api/events connections stay open for minutes, so the default
+worker is gevent, where each connection is a cheap greenlet and blocking
+I/O (pipes, sockets, subprocesses) yields to the others. Without gevent a
+threaded worker is used instead; without gunicorn, Flask's own server.
+"""
+import os
+
+# Players, caches and the device monitor live in the app's process, so a
+# single worker process serves every request
+WORKERS = 1
+
+
+def default_worker_class():
+    try:
+        import gevent  # noqa: F401
+        return 'gevent'
+    except ImportError:
+        return 'gthread'
+
+
+def post_worker_init(worker):
+    """Gunicorn hook: the worker has loaded the app, so its encoders start in this process"""
+    from app import players
+    players.warm_encoders()
+
+
+def gunicorn_options():
+    host = os.environ.get('WEBCD_HOST', '0.0.0.0')
+    port = os.environ.get('WEBCD_PORT') or os.environ.get('FLASK_RUN_PORT', '5000')
+    return {
+        'bind': f'{host}:{port}',
+        'workers': WORKERS,
+        'worker_class': os.environ.get('WEBCD_WORKER_CLASS') or default_worker_class(),
+        # Concurrent connections per gevent worker
+        'worker_connections': int(os.environ.get('WEBCD_WORKER_CONNECTIONS', '1000')),
+        # Concurrent connections for the threaded fallback (one thread each)
+        'threads': int(os.environ.get('WEBCD_THREADS', '64')),
+        # Only restarts a worker whose event loop stopped responding; open
+        # streams themselves have no time limit
+        'timeout': 60,
+        'graceful_timeout': 5,
+        'keepalive': 5,
+        'post_worker_init': post_worker_init,
+    }
+
+
+def main():
+    options = gunicorn_options()
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("gunicorn is not installed, falling back to the Flask development server")
+        from app import app, players
+        players.warm_encoders()
+        host, _, port = options['bind'].rpartition(':')
+        app.run(host=host, port=int(port), threaded=True)
+        return
+
+    class WebCDApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Imported in the worker, after gevent has patched the standard library
+            from app import app
+            return app
+
+    print(f"Starting WebCD on {options['bind']} with {options['worker_class']} workers")
+    WebCDApplication().run()
+
+
+if __name__ == '__main__':
+    main()
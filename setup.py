@@ -7,7 +7,7 @@ setup(
     author='GlassOnTin',
     author_email='glassontin@users.noreply.github.com',
     url='https://github.com/GlassOnTin/webcd',
-    py_modules=['app'],
+    py_modules=['app', 'disc_cache', 'cdtoc', 'events', 'device_monitor', 'pcm_cache', 'broadcast', 'server', 'cdaudio', 'encoder', 'streamio', 'library', 'hls', 'encoder_pool', 'output', 'cddb', 'musicbrainz', 'metrics', 'logs', 'sources', 'disc_images'],
     install_requires=[
         'flask>=3.1.0',
         'flask-cors>=5.0.0',
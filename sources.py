@@ -0,0 +1,662 @@
+import abc
+import array
+import json
+import logging
+import mmap
+import os
+import re
+import shlex
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from cdaudio import SectorReader
+from cdtoc import Toc, FRAMES_PER_SECOND, read_toc, read_toc_subprocess
+from pcm_cache import BYTES_PER_SECTOR
+from streamio import read_chunks, grow_pipe
+import metrics
+
+log = logging.getLogger('webcd.sources')
+
+# Samples (per channel) in one 1/75 s sector of CD audio
+SAMPLES_PER_SECTOR = 588
+# Disc images: CUE sheets and the raw 2352 byte sector images they describe
+IMAGE_EXTENSIONS = ('.cue', '.bin', '.img', '.raw', '.iso')
+# CUE track modes and the bytes their sectors take in the image file
+TRACK_MODES = {'AUDIO': 2352, 'CDG': 2448, 'MODE1/2048': 2048, 'MODE1/2352': 2352,
+               'MODE2/2336': 2336, 'MODE2/2352': 2352, 'CDI/2336': 2336, 'CDI/2352': 2352}
+# Where an ISO 9660 file system announces itself
+ISO9660_MAGIC_OFFSET = 16 * 2048 + 1
+
+
+class SourceError(OSError):
+    """A disc image or directory that cannot be read as a disc"""
+
+
+def source_kind(path):
+    """'drive', 'image' or 'flac' depending on what ``path`` is"""
+    if os.path.isdir(path):
+        # A captured image (see disc_images.py), or ripped files
+        if any(n.lower().endswith('.cue') for n in os.listdir(path)):
+            return 'image'
+        return 'flac'
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        return 'image'
+    return 'drive'
+
+
+def open_source(path, name=None, inprocess=False):
+    """The AudioSource for a drive, disc image or directory of FLAC files.
+
+    ``inprocess`` lets drives read sectors with CDROMREADAUDIO instead of
+    cdparanoia (see WEBCD_INPROCESS_PIPELINE). Raises SourceError for an
+    image or directory that does not describe a disc.
+    """
+    kind = source_kind(path)
+    if kind == 'flac':
+        return FlacDirSource(path, name)
+    if kind == 'image':
+        return ImageSource(path, name)
+    return DriveSource(path, name, inprocess=inprocess)
+
+
+class AudioSource(abc.ABC):
+    """Where a player's disc audio comes from: a drive, a disc image or ripped files.
+
+    Sectors are addressed by LBA as in the TOC, 2352 bytes of 16 bit stereo
+    PCM each. read() gives random access to any span of them and
+    read_track() to tracks by number. The time spent waiting for PCM is
+    recorded, so stats() reports each source's read throughput.
+    """
+
+    kind = None
+    # Reads spin an optical drive: slow to seek, worth caching, paranoia applies
+    is_drive = False
+
+    def __init__(self, path, name=None):
+        self.path = path
+        self.name = name or os.path.basename(os.path.realpath(path))
+        # TOC from the last read_toc()
+        self.toc = None
+        self.reads = 0
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self.lock = threading.Lock()
+
+    @abc.abstractmethod
+    def read_toc(self):
+        """The disc's TOC, or None; OSError when only probe_toc() can tell"""
+
+    def probe_toc(self):
+        """Slower fallback of read_toc() that may run helper processes"""
+        return None
+
+    def metadata(self):
+        """Track list and album info stored with the disc (``{'tracks', 'album'}``), or None"""
+        return None
+
+    def readable(self):
+        """Whether PCM can be read at all (the tools a drive needs are installed)"""
+        return True
+
+    def in_process(self, paranoia_mode):
+        """Whether reads in ``paranoia_mode`` run without any helper process"""
+        return False
+
+    def track_span(self, track, start_sector=0, last_track=None):
+        """(first LBA, sector count) of a track from ``start_sector`` sectors in, through ``last_track``"""
+        if self.toc is None:
+            raise SourceError(f'{self.path}: no TOC read yet')
+        start, length = self.toc.track_sectors(track)
+        if last_track:
+            last_start, last_length = self.toc.track_sectors(last_track)
+            length = last_start + last_length - start
+        return start + start_sector, length - start_sector
+
+    def read(self, start, length, chunk_size=256 * 1024, paranoia_mode='fast'):
+        """Generator of the PCM of ``length`` sectors starting at LBA ``start``"""
+        return self.measured(self._read(start, length, chunk_size, paranoia_mode))
+
+    def read_track(self, track, start_sector=0, last_track=None, chunk_size=256 * 1024, paranoia_mode='fast'):
+        """Generator of a track's PCM, starting ``start_sector`` sectors in
+
+        With ``last_track`` the read continues through the following tracks
+        up to and including that one.
+        """
+        start, length = self.track_span(track, start_sector, last_track)
+        return self.read(start, length, chunk_size, paranoia_mode)
+
+    @abc.abstractmethod
+    def _read(self, start, length, chunk_size, paranoia_mode):
+        """Generator of the PCM of ``length`` sectors from LBA ``start``, unmeasured"""
+
+    def measured(self, chunks):
+        """Pass PCM through, adding the time spent waiting for it to the read statistics"""
+        try:
+            while True:
+                began = time.monotonic()
+                data = next(chunks, None)
+                elapsed = time.monotonic() - began
+                if data is None:
+                    break
+                self.record_read(len(data), elapsed)
+                yield data
+        finally:
+            chunks.close()
+
+    def record_read(self, nbytes, seconds):
+        with self.lock:
+            self.reads += 1
+            self.bytes_read += nbytes
+            self.read_seconds += seconds
+        metrics.SOURCE_READ_BYTES.inc(nbytes, device=self.name, kind=self.kind)
+        metrics.SOURCE_READ_SECONDS.inc(seconds, device=self.name, kind=self.kind)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'kind': self.kind,
+                'path': self.path,
+                'reads': self.reads,
+                'bytes_read': self.bytes_read,
+                'read_seconds': round(self.read_seconds, 3),
+                # Bytes per second while waiting for reads; CD audio plays at 176400
+                'throughput': round(self.bytes_read / self.read_seconds) if self.read_seconds else None,
+            }
+
+
+class DriveSource(AudioSource):
+    """An optical drive, read with cdparanoia or, in-process, with CDROMREADAUDIO
+
+    ``ioctl`` (same signature as fcntl.ioctl) replaces the CDROM ioctls of
+    the TOC and sector reads, to read from a fake drive.
+    """
+
+    kind = 'drive'
+    is_drive = True
+
+    def __init__(self, path, name=None, inprocess=False, ioctl=None):
+        super().__init__(path, name)
+        self.inprocess = inprocess
+        self.ioctl = ioctl
+
+    def read_toc(self):
+        # Native CDROM ioctls; cdparanoia -Q is probe_toc()
+        self.toc = read_toc(self.path, ioctl=self.ioctl)
+        return self.toc
+
+    def probe_toc(self):
+        self.toc = read_toc_subprocess(self.path)
+        return self.toc
+
+    def readable(self):
+        return self.inprocess or shutil.which('cdparanoia') is not None
+
+    def in_process(self, paranoia_mode):
+        # Audio reads have no paranoia verification, so only in 'fast' mode
+        return self.inprocess and paranoia_mode == 'fast'
+
+    def cdparanoia_command(self, track, start_sector=0, last_track=None, paranoia_mode='fast'):
+        """Build the cdparanoia command extracting a track (from a sector offset) as raw PCM
+
+        With ``last_track`` the span runs on to the end of that track.
+        """
+        cmd = ['cdparanoia', '-d', self.path, '-r']
+
+        # Apply paranoia mode settings
+        if paranoia_mode == 'fast':
+            cmd.extend(['-Z', '-Y', '--never-skip=10'])
+        elif paranoia_mode == 'normal':
+            cmd.extend(['-Y', '--never-skip=20'])
+        # 'paranoid' mode uses default settings (no flags)
+
+        end = last_track or track
+        if start_sector:
+            # Span syntax "track[hh:mm:ss.ff]-track"; ff counts 1/75 s sectors
+            seconds, frames = divmod(start_sector, FRAMES_PER_SECOND)
+            cmd.append(f'{track}[{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{frames:02d}]-{end}')
+        elif end != track:
+            cmd.append(f'{track}-{end}')
+        else:
+            cmd.append(str(track))
+        cmd.append('-')  # output to stdout
+        return cmd
+
+    def read_track(self, track, start_sector=0, last_track=None, chunk_size=256 * 1024, paranoia_mode='fast'):
+        if self.in_process(paranoia_mode) and self.toc is not None and track in self.toc.audio_tracks():
+            return super().read_track(track, start_sector, last_track, chunk_size, paranoia_mode)
+        # cdparanoia finds tracks by number, so this works without a TOC too
+        return self.measured(self._cdparanoia(track, start_sector, last_track, chunk_size, paranoia_mode))
+
+    def _read(self, start, length, chunk_size, paranoia_mode):
+        if self.in_process(paranoia_mode):
+            reader = SectorReader(self.path, start, length,
+                                  frames_per_read=max(chunk_size // BYTES_PER_SECTOR, 1), ioctl=self.ioctl)
+            try:
+                yield from reader
+                return
+            except OSError as e:
+                metrics.DRIVE_READ_ERRORS.inc(device=self.name, kind='ioctl_failed')
+                if reader.bytes_read:
+                    raise
+                log.warning("CDROMREADAUDIO failed (%s), falling back to cdparanoia", e,
+                            extra={'device': self.path})
+            finally:
+                if reader.retried:
+                    metrics.DRIVE_READ_ERRORS.inc(reader.retried, device=self.name, kind='sector_retry')
+                if reader.skipped:
+                    metrics.DRIVE_READ_ERRORS.inc(reader.skipped, device=self.name, kind='sector_skipped')
+
+        # cdparanoia spans are per track: from the track holding ``start``
+        # through the one holding the span's last sector, cut to length
+        if self.toc is None:
+            raise SourceError(f'{self.path}: no TOC read yet')
+        tracks = self.toc.track_numbers()
+        first = max(t for t in tracks if self.toc.track_sectors(t)[0] <= start)
+        last = max(t for t in tracks if self.toc.track_sectors(t)[0] < start + length)
+        yield from self._cdparanoia(first, start - self.toc.track_sectors(first)[0], last,
+                                    chunk_size, paranoia_mode, limit=length * BYTES_PER_SECTOR)
+
+    def _cdparanoia(self, track, start_sector, last_track, chunk_size, paranoia_mode, limit=None):
+        process = metrics.popen(self.cdparanoia_command(track, start_sector, last_track, paranoia_mode),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        grow_pipe(process.stdout, chunk_size)
+        sent = 0
+        try:
+            for data in read_chunks(process.stdout, chunk_size, limit=limit):
+                sent += len(data)
+                yield data
+            # Read to the end: cdparanoia has exited or is about to
+            if (limit is None or sent < limit) and process.wait() != 0:
+                metrics.DRIVE_READ_ERRORS.inc(device=self.name, kind='cdparanoia_failed')
+        finally:
+            process.terminate()
+
+
+class ImageSource(AudioSource):
+    """A disc image: a CUE sheet with its BIN (or WAV) files, or a bare raw image.
+
+    ``path`` is the sheet, a bare .bin/.img/.raw file (one track) or a
+    directory holding a sheet, such as a disc captured by /api/image. The
+    sheet's INDEX 01 positions are the track offsets; a JSON file next to
+    it with the same name can hold the disc's exact TOC (``toc``) and its
+    ``tracks`` and ``album``, and the image then starts at the first
+    track's LBA. Files are memory-mapped, so a read, wherever it starts,
+    is a slice of the mapping and images share the page cache. Raw sectors
+    are little-endian PCM, or big-endian for FILE ... MOTOROLA. ISO 9660
+    (data only) images have no audio and are refused.
+    """
+
+    kind = 'image'
+
+    def __init__(self, path, name=None):
+        super().__init__(path, name)
+        # (first LBA, sectors, file, byte offset, sector size, big-endian) of
+        # each stretch of the image; file None is silence (PREGAP)
+        self.segments = []
+        self.info = None  # the sheet's JSON file
+        self.maps = {}  # file -> ((size, mtime), mmap)
+        self.maps_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Parse the CUE sheet (or the bare image) into segments and a TOC"""
+        path = self.path
+        if os.path.isdir(path):
+            sheets = sorted(n for n in os.listdir(path) if n.lower().endswith('.cue'))
+            if not sheets:
+                raise SourceError(f'{path}: no CUE sheet')
+            path = os.path.join(path, sheets[0])
+        if path.lower().endswith('.cue'):
+            toc, segments = parse_cue(path)
+            self.info = read_image_info(os.path.splitext(path)[0] + '.json')
+            stored = self.info and self.info.get('toc')
+            if stored:
+                toc, segments = place_image(Toc.from_dict(stored), toc, segments, path)
+        else:
+            check_not_iso9660(path)
+            sectors = os.path.getsize(path) // BYTES_PER_SECTOR
+            if not sectors:
+                raise SourceError(f'{path}: empty image')
+            toc = Toc(1, 1, [0], sectors)
+            segments = [(0, sectors, path, 0, BYTES_PER_SECTOR, False)]
+        self.toc, self.segments = toc, segments
+        return self.toc
+
+    def read_toc(self):
+        # Images can be replaced on disk like discs in a drive
+        return self.load()
+
+    def metadata(self):
+        if self.info and self.info.get('tracks') and self.info.get('album'):
+            return {'tracks': self.info['tracks'], 'album': self.info['album']}
+        return None
+
+    def in_process(self, paranoia_mode):
+        return True
+
+    def mapping(self, path):
+        """A read-only mmap of an image file, mapped again if the file was replaced"""
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self.maps_lock:
+            mapped = self.maps.get(path)
+            if mapped and mapped[0] == key:
+                return mapped[1]
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(data, 'madvise'):
+                # Streams read on from where they start
+                data.madvise(mmap.MADV_SEQUENTIAL)
+            # A replaced mapping is unmapped once the reads using it are done
+            self.maps[path] = (key, data)
+            return data
+
+    def _read(self, start, length, chunk_size, paranoia_mode):
+        sectors_per_chunk = max(chunk_size // BYTES_PER_SECTOR, 1)
+        lba = start
+        end = start + length
+        while lba < end:
+            segment = self.segment_at(lba)
+            if segment is None:
+                raise SourceError(f'{self.path}: sector {lba} is outside the image')
+            first, sectors, path, offset, sector_size, big_endian = segment
+            count = min(sectors_per_chunk, end - lba, first + sectors - lba)
+            if path is None:
+                data = bytes(count * BYTES_PER_SECTOR)
+            else:
+                data = read_sectors(self.mapping(path), offset + (lba - first) * sector_size,
+                                    count, sector_size)
+                if big_endian:
+                    data = swap_bytes(data)
+            lba += count
+            yield data
+
+    def segment_at(self, lba):
+        for segment in self.segments:
+            if segment[0] <= lba < segment[0] + segment[1]:
+                return segment
+        return None
+
+
+def read_sectors(mapped, offset, count, sector_size):
+    """``count`` sectors of PCM from a mapped file at ``offset``, zero-padded past its end"""
+    data = mapped[offset:offset + count * sector_size]
+    if sector_size != BYTES_PER_SECTOR:
+        # Data or CD+G sectors: only their first 2352 bytes are read out
+        data = b''.join(data[i:i + BYTES_PER_SECTOR] for i in range(0, len(data), sector_size))
+    if len(data) < count * BYTES_PER_SECTOR:
+        data += bytes(count * BYTES_PER_SECTOR - len(data))
+    return data
+
+
+def read_image_info(path):
+    """The JSON file describing an image (its disc's TOC and metadata), or None"""
+    try:
+        with open(path) as f:
+            info = json.load(f)
+        return info if isinstance(info, dict) else None
+    except (OSError, ValueError):
+        return None
+
+
+def place_image(stored, toc, segments, cue_path):
+    """(stored TOC, segments moved to its LBAs) for an image of part of a disc
+
+    The image holds the stored TOC's tracks from the sheet's first one on;
+    if the sheet does not match the stored TOC, the sheet is used as is.
+    """
+    if not stored.first_track <= toc.first_track <= stored.last_track:
+        log.warning("%s does not match the TOC stored with it, using the sheet's", cue_path)
+        return toc, segments
+    shift = stored.offsets[toc.first_track - stored.first_track] - toc.offsets[0]
+    for number, offset in zip(toc.track_numbers(), toc.offsets):
+        if (number > stored.last_track
+                or stored.offsets[number - stored.first_track] != offset + shift):
+            log.warning("%s does not match the TOC stored with it, using the sheet's", cue_path)
+            return toc, segments
+    return stored, [(segment[0] + shift,) + segment[1:] for segment in segments]
+
+
+def swap_bytes(data):
+    samples = array.array('h', data)
+    samples.byteswap()
+    return samples.tobytes()
+
+
+def check_not_iso9660(path):
+    with open(path, 'rb') as f:
+        f.seek(ISO9660_MAGIC_OFFSET)
+        if f.read(5) == b'CD001':
+            raise SourceError(f'{path}: ISO 9660 data image, it has no audio tracks')
+
+
+def msf_frames(value):
+    """CUE sheet "mm:ss:ff" -> sectors"""
+    minutes, seconds, frames = (int(x) for x in value.split(':'))
+    return (minutes * 60 + seconds) * FRAMES_PER_SECOND + frames
+
+
+def wav_data(path):
+    """(offset, size) of the sample data of a WAV file listed in a CUE sheet"""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise SourceError(f'{path}: not a WAV file')
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise SourceError(f'{path}: no sample data')
+            chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'data':
+                return f.tell(), size
+            if chunk_id == b'fmt ':
+                _, channels, rate, _, _, bits = struct.unpack('<HHIIHH', f.read(16))
+                if (channels, rate, bits) != (2, 44100, 16):
+                    raise SourceError(f'{path}: not 16 bit stereo 44.1 kHz (CD audio)')
+                size -= 16
+            # Chunks are padded to an even size
+            f.seek(size + size % 2, 1)
+
+
+def parse_cue(cue_path):
+    """(Toc, segments) of a CUE sheet; see ImageSource for the segments"""
+    directory = os.path.dirname(os.path.abspath(cue_path))
+    files = []  # [path, file type, [(track, mode, {index: frames}, pregap)]]
+    track = None
+    try:
+        with open(cue_path, encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        raise SourceError(f'{cue_path}: {e.strerror}')
+    for line in lines:
+        try:
+            words = shlex.split(line, posix=True)
+        except ValueError:
+            words = line.split()
+        if not words:
+            continue
+        command = words[0].upper()
+        if command == 'FILE' and len(words) >= 2:
+            files.append([os.path.join(directory, words[1]),
+                          words[2].upper() if len(words) > 2 else 'BINARY', []])
+        elif command == 'TRACK' and len(words) >= 3 and files:
+            mode = words[2].upper()
+            if mode not in TRACK_MODES:
+                raise SourceError(f'{cue_path}: unsupported track mode {mode}')
+            track = [int(words[1]), mode, {}, 0]
+            files[-1][2].append(track)
+        elif command == 'INDEX' and len(words) >= 3 and track is not None:
+            track[2][int(words[1])] = msf_frames(words[2])
+        elif command == 'PREGAP' and len(words) >= 2 and track is not None:
+            track[3] = msf_frames(words[1])
+    if not any(tracks for _, _, tracks in files):
+        raise SourceError(f'{cue_path}: no tracks')
+
+    numbers, offsets, data_tracks, segments = [], [], [], []
+    lba = 0
+    for path, file_type, tracks in files:
+        if file_type == 'WAVE':
+            data_offset, data_size = wav_data(path)
+        else:
+            data_offset, data_size = 0, None
+        big_endian = file_type == 'MOTOROLA'
+        # Tracks are laid out in the file one after another, each from its
+        # first index, in sectors of its mode's size
+        for number, _, indexes, _ in tracks:
+            if not indexes:
+                raise SourceError(f'{cue_path}: track {number} has no INDEX')
+        starts = [min(indexes.values()) for _, _, indexes, _ in tracks]
+        # Sectors before a file's first INDEX are a pregap, as if INDEX 00 were at its start
+        starts[0] = 0
+        byte_offset = data_offset
+        file_size = data_size if data_size is not None else os.path.getsize(path)
+        for i, (number, mode, indexes, pregap) in enumerate(tracks):
+            sector_size = TRACK_MODES[mode]
+            if pregap:
+                # Silence that is not in the file
+                segments.append((lba, pregap, None, 0, BYTES_PER_SECTOR, False))
+                lba += pregap
+            if i + 1 < len(tracks):
+                sectors = starts[i + 1] - starts[i]
+            else:
+                sectors = (data_offset + file_size - byte_offset) // sector_size
+            start = lba + indexes.get(1, min(indexes.values())) - starts[i]
+            if sectors <= 0 or start >= lba + sectors:
+                raise SourceError(f'{cue_path}: track {number} lies outside {os.path.basename(path)}')
+            numbers.append(number)
+            offsets.append(start)
+            if mode != 'AUDIO':
+                data_tracks.append(number)
+            segments.append((lba, sectors, path, byte_offset, sector_size, big_endian))
+            lba += sectors
+            byte_offset += sectors * sector_size
+    return Toc(numbers[0], numbers[-1], offsets, lba, data_tracks), segments
+
+
+def flac_info(path):
+    """(sample rate, total samples) from a FLAC file's STREAMINFO block"""
+    with open(path, 'rb') as f:
+        header = f.read(42)
+    if len(header) < 42 or header[:4] != b'fLaC':
+        raise SourceError(f'{path}: not a FLAC file')
+    # 20 bit sample rate, 3 bit channels, 5 bit bits per sample, 36 bit total samples
+    bits = int.from_bytes(header[18:26], 'big')
+    return bits >> 44, bits & 0xFFFFFFFFF
+
+
+class FlacDirSource(AudioSource):
+    """A directory with one FLAC file per track, such as a disc ripped to the library.
+
+    Tracks are numbered by the leading digits of the file names, or else in
+    name order. The TOC is the one stored in the directory's rip.json, so
+    a ripped disc keeps its disc ID; without one, tracks are laid out back
+    to back from LBA 0 by their lengths. A read decodes from the whole
+    second before its first sector, so a seek costs under a second of decoding.
+    """
+
+    kind = 'flac'
+
+    def __init__(self, path, name=None, ffmpeg='ffmpeg'):
+        super().__init__(path, name)
+        self.ffmpeg = ffmpeg
+        self.files = {}  # track number -> path
+        self.load()
+
+    def load(self):
+        names = sorted(n for n in os.listdir(self.path) if n.lower().endswith('.flac'))
+        if not names:
+            raise SourceError(f'{self.path}: no FLAC files')
+        numbers = [re.match(r'\d+', n) for n in names]
+        if all(numbers) and len({int(m.group()) for m in numbers}) == len(names):
+            self.files = {int(m.group()): os.path.join(self.path, n) for m, n in zip(numbers, names)}
+        else:
+            self.files = {i: os.path.join(self.path, n) for i, n in enumerate(names, 1)}
+
+        self.toc = self.manifest_toc()
+        if self.toc is None:
+            offsets = []
+            lba = 0
+            for number in sorted(self.files):
+                rate, samples = flac_info(self.files[number])
+                offsets.append(lba)
+                # A partial last sector is padded with silence
+                lba += -(-samples * 44100 // rate // SAMPLES_PER_SECTOR)
+            numbers = sorted(self.files)
+            if numbers != list(range(numbers[0], numbers[-1] + 1)):
+                raise SourceError(f'{self.path}: track numbers {numbers} are not consecutive')
+            self.toc = Toc(numbers[0], numbers[-1], offsets, lba)
+        return self.toc
+
+    def manifest_toc(self):
+        """The TOC of the disc this directory was ripped from, if rip.json has it"""
+        try:
+            with open(os.path.join(self.path, 'rip.json')) as f:
+                toc = json.load(f).get('toc')
+            return Toc.from_dict(toc) if toc else None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def read_toc(self):
+        return self.load()
+
+    def _read(self, start, length, chunk_size, paranoia_mode):
+        lba = start
+        end = start + length
+        while lba < end:
+            track = max((t for t in self.toc.track_numbers() if self.toc.track_sectors(t)[0] <= lba),
+                        default=None)
+            if track is None:
+                raise SourceError(f'{self.path}: sector {lba} is before the first track')
+            track_start, track_length = self.toc.track_sectors(track)
+            count = min(end, track_start + track_length) - lba
+            if count <= 0:
+                raise SourceError(f'{self.path}: sector {lba} is past the last track')
+            if track in self.toc.data_tracks or track not in self.files:
+                raise SourceError(f'{self.path}: no FLAC file for track {track}')
+            yield from self.decode(self.files[track], lba - track_start, count, chunk_size)
+            lba += count
+
+    def decode(self, path, start_sector, count, chunk_size):
+        """``count`` sectors of PCM decoded from a file, ``start_sector`` sectors in"""
+        # Whole seconds seek exactly; the rest of the way is decoded and dropped
+        seconds = start_sector // FRAMES_PER_SECOND
+        skip = (start_sector - seconds * FRAMES_PER_SECOND) * BYTES_PER_SECTOR
+        wanted = count * BYTES_PER_SECTOR
+        process = metrics.popen(
+            [self.ffmpeg, '-loglevel', 'quiet', '-ss', str(seconds), '-i', path,
+             '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', '44100', '-ac', '2', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        grow_pipe(process.stdout, chunk_size)
+        try:
+            for data in read_chunks(process.stdout, chunk_size, limit=skip + wanted):
+                if skip:
+                    data, skip = data[skip:], max(skip - len(data), 0)
+                if data:
+                    wanted -= len(data)
+                    yield data
+        finally:
+            process.terminate()
+        if wanted > 0:
+            # The file ends inside its last sector
+            yield bytes(wanted)
+
+
+if __name__ == '__main__':
+    # python3 sources.py <drive, image or directory>: TOC and read throughput
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else '/dev/cdrom')
+    try:
+        toc = source.read_toc()
+    except OSError:
+        toc = source.probe_toc()
+    if toc is None:
+        sys.exit(f'Unable to read TOC from {source.path}')
+    print(toc.cd_discid_output())
+    for number in toc.audio_tracks():
+        for _ in source.read_track(number):
+            pass
+    print(source.stats())
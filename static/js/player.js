@@ -5,8 +5,18 @@ class WebCDPlayer {
         this.isPlaying = false;
         this.audioPlayer = document.getElementById('audio-player');
         this.streamSettings = {};
+        // This listener's format and bitrate; the drive's settings are only the default
+        this.quality = JSON.parse(localStorage.getItem('webcd-quality') || 'null');
+        this.discId = null;
+        // Drive this page controls; each browser picks its own
+        this.currentDevice = null;
+        this.deviceId = null;
+        // Position in the track where the current stream started (seconds)
+        this.seekOffset = 0;
+        this.isSeeking = false;
         
         this.initializeEventListeners();
+        this.connectEvents();
         this.initialize();
     }
     
@@ -30,6 +40,18 @@ class WebCDPlayer {
         // Audio player events
         this.audioPlayer.addEventListener('ended', () => this.nextTrack());
         this.audioPlayer.addEventListener('error', (e) => this.handleAudioError(e));
+        this.audioPlayer.addEventListener('timeupdate', () => this.updateSeekBar());
+        
+        // Seeking restarts the stream at the chosen position (?start=)
+        const seekBar = document.getElementById('seek-bar');
+        seekBar.addEventListener('input', () => {
+            this.isSeeking = true;
+            document.getElementById('seek-position').textContent = this.formatTime(seekBar.value);
+        });
+        seekBar.addEventListener('change', () => {
+            this.isSeeking = false;
+            this.playTrack(this.currentTrack, parseInt(seekBar.value, 10));
+        });
         
         // Settings panel events
         document.getElementById('toggle-settings').addEventListener('click', () => this.toggleSettings());
@@ -60,7 +82,90 @@ class WebCDPlayer {
         // Device selector events
         document.getElementById('device-selector-btn').addEventListener('click', () => this.openDeviceSelector());
         document.querySelector('.close-device').addEventListener('click', () => this.closeDeviceSelector());
-        document.getElementById('refresh-devices').addEventListener('click', () => this.loadDevices());
+        document.getElementById('refresh-devices').addEventListener('click', () => this.loadDevices(true));
+    }
+    
+    api(path) {
+        // Device-scoped API URL, or the server's default drive until one is known
+        return this.deviceId ? `/api/devices/${this.deviceId}/${path}` : `/api/${path}`;
+    }
+    
+    connectEvents() {
+        // Server pushes updates (e.g. album lookups finishing) over SSE
+        if (!window.EventSource) return;
+        this.events = new EventSource('/api/events');
+        this.events.addEventListener('metadata', (e) => this.handleMetadata(JSON.parse(e.data)));
+        this.events.addEventListener('status', (e) => this.handleServerStatus(JSON.parse(e.data)));
+        this.events.addEventListener('devices', (e) => this.handleDevices(JSON.parse(e.data)));
+        this.events.addEventListener('device', (e) => this.handleDeviceChange(JSON.parse(e.data)));
+        this.events.addEventListener('disc', (e) => this.handleDisc(JSON.parse(e.data)));
+    }
+    
+    handleServerStatus(status) {
+        if (this.deviceId && status.device_id !== this.deviceId) return;
+        // Show how many clients are streaming from this server
+        const listeners = status.listeners || 0;
+        document.getElementById('listeners-text').textContent =
+            listeners > 0 ? `${listeners} listening` : '';
+    }
+    
+    handleDevices(data) {
+        if (!this.deviceId) {
+            this.deviceId = data.current_device_id;
+            this.currentDevice = data.current_device;
+        } else if (!data.devices.some(device => device.id === this.deviceId)) {
+            // Our drive was unplugged; fall back to the server's default
+            this.switchDevice(data.current_device_id, data.current_device);
+        }
+        // Keep an open device selector current without re-scanning
+        if (document.getElementById('device-selector-modal').style.display === 'flex') {
+            this.displayDevices(data.devices);
+        }
+    }
+    
+    handleDeviceChange(data) {
+        // The server's default drive changed; pages that picked a drive keep it
+        if (this.deviceId) return;
+        this.switchDevice(data.device_id, data.device);
+    }
+    
+    switchDevice(deviceId, device) {
+        if (deviceId === this.deviceId) return;
+        this.stop();
+        this.deviceId = deviceId;
+        this.currentDevice = device;
+        this.updateStatus(`Switched to ${device}`);
+        // Every drive has its own stream settings and disc
+        this.loadSettings();
+        this.refreshCDInfo();
+    }
+    
+    handleDisc(data) {
+        if (data.device_id !== this.deviceId) return;
+        if (data.state === 'ejected') {
+            this.clearDisc();
+            this.updateStatus('CD ejected');
+        } else if (data.state === 'inserted') {
+            this.refreshCDInfo();
+        }
+    }
+    
+    handleMetadata(data) {
+        // Ignore lookups for another drive or a disc we are no longer showing
+        if (data.device_id !== this.deviceId || data.disc_id !== this.discId) return;
+        
+        if (data.tracks) {
+            this.tracks = data.tracks;
+            this.displayTracks();
+            this.highlightActiveTrack();
+            this.updateNowPlaying();
+        }
+        
+        if (data.album) {
+            this.displayAlbumInfo(data.album);
+        } else {
+            document.getElementById('cd-info').innerHTML = `<p>CD detected: ${this.tracks.length} tracks (no album information found)</p>`;
+        }
     }
     
     async refreshCDInfo() {
@@ -68,11 +173,12 @@ class WebCDPlayer {
         this.updateStatus('Checking CD...');
         
         try {
-            const response = await fetch('/api/cd-info');
+            const response = await fetch(this.api('cd-info'));
             const data = await response.json();
             console.log('CD info response:', data);
             
             if (data.success) {
+                this.discId = data.disc_id || null;
                 this.tracks = data.tracks;
                 this.displayTracks();
                 this.updateStatus(`Found ${this.tracks.length} tracks`);
@@ -81,7 +187,9 @@ class WebCDPlayer {
                 if (data.album) {
                     this.displayAlbumInfo(data.album);
                 } else {
-                    document.getElementById('cd-info').innerHTML = `<p>CD detected: ${this.tracks.length} tracks</p>`;
+                    const lookup = data.resolving ? ' &mdash; looking up album...' : '';
+                    document.getElementById('cd-info').style.display = 'block';
+                    document.getElementById('cd-info').innerHTML = `<p>CD detected: ${this.tracks.length} tracks${lookup}</p>`;
                     document.getElementById('album-info').style.display = 'none';
                 }
                 
@@ -150,8 +258,22 @@ class WebCDPlayer {
         });
     }
     
-    async playTrack(trackNumber) {
+    formatTime(totalSeconds) {
+        const minutes = Math.floor(totalSeconds / 60);
+        const seconds = Math.floor(totalSeconds % 60);
+        return `${minutes}:${seconds.toString().padStart(2, '0')}`;
+    }
+    
+    updateSeekBar() {
+        if (this.isSeeking) return;
+        const position = this.seekOffset + (this.audioPlayer.currentTime || 0);
+        document.getElementById('seek-bar').value = Math.floor(position);
+        document.getElementById('seek-position').textContent = this.formatTime(position);
+    }
+    
+    async playTrack(trackNumber, startSeconds = 0) {
         this.currentTrack = trackNumber;
+        this.seekOffset = startSeconds;
         
         // Update UI
         this.highlightActiveTrack();
@@ -163,7 +285,16 @@ class WebCDPlayer {
         
         // Set audio source and play
         // Add timestamp to prevent caching issues
-        this.audioPlayer.src = `/api/stream/${trackNumber}?t=${Date.now()}`;
+        const start = startSeconds > 0 ? `start=${startSeconds}&` : '';
+        const quality = `format=${this.streamSettings.format}&bitrate=${this.streamSettings.bitrate}&`;
+        this.audioPlayer.src = this.api(`stream/${trackNumber}?${start}${quality}t=${Date.now()}`);
+        
+        // Seek bar covers the whole track, whatever the stream's start
+        const seekBar = document.getElementById('seek-bar');
+        seekBar.max = trackDuration;
+        seekBar.value = startSeconds;
+        document.getElementById('seek-duration').textContent = this.formatTime(trackDuration);
+        this.updateSeekBar();
         
         // Set preload for mobile
         this.audioPlayer.preload = 'none';
@@ -260,24 +391,13 @@ class WebCDPlayer {
         this.updateStatus('Ejecting CD...');
         
         try {
-            const response = await fetch('/api/eject', {
+            const response = await fetch(this.api('eject'), {
                 method: 'POST'
             });
             const data = await response.json();
             
             if (data.success) {
-                // Stop audio if playing
-                this.stop();
-                
-                // Clear track list and album info
-                this.tracks = [];
-                document.getElementById('track-list').innerHTML = '';
-                document.getElementById('cd-info').style.display = 'block';
-                document.getElementById('cd-info').innerHTML = '<p>CD ejected</p>';
-                document.getElementById('album-info').style.display = 'none';
-                document.getElementById('search-album').style.display = 'none';
-                document.getElementById('current-track').textContent = 'No track selected';
-                
+                this.clearDisc();
                 this.updateStatus('CD ejected successfully');
             } else {
                 this.updateStatus('Error: ' + (data.error || 'Failed to eject CD'));
@@ -288,6 +408,21 @@ class WebCDPlayer {
         }
     }
     
+    clearDisc() {
+        // Stop audio if playing
+        this.stop();
+        
+        // Clear track list and album info
+        this.tracks = [];
+        this.discId = null;
+        document.getElementById('track-list').innerHTML = '';
+        document.getElementById('cd-info').style.display = 'block';
+        document.getElementById('cd-info').innerHTML = '<p>CD ejected</p>';
+        document.getElementById('album-info').style.display = 'none';
+        document.getElementById('search-album').style.display = 'none';
+        document.getElementById('current-track').textContent = 'No track selected';
+    }
+    
     highlightActiveTrack() {
         document.querySelectorAll('.track-item').forEach(item => {
             if (parseInt(item.dataset.track) === this.currentTrack) {
@@ -336,9 +471,9 @@ class WebCDPlayer {
     
     async loadSettings() {
         try {
-            const response = await fetch('/api/settings');
+            const response = await fetch(this.api('settings'));
             if (response.ok) {
-                this.streamSettings = await response.json();
+                this.streamSettings = Object.assign(await response.json(), this.quality);
                 this.updateSettingsUI();
             }
         } catch (error) {
@@ -373,23 +508,27 @@ class WebCDPlayer {
     }
     
     async applySettings() {
-        const settings = {
+        // Quality is chosen per listener and sent with each stream request
+        this.quality = {
             format: document.getElementById('format').value,
-            bitrate: document.getElementById('bitrate').value,
+            bitrate: document.getElementById('bitrate').value
+        };
+        localStorage.setItem('webcd-quality', JSON.stringify(this.quality));
+        const settings = {
             buffer_size: document.getElementById('buffer-size').value,
             paranoia_mode: document.getElementById('paranoia-mode').value,
             preload_seconds: parseInt(document.getElementById('preload-seconds').value)
         };
         
         try {
-            const response = await fetch('/api/settings', {
+            const response = await fetch(this.api('settings'), {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(settings)
             });
             
             if (response.ok) {
-                this.streamSettings = await response.json();
+                this.streamSettings = Object.assign(await response.json(), this.quality);
                 this.updateStatus('Settings applied successfully');
                 
                 // Save to localStorage for persistence
@@ -419,6 +558,16 @@ class WebCDPlayer {
         document.getElementById('album-search-input').value = '';
     }
     
+    // MusicBrainz answers 202 while a request is on its way: ask again when told to
+    async fetchMusicBrainz(url, options) {
+        while (true) {
+            const response = await fetch(url, options);
+            const data = await response.json();
+            if (response.status !== 202) return data;
+            await new Promise(resolve => setTimeout(resolve, data.retry_after * 1000));
+        }
+    }
+    
     async searchAlbums() {
         const query = document.getElementById('album-search-input').value.trim();
         if (!query) return;
@@ -427,14 +576,12 @@ class WebCDPlayer {
         resultsDiv.innerHTML = '<p>Searching...</p>';
         
         try {
-            const response = await fetch('/api/search-album', {
+            const data = await this.fetchMusicBrainz('/api/search-album', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ query })
             });
             
-            const data = await response.json();
-            
             if (data.success && data.albums.length > 0) {
                 resultsDiv.innerHTML = data.albums.map(album => `
                     <div class="album-result brushed-metal" data-id="${album.id}">
@@ -448,6 +595,8 @@ class WebCDPlayer {
                 resultsDiv.querySelectorAll('.album-result').forEach(div => {
                     div.addEventListener('click', () => this.selectAlbum(div.dataset.id));
                 });
+            } else if (data.retry_after) {
+                resultsDiv.innerHTML = `<p>MusicBrainz is busy. Try again in ${Math.ceil(data.retry_after)} seconds.</p>`;
             } else {
                 resultsDiv.innerHTML = '<p>No albums found. Try a different search.</p>';
             }
@@ -461,14 +610,12 @@ class WebCDPlayer {
         this.updateStatus('Setting album information...');
         
         try {
-            const response = await fetch('/api/set-album', {
+            const data = await this.fetchMusicBrainz(this.api('set-album'), {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ release_id: releaseId })
             });
             
-            const data = await response.json();
-            
             if (data.success) {
                 // Update album info
                 if (data.album) {
@@ -502,15 +649,19 @@ class WebCDPlayer {
         document.getElementById('device-selector-modal').style.display = 'none';
     }
     
-    async loadDevices() {
+    async loadDevices(rescan = false) {
         this.updateStatus('Loading device list...');
         
         try {
-            const response = await fetch('/api/devices');
+            const response = await fetch(rescan ? '/api/devices?refresh=1' : '/api/devices');
             const data = await response.json();
             
             if (data.success) {
-                this.displayDevices(data.devices, data.current_device);
+                if (!this.deviceId) {
+                    this.deviceId = data.current_device_id;
+                    this.currentDevice = data.current_device;
+                }
+                this.displayDevices(data.devices);
                 this.updateStatus('Device list loaded');
             } else {
                 this.updateStatus('Error loading devices');
@@ -521,7 +672,7 @@ class WebCDPlayer {
         }
     }
     
-    displayDevices(devices, currentDevice) {
+    displayDevices(devices) {
         const deviceList = document.getElementById('device-list');
         deviceList.innerHTML = '';
         
@@ -533,7 +684,7 @@ class WebCDPlayer {
         devices.forEach(device => {
             const deviceItem = document.createElement('div');
             deviceItem.className = 'device-item';
-            if (device.device === currentDevice) {
+            if (device.id === this.deviceId) {
                 deviceItem.classList.add('active');
             }
             
@@ -548,35 +699,15 @@ class WebCDPlayer {
                 <p class="device-status">Status: ${mediaStatus}</p>
             `;
             
-            deviceItem.addEventListener('click', () => this.selectDevice(device.device));
+            deviceItem.addEventListener('click', () => this.selectDevice(device));
             deviceList.appendChild(deviceItem);
         });
     }
     
-    async selectDevice(devicePath) {
-        this.updateStatus(`Switching to ${devicePath}...`);
-        
-        try {
-            const response = await fetch('/api/set-device', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ device: devicePath })
-            });
-            
-            const data = await response.json();
-            
-            if (data.success) {
-                this.updateStatus(`Switched to ${devicePath}`);
-                this.closeDeviceSelector();
-                // Refresh CD info with new device
-                this.refreshCDInfo();
-            } else {
-                this.updateStatus('Error: ' + (data.error || 'Failed to switch device'));
-            }
-        } catch (error) {
-            console.error('Error switching device:', error);
-            this.updateStatus('Error switching device');
-        }
+    selectDevice(device) {
+        // Only this page switches; other listeners stay on their drives
+        this.closeDeviceSelector();
+        this.switchDevice(device.id, device.device);
     }
 }
 
@@ -0,0 +1,96 @@
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on non-Unix platforms
+    fcntl = None
+
+# linux/fcntl.h: resize a pipe's kernel buffer
+F_SETPIPE_SZ = 1031
+
+MIN_CHUNK_SIZE = 4096
+MAX_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_size(value, default=256 * 1024):
+    """'256k' / '1m' / '4096' -> bytes, clamped to [MIN_CHUNK_SIZE, MAX_CHUNK_SIZE]"""
+    try:
+        value = str(value).strip().lower()
+        multiplier = {'k': 1024, 'm': 1024 * 1024}.get(value[-1:], 1)
+        size = int(value.rstrip('km')) * multiplier
+    except ValueError:
+        size = default
+    return max(MIN_CHUNK_SIZE, min(size, MAX_CHUNK_SIZE))
+
+
+class BufferPool:
+    """Reusable bytearrays, so every new stream does not allocate its read buffer"""
+
+    def __init__(self, max_free=16):
+        self.max_free = max_free
+        self.free = {}  # size -> [bytearray]
+        self.lock = threading.Lock()
+
+    def acquire(self, size):
+        with self.lock:
+            buffers = self.free.get(size)
+            if buffers:
+                return buffers.pop()
+        return bytearray(size)
+
+    def release(self, buffer):
+        with self.lock:
+            buffers = self.free.setdefault(len(buffer), [])
+            if len(buffers) < self.max_free:
+                buffers.append(buffer)
+
+
+POOL = BufferPool()
+
+
+def grow_pipe(stream, size):
+    """Enlarge a pipe's kernel buffer to ``size`` so one read can return a whole chunk"""
+    if fcntl is None:
+        return
+    try:
+        fcntl.fcntl(stream.fileno(), F_SETPIPE_SZ, size)
+    except (OSError, ValueError, AttributeError):
+        # Not a pipe, or above /proc/sys/fs/pipe-max-size
+        pass
+
+
+def read_chunks(stream, chunk_size, limit=None, pool=POOL):
+    """Yield up to ``chunk_size`` bytes at a time from a binary stream.
+
+    Data is read with readinto() into one pooled buffer. Reads that return
+    less than asked for (a pipe that is empty for now) are coalesced until
+    the chunk is full or the source has nothing more ready, so fast
+    sources give few large chunks and live ones are not held back. Each
+    chunk costs one copy into the bytes object handed out. ``limit`` stops
+    after that many bytes.
+    """
+    readinto = getattr(stream, 'readinto1', None) or stream.readinto
+    buffer = pool.acquire(chunk_size)
+    view = memoryview(buffer)
+    try:
+        filled = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            want = chunk_size - filled
+            if remaining is not None:
+                want = min(want, remaining - filled)
+            n = readinto(view[filled:filled + want])
+            if not n:
+                break
+            filled += n
+            # Hand the chunk out once full, or when the source ran dry for now
+            if filled == chunk_size or n < want or (remaining is not None and filled == remaining):
+                if remaining is not None:
+                    remaining -= filled
+                yield bytes(view[:filled])
+                filled = 0
+        if filled:
+            yield bytes(view[:filled])
+    finally:
+        view.release()
+        pool.release(buffer)
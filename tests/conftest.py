@@ -0,0 +1,119 @@
+import ctypes
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cdtoc import (CDROMREADTOCHDR, CDROMREADTOCENTRY, CDROM_DRIVE_STATUS, CDROM_LBA, CDROM_LEADOUT,
+                   CDROM_DATA_TRACK, CDS_DISC_OK, TOCHDR_FORMAT, TOCENTRY_FORMAT)  # noqa: E402
+from cdaudio import CDROMREADAUDIO, unpack_read_audio  # noqa: E402
+from pcm_cache import BYTES_PER_SECTOR  # noqa: E402
+
+
+class FakeCdrom:
+    """The CDROM ioctls of a drive holding a disc with the given TOC.
+
+    ``ioctl`` has the signature of fcntl.ioctl; ``requests`` records every
+    (request, argument) it was called with. CDROMREADAUDIO reads ``pcm``
+    from LBA 0 on; a read touching one of ``bad_sectors`` (LBA -> failures
+    left, None for always) fails with EIO.
+    """
+
+    def __init__(self, first_track, last_track, offsets, leadout, data_tracks=(), status=CDS_DISC_OK,
+                 pcm=b'', bad_sectors=None):
+        self.first_track = first_track
+        self.last_track = last_track
+        self.offsets = list(offsets)
+        self.leadout = leadout
+        self.data_tracks = set(data_tracks)
+        self.status = status
+        self.pcm = pcm
+        self.bad_sectors = dict(bad_sectors or {})
+        self.requests = []
+
+    def read_audio(self, arg):
+        lba, nframes, address = unpack_read_audio(arg)
+        for sector in range(lba, lba + nframes):
+            if sector in self.bad_sectors:
+                failures = self.bad_sectors[sector]
+                if failures is None or failures > 0:
+                    if failures:
+                        self.bad_sectors[sector] = failures - 1
+                    raise OSError(5, 'Input/output error')
+        data = self.pcm[lba * BYTES_PER_SECTOR:(lba + nframes) * BYTES_PER_SECTOR]
+        ctypes.memmove(address, data, len(data))
+        return arg
+
+    def ioctl(self, fd, request, arg):
+        self.requests.append((request, arg))
+        if request == CDROMREADTOCHDR:
+            return struct.pack(TOCHDR_FORMAT, self.first_track, self.last_track)
+        if request == CDROMREADTOCENTRY:
+            track, _, address_format, _, _ = struct.unpack(TOCENTRY_FORMAT, arg)
+            assert address_format == CDROM_LBA
+            if track == CDROM_LEADOUT:
+                lba, ctrl = self.leadout, 0
+            else:
+                lba = self.offsets[track - self.first_track]
+                ctrl = CDROM_DATA_TRACK if track in self.data_tracks else 0
+            # adr 1 (position) in the low nibble, ctrl in the high one
+            return struct.pack(TOCENTRY_FORMAT, track, ctrl << 4 | 1, address_format, lba, 0)
+        if request == CDROM_DRIVE_STATUS:
+            return self.status
+        if request == CDROMREADAUDIO:
+            return self.read_audio(arg)
+        raise OSError(25, 'Inappropriate ioctl for device')
+
+
+@pytest.fixture
+def device(tmp_path):
+    """A file to stand in for the drive's device node"""
+    path = tmp_path / 'sr0'
+    path.write_bytes(b'')
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py, imported with its caches in a temporary directory and no drives or network"""
+    os.environ.update({
+        'WEBCD_CACHE_DIR': str(tmp_path_factory.mktemp('cache')),
+        'WEBCD_DEVICE_MONITOR': '0',
+        'WEBCD_IMAGE_DEVICES': '0',
+        'WEBCD_OUTPUT': 'null',
+        # Lookups go to stub servers; nothing listens on the discard port
+        'WEBCD_GNUDB_HOST': '127.0.0.1',
+        'WEBCD_GNUDB_PORT': '9',
+        'WEBCD_MUSICBRAINZ_HOST': '127.0.0.1:9',
+    })
+    for name in ('WEBCD_DEVICE', 'WEBCD_SOURCES'):
+        os.environ.pop(name, None)
+    import app
+    return app
+
+
+@pytest.fixture
+def drive_player(app_module, tmp_path):
+    """Factory of players for fake drives holding a disc with a given TOC"""
+    from disc_cache import DiscCache
+    from sources import DriveSource
+    created = []
+
+    def make(toc, **kwargs):
+        path = tmp_path / f'sr-{tmp_path.name}-{len(created)}'
+        path.write_bytes(b'')
+        player = app_module.players.player_for(str(path))
+        drive = FakeCdrom(toc.first_track, toc.last_track, toc.offsets, toc.leadout, toc.data_tracks, **kwargs)
+        player.source = DriveSource(str(path), player.device_id, ioctl=drive.ioctl)
+        # Nothing known about the disc from earlier tests
+        player.disc_cache = DiscCache(':memory:')
+        created.append(player)
+        return player
+
+    yield make
+    for player in created:
+        player.stop()
+        app_module.players.players.pop(player.device_id, None)
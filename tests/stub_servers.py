@@ -0,0 +1,200 @@
+"""Local stand-ins for GNUDB (CDDBP) and the MusicBrainz web service.
+
+Both listen on 127.0.0.1 on a free port, answer after ``delay`` seconds
+and count what they were asked, so tests can check what reached them.
+"""
+import contextlib
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+
+class Busy:
+    """Counts requests being answered, so tests can wait for slow ones to finish"""
+
+    active = 0
+
+    @contextlib.contextmanager
+    def busy(self):
+        with self.lock:
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def wait_idle(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class StubCDDBHandler(socketserver.StreamRequestHandler):
+    def send(self, *lines):
+        self.wfile.write(''.join(line + '\r\n' for line in lines).encode())
+
+    def handle(self):
+        server = self.server
+        server.count('connections')
+        self.send('201 stub CDDBP server ready')
+        for raw in self.rfile:
+            command = raw.decode().strip().split()
+            if command[:2] == ['cddb', 'hello']:
+                server.count('hellos')
+                self.send('200 Hello and welcome')
+            elif command[:1] == ['proto']:
+                self.send('201 OK, CDDB protocol level now: 6')
+            elif command[:2] == ['cddb', 'query']:
+                server.count('queries')
+                with server.busy():
+                    time.sleep(server.delay)
+                    disc_id = command[2]
+                    if disc_id in server.discs:
+                        self.send('200 rock {} {}'.format(disc_id, server.discs[disc_id][0]))
+                    else:
+                        self.send('202 No match found')
+            elif command[:2] == ['cddb', 'read']:
+                title, titles = self.server.discs[command[3]]
+                self.send(f'210 {command[2]} {command[3]} CD database entry follows',
+                          '# xmcd', f'DISCID={command[3]}', f'DTITLE={title}',
+                          *(f'TTITLE{i}={t}' for i, t in enumerate(titles)), '.')
+                if server.close_after_read:
+                    # Like a server closing idle sessions before the client does
+                    return
+            elif command[:1] == ['quit']:
+                self.send('230 Goodbye')
+                return
+            else:
+                self.send('500 Unrecognized command')
+
+
+class StubCDDBServer(Busy, socketserver.ThreadingTCPServer):
+    """CDDBP server knowing ``discs``: FreeDB ID -> ("Artist / Album", [track titles])
+
+    With ``close_after_read`` it hangs up after every disc entry it sends.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, discs=None, delay=0.0, close_after_read=False):
+        super().__init__(('127.0.0.1', 0), StubCDDBHandler)
+        self.discs = dict(discs or {})
+        self.delay = delay
+        self.close_after_read = close_after_read
+        self.counts = {'connections': 0, 'hellos': 0, 'queries': 0}
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def release_xml(disc_id, artist, album, year, titles):
+    tracks = ''.join(f'<track id="t{i}"><position>{i}</position>'
+                     f'<recording id="r{i}"><title>{escape(title)}</title></recording></track>'
+                     for i, title in enumerate(titles, 1))
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+            f'<disc id="{disc_id}"><release-list count="1">'
+            f'<release id="00000000-0000-0000-0000-000000000001"><title>{escape(album)}</title>'
+            f'<date>{year}</date>'
+            '<artist-credit><name-credit><artist id="00000000-0000-0000-0000-000000000002">'
+            f'<name>{escape(artist)}</name></artist></name-credit></artist-credit>'
+            '<medium-list count="1"><medium><position>1</position>'
+            f'<disc-list count="1"><disc id="{disc_id}"/></disc-list>'
+            f'<track-list count="{len(titles)}">{tracks}</track-list>'
+            '</medium></medium-list></release></release-list></disc></metadata>')
+
+
+def search_xml(query):
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+            '<release-list count="1" offset="0">'
+            f'<release id="00000000-0000-0000-0000-000000000003"><title>{escape(query)}</title></release>'
+            '</release-list></metadata>')
+
+
+class StubMusicBrainzHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        with server.lock:
+            server.times.append(time.monotonic())
+            server.paths.append(self.path)
+        with server.busy():
+            self.respond(server, url)
+
+    def respond(self, server, url):
+        time.sleep(server.delay)
+        headers = {}
+        status, body = 404, '<?xml version="1.0"?><error><text>Not Found</text></error>'
+        with server.lock:
+            unavailable = server.unavailable > 0
+            server.unavailable -= unavailable
+        if unavailable:
+            status, body = 503, '<?xml version="1.0"?><error><text>Rate limit exceeded</text></error>'
+            if server.retry_after is not None:
+                headers['Retry-After'] = str(server.retry_after)
+        elif url.path.startswith('/ws/2/discid/'):
+            disc_id = url.path.rsplit('/', 1)[1]
+            if disc_id in server.discs:
+                status, body = 200, release_xml(disc_id, *server.discs[disc_id])
+        elif url.path == '/ws/2/release/' or url.path == '/ws/2/release':
+            status, body = 200, search_xml(parse_qs(url.query).get('query', [''])[0])
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubMusicBrainzServer(Busy, ThreadingHTTPServer):
+    """MusicBrainz web service knowing ``discs``: disc ID -> (artist, album, year, [track titles]).
+
+    Release searches find one release titled with the query. The next
+    ``unavailable`` requests are answered 503, with ``retry_after`` as their
+    Retry-After header unless it is None.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, discs=None, delay=0.0):
+        super().__init__(('127.0.0.1', 0), StubMusicBrainzHandler)
+        self.discs = dict(discs or {})
+        self.delay = delay
+        self.unavailable = 0
+        self.retry_after = None
+        self.times = []  # monotonic time of every request
+        self.paths = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def host(self):
+        return f'127.0.0.1:{self.server_address[1]}'
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
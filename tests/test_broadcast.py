@@ -0,0 +1,76 @@
+import threading
+import time
+
+from broadcast import Broadcaster, BroadcastRegistry
+
+CHUNK = 1000
+
+
+def numbered_chunks(count, gate=None):
+    """``count`` chunks, each filled with its own number, once ``gate`` is set"""
+    if gate is not None:
+        gate.wait(5)
+    for n in range(count):
+        yield bytes([n]) * CHUNK
+
+
+def received(subscription, delay=0.0):
+    """Chunk numbers read from a subscription, ``delay`` seconds apart"""
+    numbers = []
+    for data in subscription:
+        assert len(data) % CHUNK == 0
+        numbers.extend(data[i] for i in range(0, len(data), CHUNK))
+        time.sleep(delay)
+    return numbers
+
+
+def test_slow_listener_gets_every_chunk():
+    # The ring holds 10 chunks; the listener takes longer than stall_timeout over them
+    broadcaster = Broadcaster('lossless', numbered_chunks(40), ring_bytes=10 * CHUNK, stall_timeout=0.05)
+    assert received(broadcaster.subscribe(), delay=0.01) == list(range(40))
+    assert broadcaster.bytes_skipped == 0
+
+
+def test_fast_and_slow_listeners_share_without_loss():
+    both_listening = threading.Event()
+    broadcaster = Broadcaster('shared', numbered_chunks(40, both_listening), ring_bytes=5 * CHUNK,
+                              stall_timeout=0.05)
+    results = {}
+    listeners = [threading.Thread(target=lambda: results.update(slow=received(broadcaster.subscribe(), 0.01))),
+                 threading.Thread(target=lambda: results.update(fast=received(broadcaster.subscribe())))]
+    for listener in listeners:
+        listener.start()
+    while broadcaster.subscriber_count < 2:
+        time.sleep(0.01)
+    both_listening.set()
+    for listener in listeners:
+        listener.join()
+    assert results == {'fast': list(range(40)), 'slow': list(range(40))}
+    # Never much more than the ring in memory, however slow the listener
+    assert broadcaster.buffered <= 6 * CHUNK
+
+
+def test_skip_ahead_drops_what_a_stalled_listener_missed():
+    broadcaster = Broadcaster('mp3', numbered_chunks(40), fmt='mp3', ring_bytes=10 * CHUNK, skip_ahead=True,
+                              stall_timeout=0.05)
+    numbers = received(broadcaster.subscribe(), delay=0.1)
+    assert numbers == sorted(numbers) and numbers[-1] == 39
+    assert len(numbers) < 40
+    assert broadcaster.bytes_skipped == (40 - len(numbers)) * CHUNK
+
+
+def test_registry_reports_skips():
+    more = threading.Event()
+
+    def source():
+        yield bytes([0]) * CHUNK
+        more.wait(5)
+
+    registry = BroadcastRegistry()
+    broadcaster = registry.get(('dev', 1, 'mp3', '192k', 0), source, fmt='mp3')
+    subscription = broadcaster.subscribe()
+    assert next(subscription) == bytes([0]) * CHUNK
+    [stats] = registry.stats()
+    assert stats['bytes_skipped'] == 0 and stats['subscribers'] == 1
+    more.set()
+    subscription.close()
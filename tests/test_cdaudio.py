@@ -0,0 +1,116 @@
+import pytest
+
+from cdaudio import SectorReader
+from cdtoc import (Toc, CDS_DISC_OK, CDS_NO_DISC, CDS_TRAY_OPEN, drive_status, parse_cdparanoia_toc,
+                   read_toc)
+from conftest import FakeCdrom
+from pcm_cache import BYTES_PER_SECTOR
+
+# The disc of the MusicBrainz documentation, as a drive reports it (no lead-in)
+DISC = dict(first_track=1, last_track=6, offsets=[0, 15213, 32164, 46442, 63264, 80339], leadout=95312)
+
+# What `cdparanoia -Q` prints for it
+CDPARANOIA_LISTING = '''\
+cdparanoia III release 10.2 (September 11, 2008)
+
+Table of contents (audio tracks only):
+track        length               begin        copy pre ch
+===========================================================
+  1.    15213 [03:22.63]        0 [00:00.00]    no   no  2
+  2.    16951 [03:46.01]    15213 [03:22.63]    no   no  2
+  3.    14278 [03:10.28]    32164 [07:08.64]    no   no  2
+  4.    16822 [03:44.22]    46442 [10:19.17]    no   no  2
+  5.    17075 [03:47.50]    63264 [14:03.39]    no   no  2
+  6.    14973 [03:19.48]    80339 [17:51.14]    no   no  2
+TOTAL    95312 [21:10.62]    (audio only)
+'''
+
+
+def sector_pcm(sectors):
+    """PCM whose every sector starts with its own LBA, so misplaced sectors show"""
+    return b''.join(lba.to_bytes(4, 'little') + bytes(BYTES_PER_SECTOR - 4) for lba in range(sectors))
+
+
+def read_all(reader):
+    return b''.join(reader)
+
+
+def test_read_toc_fixture(device):
+    toc = read_toc(device, ioctl=FakeCdrom(**DISC).ioctl)
+    assert toc.track_sectors(6) == (80339, 14973)
+    assert toc.musicbrainz_id() == '49HHV7Eb8UKF3aQiNmu1GR8vKTY-'
+    assert toc.freedb_id() == '3404f606'
+
+
+def test_cdparanoia_listing_matches_ioctl_toc(device):
+    assert parse_cdparanoia_toc(CDPARANOIA_LISTING) == read_toc(device, ioctl=FakeCdrom(**DISC).ioctl)
+    assert parse_cdparanoia_toc('cdparanoia: no disc') is None
+
+
+@pytest.mark.parametrize('status', [CDS_DISC_OK, CDS_NO_DISC, CDS_TRAY_OPEN])
+def test_drive_status(device, status):
+    assert drive_status(device, ioctl=FakeCdrom(**DISC, status=status).ioctl) == status
+
+
+def test_sector_reader(device):
+    pcm = sector_pcm(200)
+    drive = FakeCdrom(1, 1, [0], 200, pcm=pcm)
+    reader = SectorReader(device, 10, 150, frames_per_read=64, ioctl=drive.ioctl)
+    chunks = list(reader)
+    assert [len(chunk) // BYTES_PER_SECTOR for chunk in chunks] == [64, 64, 22]
+    assert b''.join(chunks) == pcm[10 * BYTES_PER_SECTOR:160 * BYTES_PER_SECTOR]
+    assert (reader.bytes_read, reader.retried, reader.skipped) == (150 * BYTES_PER_SECTOR, 0, 0)
+
+
+def test_sector_reader_caps_reads_at_one_second(device):
+    drive = FakeCdrom(1, 1, [0], 200, pcm=sector_pcm(200))
+    reader = SectorReader(device, 0, 200, frames_per_read=500, ioctl=drive.ioctl)
+    assert [len(chunk) // BYTES_PER_SECTOR for chunk in reader] == [75, 75, 50]
+
+
+def test_sector_reader_retries(device):
+    pcm = sector_pcm(100)
+    # Sector 30 fails twice, then reads
+    drive = FakeCdrom(1, 1, [0], 100, pcm=pcm, bad_sectors={30: 2})
+    reader = SectorReader(device, 0, 100, frames_per_read=50, retries=3, ioctl=drive.ioctl)
+    assert read_all(reader) == pcm
+    # The bulk read failed once; the single sector read of 30 once more
+    assert (reader.retried, reader.skipped) == (1, 0)
+
+
+def test_sector_reader_skips_unreadable_sectors(device):
+    pcm = sector_pcm(100)
+    drive = FakeCdrom(1, 1, [0], 100, pcm=pcm, bad_sectors={30: None, 31: None})
+    reader = SectorReader(device, 0, 100, frames_per_read=50, retries=3, ioctl=drive.ioctl)
+    data = read_all(reader)
+    silence = bytes(2 * BYTES_PER_SECTOR)
+    assert data == pcm[:30 * BYTES_PER_SECTOR] + silence + pcm[32 * BYTES_PER_SECTOR:]
+    assert (reader.retried, reader.skipped) == (6, 2)
+
+
+def test_sector_reader_fails_when_nothing_reads(device):
+    # A drive that cannot read audio at all
+    drive = FakeCdrom(1, 1, [0], 100, pcm=sector_pcm(100), bad_sectors={lba: None for lba in range(100)})
+    reader = SectorReader(device, 0, 100, frames_per_read=10, ioctl=drive.ioctl)
+    with pytest.raises(OSError):
+        read_all(reader)
+    assert reader.bytes_read == 0
+
+
+def test_sector_reader_keeps_going_after_a_bad_stretch(device):
+    # Only a later chunk is unreadable: it becomes silence instead of an error
+    drive = FakeCdrom(1, 1, [0], 30, pcm=sector_pcm(30), bad_sectors={lba: None for lba in range(10, 20)})
+    reader = SectorReader(device, 0, 30, frames_per_read=10, retries=1, ioctl=drive.ioctl)
+    data = read_all(reader)
+    assert data[10 * BYTES_PER_SECTOR:20 * BYTES_PER_SECTOR] == bytes(10 * BYTES_PER_SECTOR)
+    assert reader.skipped == 10
+
+
+def test_toc_of_fake_disc_reads_through(device):
+    # The TOC and the audio of the same fake drive agree on where track 2 starts
+    toc = Toc(1, 2, [0, 40], 100)
+    drive = FakeCdrom(1, 2, toc.offsets, toc.leadout, pcm=sector_pcm(100))
+    start, length = read_toc(device, ioctl=drive.ioctl).track_sectors(2)
+    data = read_all(SectorReader(device, start, length, ioctl=drive.ioctl))
+    assert int.from_bytes(data[:4], 'little') == 40
+    assert len(data) == 60 * BYTES_PER_SECTOR
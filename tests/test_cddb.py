@@ -0,0 +1,107 @@
+import pytest
+
+from cddb import CDDBClient, parse_entry
+from stub_servers import StubCDDBServer
+
+DISC_ID = '1b04b004'
+OFFSETS = [150, 15150, 30150, 57150]
+SECONDS = 1202
+ENTRY = ('Artist / Album', ['One', 'Two', 'Three', 'Data'])
+
+
+@pytest.fixture
+def server():
+    server = StubCDDBServer({DISC_ID: ENTRY})
+    yield server
+    server.close()
+
+
+def test_lookup(server):
+    client = CDDBClient('127.0.0.1', server.port)
+    album, titles = client.lookup(DISC_ID, OFFSETS, SECONDS)
+    assert album == {'artist': 'Artist', 'album': 'Album', 'source': 'GNUDB'}
+    assert titles == {1: 'One', 2: 'Two', 3: 'Three', 4: 'Data'}
+    client.close()
+
+
+def test_connections_are_reused(server):
+    client = CDDBClient('127.0.0.1', server.port)
+    for _ in range(5):
+        assert client.lookup(DISC_ID, OFFSETS, SECONDS)
+    # One connection, greeted once, for every lookup
+    assert server.counts == {'connections': 1, 'hellos': 1, 'queries': 5}
+    stats = client.stats()
+    assert (stats['connections'], stats['reused'], stats['idle_connections']) == (1, 4, 1)
+    client.close()
+
+
+def test_without_a_pool_every_lookup_connects(server):
+    client = CDDBClient('127.0.0.1', server.port, pool_size=0)
+    for _ in range(3):
+        client.lookup(DISC_ID, OFFSETS, SECONDS)
+    assert server.counts == {'connections': 3, 'hellos': 3, 'queries': 3}
+
+
+def test_idle_connections_expire(server):
+    client = CDDBClient('127.0.0.1', server.port, idle_timeout=0)
+    client.lookup(DISC_ID, OFFSETS, SECONDS)
+    client.lookup(DISC_ID, OFFSETS, SECONDS)
+    assert server.counts['connections'] == 2
+    client.close()
+
+
+def test_unknown_discs_are_not_asked_for_again(server):
+    client = CDDBClient('127.0.0.1', server.port)
+    for _ in range(3):
+        assert client.lookup('deadbeef', OFFSETS, SECONDS) is None
+    assert server.counts['queries'] == 1
+    stats = client.stats()
+    assert (stats['not_found'], stats['negative_hits'], stats['cached_misses']) == (1, 2, 1)
+    # Known discs are not affected, and clearing the misses asks again
+    assert client.lookup(DISC_ID, OFFSETS, SECONDS)
+    client.clear_misses()
+    assert client.lookup('deadbeef', OFFSETS, SECONDS) is None
+    assert server.counts['queries'] == 3
+    client.close()
+
+
+def test_negative_answers_expire(server):
+    client = CDDBClient('127.0.0.1', server.port, negative_ttl=0)
+    client.lookup('deadbeef', OFFSETS, SECONDS)
+    client.lookup('deadbeef', OFFSETS, SECONDS)
+    assert server.counts['queries'] == 2
+    client.close()
+
+
+def test_reconnects_when_the_server_hung_up():
+    server = StubCDDBServer({DISC_ID: ENTRY}, close_after_read=True)
+    try:
+        client = CDDBClient('127.0.0.1', server.port, retries=0)
+        for _ in range(3):
+            assert client.lookup(DISC_ID, OFFSETS, SECONDS)
+        # The pooled connection was dead each time: a fresh one, without
+        # counting as a failed lookup
+        assert server.counts['connections'] == 3
+        stats = client.stats()
+        assert (stats['errors'], stats['retries'], stats['found']) == (0, 0, 3)
+        client.close()
+    finally:
+        server.close()
+
+
+def test_server_down():
+    server = StubCDDBServer()
+    port = server.port
+    server.close()
+    client = CDDBClient('127.0.0.1', port, retries=1)
+    with pytest.raises(OSError):
+        client.lookup(DISC_ID, OFFSETS, SECONDS)
+    assert client.stats()['errors'] == 1 and client.stats()['retries'] == 1
+
+
+def test_parse_entry_joins_continued_lines():
+    album, titles = parse_entry(['DTITLE=Artist / Al', 'DTITLE=bum', 'DYEAR=1999', 'TTITLE0=Long ',
+                                 'TTITLE0=title', '# comment'])
+    assert album == {'artist': 'Artist', 'album': 'Album', 'year': '1999', 'source': 'GNUDB'}
+    assert titles == {1: 'Long title'}
+
@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import struct
+
+import pytest
+
+from cdtoc import (Toc, KNOWN_DISC_IDS, CDROMREADTOCHDR, CDROMREADTOCENTRY, CDROM_LEADOUT,
+                   TOCENTRY_FORMAT, check_known_disc_ids, read_toc)
+from conftest import FakeCdrom
+
+
+def reference_musicbrainz_id(first, last, leadout, offsets):
+    """The disc ID as the MusicBrainz documentation spells it out (LBAs with the lead-in)"""
+    slots = [leadout] + offsets + [0] * (99 - len(offsets))
+    data = '%02X%02X' % (first, last) + ''.join('%08X' % value for value in slots)
+    digest = base64.b64encode(hashlib.sha1(data.encode('ascii')).digest()).decode('ascii')
+    return digest.replace('+', '.').replace('/', '_').replace('=', '-')
+
+
+@pytest.mark.parametrize('vector', KNOWN_DISC_IDS, ids=lambda vector: vector['musicbrainz_id'])
+def test_known_disc_ids(vector):
+    toc = Toc.from_musicbrainz_toc(vector['toc'])
+    assert toc.musicbrainz_id() == vector['musicbrainz_id']
+    assert toc.freedb_id() == vector['freedb_id']
+    assert toc.musicbrainz_toc() == vector['toc']
+
+
+def test_check_known_disc_ids():
+    assert check_known_disc_ids() == []
+
+
+def test_single_track():
+    # 5 minutes from LBA 0: 2 s offset (digit sum 2), 300 s long, 1 track
+    toc = Toc(1, 1, [0], 22500)
+    assert toc.freedb_id() == '02012c01'
+    assert toc.musicbrainz_id() == reference_musicbrainz_id(1, 1, 22650, [150])
+    assert toc.cd_discid_output() == '02012c01 1 150 302'
+
+
+def test_99_tracks():
+    toc = Toc(1, 99, [i * 3000 for i in range(99)], 99 * 3000)
+    # Offsets of 40i + 2 seconds sum to 1170 digits (150 mod 255); 3960 s long
+    assert toc.freedb_id() == '960f7863'
+    assert toc.musicbrainz_id() == reference_musicbrainz_id(1, 99, 297150, [i * 3000 + 150 for i in range(99)])
+    assert Toc.from_musicbrainz_toc(toc.musicbrainz_toc()) == toc
+
+
+def test_enhanced_cd():
+    # Three audio tracks, then a data track in a second session
+    toc = Toc(1, 4, [0, 15000, 30000, 57000], 90000, data_tracks=[4])
+    assert toc.audio_tracks() == [1, 2, 3]
+    # The last audio track ends where the session gap starts
+    assert toc.track_sectors(3) == (30000, 57000 - 11400 - 30000)
+    # FreeDB counts the data track and ends at the real lead-out
+    assert toc.freedb_id() == '1b04b004'
+    # MusicBrainz drops it and ends the disc at the session gap
+    assert toc.musicbrainz_toc() == '1 3 45750 150 15150 30150'
+    assert toc.musicbrainz_id() == reference_musicbrainz_id(1, 3, 45750, [150, 15150, 30150])
+
+
+def test_lead_in_offset():
+    # The first track starts 32 sectors late (a longer pregap)
+    toc = Toc(1, 2, [32, 20000], 40000)
+    assert toc.freedb_id() == '12021502'
+    assert toc.cd_discid_output() == '12021502 2 182 20150 535'
+    assert toc.musicbrainz_toc() == '1 2 40150 182 20150'
+    assert toc.musicbrainz_id() == reference_musicbrainz_id(1, 2, 40150, [182, 20150])
+
+
+def test_read_toc(device):
+    drive = FakeCdrom(1, 4, [0, 15000, 30000, 57000], 90000, data_tracks=[4])
+    toc = read_toc(device, ioctl=drive.ioctl)
+    assert toc == Toc(1, 4, [0, 15000, 30000, 57000], 90000, data_tracks=[4])
+    # The header, then one entry per track and the lead-out, in order
+    assert [request for request, _ in drive.requests] == [CDROMREADTOCHDR] + [CDROMREADTOCENTRY] * 5
+    tracks = [struct.unpack(TOCENTRY_FORMAT, arg)[0] for _, arg in drive.requests[1:]]
+    assert tracks == [1, 2, 3, 4, CDROM_LEADOUT]
+
+
+def test_read_toc_invalid_header(device):
+    with pytest.raises(OSError):
+        read_toc(device, ioctl=FakeCdrom(0, 0, [], 0).ioctl)
+
+
+def test_read_toc_missing_device(tmp_path):
+    with pytest.raises(OSError):
+        read_toc(str(tmp_path / 'sr9'), ioctl=FakeCdrom(1, 1, [0], 1000).ioctl)
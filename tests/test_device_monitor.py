@@ -0,0 +1,170 @@
+import socket
+import time
+
+import pytest
+
+import device_monitor
+from cdtoc import CDS_DISC_OK, CDS_NO_DISC, Toc
+from device_monitor import DeviceMonitor, parse_uevent
+
+
+@pytest.fixture
+def hotplug(app_module, tmp_path, monkeypatch):
+    """The app's device monitor with one fake drive node, whose CDROM_DRIVE_STATUS tests set"""
+    players = app_module.players
+    monitor = players.device_monitor
+    path = tmp_path / f'sr-{tmp_path.name}'
+    path.write_bytes(b'')
+    status = {'code': CDS_DISC_OK}
+    monkeypatch.setattr(app_module, 'drive_status', lambda device, ioctl=None: status['code'])
+    monkeypatch.setattr(monitor, 'media_status', lambda device: status['code'] == CDS_DISC_OK)
+    # Whatever the tests add is forgotten afterwards
+    monkeypatch.setattr(monitor, 'registry', {})
+    monkeypatch.setattr(players, 'default_device', None)
+    events = players.events.subscribe()
+    yield str(path), status, events
+    players.events.unsubscribe(events)
+    players.players.pop(players.device_id(str(path)), None)
+    players.available_devices = players.all_devices()
+
+
+def uevent(action, device, **env):
+    return dict(env, ACTION=action, SUBSYSTEM='block', DEVNAME=device)
+
+
+def published(events):
+    """(event, data) pairs published so far"""
+    items = []
+    while not events.empty():
+        items.append(events.get_nowait())
+    return items
+
+
+def test_add_creates_a_player(app_module, hotplug):
+    device, _, events = hotplug
+    players = app_module.players
+    device_id = players.device_id(device)
+    players.device_monitor.handle_uevent(uevent('add', device))
+    player = players.get(device_id)
+    assert player is not None and player.cd_device == device
+    # The first drive becomes the default one
+    assert players.default_device == device_id
+    [(event, data)] = published(events)
+    assert event == 'devices'
+    assert [d['id'] for d in data['devices']] == [device_id]
+    assert data['devices'][0]['has_media'] is True
+    assert data['current_device_id'] == device_id
+
+
+def test_add_twice_is_one_drive(app_module, hotplug):
+    device, _, events = hotplug
+    monitor = app_module.players.device_monitor
+    monitor.handle_uevent(uevent('add', device))
+    monitor.handle_uevent(uevent('add', device))
+    assert len(monitor.devices()) == 1
+    assert len(published(events)) == 1
+
+
+def test_eject_request_clears_the_disc(app_module, hotplug):
+    device, _, events = hotplug
+    players = app_module.players
+    players.device_monitor.handle_uevent(uevent('add', device))
+    player = players.get(players.device_id(device))
+    player.toc = player.source.toc = Toc(1, 1, [0], 1000)
+    player.disc_id = player.toc.freedb_id()
+    published(events)
+
+    players.device_monitor.handle_uevent(uevent('change', device, DISK_EJECT_REQUEST='1'))
+    assert player.toc is None and player.disc_id is None
+    items = published(events)
+    assert ('disc', {'device': device, 'device_id': player.device_id, 'state': 'ejected'}) in items
+    devices = [data for event, data in items if event == 'devices']
+    assert devices and devices[-1]['devices'][0]['has_media'] is False
+
+
+def test_media_change_asks_the_drive(app_module, hotplug):
+    device, status, events = hotplug
+    players = app_module.players
+    status['code'] = CDS_NO_DISC
+    players.device_monitor.handle_uevent(uevent('add', device))
+    published(events)
+
+    status['code'] = CDS_DISC_OK
+    players.device_monitor.handle_uevent(uevent('change', device, DISK_MEDIA_CHANGE='1'))
+    assert ('disc', {'device': device, 'device_id': players.device_id(device), 'state': 'inserted'}) \
+        in published(events)
+    # Same status again: nothing changed, nothing published
+    players.device_monitor.handle_uevent(uevent('change', device, DISK_MEDIA_CHANGE='1'))
+    assert published(events) == []
+
+
+def test_remove_drops_the_player(app_module, hotplug):
+    device, _, events = hotplug
+    players = app_module.players
+    device_id = players.device_id(device)
+    players.device_monitor.handle_uevent(uevent('add', device))
+    published(events)
+
+    players.device_monitor.handle_uevent(uevent('remove', device))
+    assert players.get(device_id) is None
+    assert players.default_device is None
+    items = dict(published(events))
+    assert items['device'] == {'device': None, 'device_id': None}
+    assert items['devices']['devices'] == []
+
+
+def test_rescan_drops_drives_that_are_gone(app_module, hotplug, monkeypatch):
+    device, _, events = hotplug
+    players = app_module.players
+    device_id = players.device_id(device)
+    players.device_monitor.handle_uevent(uevent('add', device))
+    published(events)
+
+    # Unplugged while no uevent was heard, so only a rescan notices
+    monkeypatch.setattr(device_monitor, 'COMMON_DEVICES', [])
+    monkeypatch.setattr(device_monitor.os, 'listdir', lambda path: [])
+    assert players.detect_cd_devices() == []
+    assert players.get(device_id) is None
+    assert players.default_device is None
+    items = dict(published(events))
+    assert items['devices']['devices'] == []
+
+
+def test_uevents_do_not_hold_off_polling(monkeypatch):
+    polled = []
+    monitor = DeviceMonitor(probe=lambda device: None, poll_interval=0.1)
+    monitor.registry = {'/dev/sr0': {'device': '/dev/sr0', 'has_media': True}}
+    monitor.media_status = lambda device: polled.append(time.monotonic())
+    kernel, listener = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    monkeypatch.setattr(monitor, '_open_netlink', lambda: listener)
+    monitor.start()
+    # Another device's uevents, more often than the poll interval
+    started = time.monotonic()
+    while time.monotonic() - started < 0.6:
+        kernel.send(b'change@/devices/virtual/block/loop0\0ACTION=change\0SUBSYSTEM=block\0DEVNAME=loop0\0')
+        time.sleep(0.02)
+    monitor.stop()
+    monitor.thread.join(1)
+    kernel.close()
+    assert len(polled) >= 4
+
+
+@pytest.mark.parametrize('env', [
+    {'ACTION': 'add', 'SUBSYSTEM': 'block', 'DEVNAME': 'sda'},
+    {'ACTION': 'add', 'SUBSYSTEM': 'scsi_generic', 'DEVNAME': 'sr0'},
+    {'ACTION': 'add', 'SUBSYSTEM': 'block'},
+])
+def test_other_devices_are_ignored(env):
+    changes = []
+    monitor = DeviceMonitor(probe=lambda device: pytest.fail('probed'),
+                            on_change=lambda *args: changes.append(args))
+    monitor.handle_uevent(env)
+    assert changes == [] and monitor.devices() == []
+
+
+def test_parse_uevent():
+    data = b'change@/devices/pci0000:00/ata1/host0/block/sr0\0ACTION=change\0SUBSYSTEM=block\0' \
+           b'DEVNAME=sr0\0DISK_MEDIA_CHANGE=1\0'
+    assert parse_uevent(data) == {
+        'ACTION': 'change', 'DEVPATH': '/devices/pci0000:00/ata1/host0/block/sr0',
+        'SUBSYSTEM': 'block', 'DEVNAME': 'sr0', 'DISK_MEDIA_CHANGE': '1'}
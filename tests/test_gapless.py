@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+import metrics
+from cdtoc import Toc
+from conftest import FakeCdrom
+from pcm_cache import BYTES_PER_SECTOR, WAV_HEADER_SIZE
+from sources import DriveSource
+
+SECTORS = 75  # one second per track
+TRACKS = 4
+
+
+class SlowCdrom(FakeCdrom):
+    """A FakeCdrom whose reads cost ``seek_time`` unless they directly continue the previous one"""
+
+    # A drive left alone this long has to spin up and find its place again
+    IDLE_TIME = 0.2
+
+    def __init__(self, *args, seek_time=0.3, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seek_time = seek_time
+        self.next_lba = None
+        self.last_read = 0
+        # One head, so concurrent readers queue up behind each other
+        self.head = threading.Lock()
+
+    def read_audio(self, arg):
+        from cdaudio import unpack_read_audio
+        lba, nframes, _ = unpack_read_audio(arg)
+        with self.head:
+            if lba != self.next_lba or time.monotonic() - self.last_read > self.IDLE_TIME:
+                time.sleep(self.seek_time)
+            self.next_lba = lba + nframes
+            self.last_read = time.monotonic()
+            return super().read_audio(arg)
+
+
+@pytest.fixture
+def disc_player(app_module, drive_player):
+    """A player for a slow fake drive whose tracks' samples all start with their track number"""
+    toc = Toc(1, TRACKS, [i * SECTORS for i in range(TRACKS)], TRACKS * SECTORS)
+    pcm = b''.join(bytes([track]) * (SECTORS * BYTES_PER_SECTOR) for track in range(1, TRACKS + 1))
+    player = drive_player(toc)
+    drive = SlowCdrom(1, TRACKS, toc.offsets, toc.leadout, pcm=pcm)
+    player.source = DriveSource(player.cd_device, player.device_id, inprocess=True, ioctl=drive.ioctl)
+    player.toc = player.source.toc = toc
+    # A disc ID of its own, so nothing comes from the PCM cache of earlier tests
+    player.disc_id = f'gap-{player.device_id}'
+    player.stream_settings['format'] = 'wav'
+    yield player, pcm
+    player.cancel_prefetch()
+
+
+def first_audio(client, player, track):
+    """Seconds from asking for ``track`` to its first sample, and the whole response"""
+    requested = time.monotonic()
+    response = client.get(f'/api/devices/{player.device_id}/stream/{track}', buffered=False)
+    data = b''
+    first = None
+    for chunk in response.response:
+        data += chunk
+        if first is None and len(data) > WAV_HEADER_SIZE:
+            first = time.monotonic()
+    response.close()
+    return first - requested, data
+
+
+@pytest.mark.parametrize('window', [0, 1])
+def test_gap_between_tracks(app_module, disc_player, monkeypatch, window):
+    player, pcm = disc_player
+    monkeypatch.setattr(app_module, 'PREFETCH_SECONDS', window)
+    client = app_module.app.test_client()
+    started = time.monotonic()
+    first_audio(client, player, 1)
+    # The listener asks for track 2 once track 1 has played; with a window
+    # as long as the track, track 2 is read meanwhile
+    time.sleep(max(started + SECTORS / 75 - time.monotonic(), 0))
+    gap, data = first_audio(client, player, 2)
+    assert data[WAV_HEADER_SIZE:] == pcm[SECTORS * BYTES_PER_SECTOR:2 * SECTORS * BYTES_PER_SECTOR]
+    if window:
+        assert gap < 0.1
+    else:
+        # The drive seeks before the first sample
+        assert gap >= 0.3
+
+
+def test_wav_joining_a_prefetch_promises_no_length(app_module, disc_player):
+    player, pcm = disc_player
+    track_pcm = pcm[SECTORS * BYTES_PER_SECTOR:2 * SECTORS * BYTES_PER_SECTOR]
+    # Being read from the drive while the listener asks for it
+    player.prefetch(2, 'wav')
+    response = app_module.app.test_client().get(f'/api/devices/{player.device_id}/stream/2')
+    assert response.status_code == 200
+    assert 'Content-Length' not in response.headers and response.headers['Accept-Ranges'] == 'none'
+    assert response.data[WAV_HEADER_SIZE:] == track_pcm
+    # Read completely, the track is cached and sent with its length again
+    response = app_module.app.test_client().get(f'/api/devices/{player.device_id}/stream/2')
+    assert response.headers['Content-Length'] == str(WAV_HEADER_SIZE + len(track_pcm))
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.data[WAV_HEADER_SIZE:] == track_pcm
+
+
+def test_listeners_of_other_tracks_keep_their_prefetch(app_module, disc_player, monkeypatch):
+    player, _ = disc_player
+    monkeypatch.setattr(app_module, 'PREFETCH_SECONDS', 0.5)
+    player.schedule_prefetch(1, 0, 'wav')
+    timer = player.prefetch_timers[(2, 'wav', None)]
+    player.schedule_prefetch(3, 0, 'mp3', '192k')
+    player.schedule_prefetch(1, 0, 'mp3', '192k')
+    assert set(player.prefetch_timers) == {(2, 'wav', None), (4, 'mp3', '192k'), (2, 'mp3', '192k')}
+    assert player.prefetch_timers[(2, 'wav', None)] is timer and not timer.finished.is_set()
+    # The same listener seeking replaces its own timer only
+    player.schedule_prefetch(1, 0.2, 'wav')
+    assert timer.finished.is_set()
+    assert player.prefetch_timers[(2, 'wav', None)] is not timer
+    assert len(player.prefetch_timers) == 3
+    player.cancel_prefetch()
+    assert player.prefetch_timers == {}
+
+
+def test_album_stream_is_the_disc(app_module, disc_player):
+    player, pcm = disc_player
+    response = app_module.app.test_client().get(f'/api/devices/{player.device_id}/album-stream')
+    assert response.headers['X-Track-Offsets'] == '1:0.000,2:1.000,3:2.000,4:3.000'
+    assert response.data[WAV_HEADER_SIZE:] == pcm
+
+
+@pytest.mark.parametrize('start', ['nan', 'inf', '-inf'])
+def test_start_must_be_a_number(app_module, disc_player, start):
+    player, _ = disc_player
+    response = app_module.app.test_client().get(f'/api/devices/{player.device_id}/stream/2?start={start}')
+    assert response.status_code == 400
+    assert response.json == {'success': False, 'error': 'Invalid start position'}
+
+
+def test_start_is_clamped_to_the_track(app_module, disc_player):
+    player, pcm = disc_player
+    client = app_module.app.test_client()
+    track_pcm = pcm[SECTORS * BYTES_PER_SECTOR:2 * SECTORS * BYTES_PER_SECTOR]
+    assert client.get(f'/api/devices/{player.device_id}/stream/2?start=-1').data[WAV_HEADER_SIZE:] == track_pcm
+    # Past the end, and too far to count in sectors: nothing left of the track
+    for start in ['5', '1e308']:
+        response = client.get(f'/api/devices/{player.device_id}/stream/2?start={start}')
+        assert response.status_code == 200 and response.data[WAV_HEADER_SIZE:] == b''
+
+
+def test_album_stream_counts_as_a_stream(app_module, disc_player):
+    player, pcm = disc_player
+    sent_before = metrics.STREAM_BYTES.series.get((player.device_id, 'wav', 'wav'), 0)
+    response = app_module.app.test_client().get(f'/api/devices/{player.device_id}/album-stream?track=2',
+                                                buffered=False)
+    body = iter(response.response)
+    data = next(body)
+    # A listener of the track it starts with while it plays
+    assert player.active_streams == {2: 1}
+    data += b''.join(body)
+    response.close()
+    assert data[WAV_HEADER_SIZE:] == pcm[SECTORS * BYTES_PER_SECTOR:]
+    assert player.active_streams == {}
+    assert metrics.STREAM_BYTES.series[(player.device_id, 'wav', 'wav')] - sent_before == len(data)
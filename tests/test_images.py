@@ -0,0 +1,154 @@
+import pytest
+
+from cdtoc import Toc
+from conftest import FakeCdrom
+from disc_images import CaptureJob, ImageArchive
+from pcm_cache import BYTES_PER_SECTOR
+from sources import DriveSource, ImageSource, SourceError, parse_cue
+
+# A few sectors per read, so reads cross tracks, files and pregaps
+CHUNK = 3 * BYTES_PER_SECTOR
+
+
+def sectors(first, count):
+    """``count`` sectors of PCM, each filled with its own byte from ``first`` on"""
+    return b''.join(bytes([(first + n) % 256]) * BYTES_PER_SECTOR for n in range(count))
+
+
+def write_image(directory, sheet, **files):
+    """A CUE sheet and its files in ``directory``; returns the sheet's path"""
+    for name, data in files.items():
+        (directory / name.replace('_', ' ')).write_bytes(data)
+    path = directory / 'disc.cue'
+    path.write_text(sheet)
+    return str(path)
+
+
+def read(source, *args, **kwargs):
+    return b''.join(source.read(*args, chunk_size=CHUNK, **kwargs))
+
+
+def read_track(source, *args, **kwargs):
+    return b''.join(source.read_track(*args, chunk_size=CHUNK, **kwargs))
+
+
+SINGLE_FILE = '''FILE "disc.bin" BINARY
+  TRACK 01 AUDIO
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    INDEX 00 00:00:10
+    INDEX 01 00:00:12
+  TRACK 03 AUDIO
+    INDEX 01 00:00:20
+'''
+
+
+def test_index_01_is_where_a_track_starts(tmp_path):
+    pcm = sectors(1, 30)
+    source = ImageSource(write_image(tmp_path, SINGLE_FILE, **{'disc.bin': pcm}))
+    assert source.toc.to_dict() == Toc(1, 3, [0, 12, 20], 30).to_dict()
+    # The pregap between INDEX 00 and 01 belongs to the track before
+    assert read_track(source, 1) == pcm[:12 * BYTES_PER_SECTOR]
+    assert read_track(source, 2) == pcm[12 * BYTES_PER_SECTOR:20 * BYTES_PER_SECTOR]
+    assert read_track(source, 3) == pcm[20 * BYTES_PER_SECTOR:]
+    assert read_track(source, 2, start_sector=5) == pcm[17 * BYTES_PER_SECTOR:20 * BYTES_PER_SECTOR]
+    assert read(source, 0, 30) == pcm
+
+
+def test_sectors_before_the_first_index_are_a_pregap(tmp_path):
+    pcm = sectors(1, 30)
+    sheet = 'FILE "disc.bin" BINARY\n  TRACK 01 AUDIO\n    INDEX 01 00:00:05\n'
+    source = ImageSource(write_image(tmp_path, sheet, **{'disc.bin': pcm}))
+    assert source.toc.to_dict() == Toc(1, 1, [5], 30).to_dict()
+    assert read_track(source, 1) == pcm[5 * BYTES_PER_SECTOR:]
+    assert read(source, 0, 5) == pcm[:5 * BYTES_PER_SECTOR]
+
+
+MULTI_FILE = '''REM A comment
+PERFORMER "Artist"
+FILE "side a.bin" BINARY
+  TRACK 01 AUDIO
+    INDEX 01 00:00:00
+FILE "side b.bin" BINARY
+  TRACK 02 AUDIO
+    PREGAP 00:00:03
+    INDEX 00 00:00:00
+    INDEX 01 00:00:02
+'''
+
+
+def test_files_follow_each_other(tmp_path):
+    side_a, side_b = sectors(1, 10), sectors(101, 8)
+    cue = write_image(tmp_path, MULTI_FILE, **{'side_a.bin': side_a, 'side_b.bin': side_b})
+    toc, segments = parse_cue(cue)
+    # Side A, three sectors of silence that are in no file, then side B
+    assert toc.to_dict() == Toc(1, 2, [0, 15], 21).to_dict()
+    assert [segment[:2] for segment in segments] == [(0, 10), (10, 3), (13, 8)]
+    assert segments[1][2] is None
+    source = ImageSource(cue)
+    silence = bytes(3 * BYTES_PER_SECTOR)
+    assert read_track(source, 1) == side_a + silence + side_b[:2 * BYTES_PER_SECTOR]
+    assert read_track(source, 2) == side_b[2 * BYTES_PER_SECTOR:]
+    # Across the end of side A, the pregap and into side B
+    assert read(source, 8, 7) == side_a[8 * BYTES_PER_SECTOR:] + silence + side_b[:2 * BYTES_PER_SECTOR]
+
+
+def test_reads_end_with_the_image(tmp_path):
+    source = ImageSource(write_image(tmp_path, SINGLE_FILE, **{'disc.bin': sectors(1, 30)}))
+    with pytest.raises(SourceError, match='sector 30 is outside the image'):
+        read(source, 25, 10)
+
+
+def test_bare_image_is_one_track(tmp_path):
+    pcm = sectors(1, 7)
+    path = tmp_path / 'disc.bin'
+    path.write_bytes(pcm)
+    source = ImageSource(str(path))
+    assert source.toc.to_dict() == Toc(1, 1, [0], 7).to_dict()
+    assert read_track(source, 1) == pcm
+
+
+@pytest.mark.parametrize('sheet, error', [
+    ('', 'no tracks'),
+    ('FILE "disc.bin" BINARY\n', 'no tracks'),
+    ('TRACK 01 AUDIO\n  INDEX 01 00:00:00\n', 'no tracks'),
+    ('FILE "disc.bin" BINARY\n  TRACK 01 MODE3/2352\n    INDEX 01 00:00:00\n', 'unsupported track mode MODE3/2352'),
+    ('FILE "disc.bin" BINARY\n  TRACK 01 AUDIO\n  TRACK 02 AUDIO\n    INDEX 01 00:00:05\n', 'track 1 has no INDEX'),
+    ('FILE "disc.bin" BINARY\n  TRACK 01 AUDIO\n    INDEX 01 00:01:00\n', 'track 1 lies outside disc.bin'),
+])
+def test_malformed_sheets_are_refused(tmp_path, sheet, error):
+    cue = write_image(tmp_path, sheet, **{'disc.bin': sectors(1, 30)})
+    with pytest.raises(SourceError, match=error):
+        ImageSource(cue)
+
+
+def test_missing_sheet_is_refused(tmp_path):
+    with pytest.raises(SourceError, match='No such file'):
+        parse_cue(str(tmp_path / 'missing.cue'))
+
+
+def test_captured_image_is_the_disc(app_module, drive_player, tmp_path):
+    # Track 1 starts past LBA 0, so the image starts there too
+    toc = Toc(1, 3, [33, 60, 100], 140)
+    pcm = sectors(0, toc.leadout)
+    player = drive_player(toc)
+    player.source = DriveSource(player.cd_device, player.device_id, inprocess=True,
+                                ioctl=FakeCdrom(1, 3, toc.offsets, toc.leadout, pcm=pcm).ioctl)
+    player.toc = player.source.toc = toc
+    player.disc_id = f'capture-{player.device_id}'
+    player.track_info = [{'number': 2, 'title': 'Say "Hello"'}]
+    player.album_info = {'artist': 'Artist', 'album': 'Album'}
+    job = CaptureJob(player, ImageArchive(str(tmp_path / 'images')))
+    job.run()
+    assert job.state == 'done', job.error
+
+    # The sheet on its own: the same tracks, from the image's start
+    sheet_toc, _ = parse_cue(str(tmp_path / 'images' / player.disc_id / 'disc.cue'))
+    assert sheet_toc.to_dict() == Toc(1, 3, [0, 27, 67], 107).to_dict()
+    # With disc.json, at the disc's own LBAs
+    image = ImageSource(job.path)
+    assert image.toc.to_dict() == toc.to_dict()
+    for track in toc.audio_tracks():
+        start, length = toc.track_sectors(track)
+        assert read_track(image, track) == pcm[start * BYTES_PER_SECTOR:(start + length) * BYTES_PER_SECTOR]
+    assert image.metadata() == {'tracks': player.track_info, 'album': player.album_info}
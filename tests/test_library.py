@@ -0,0 +1,149 @@
+import concurrent.futures
+import random
+import time
+import types
+
+import pytest
+
+import library
+from cdtoc import Toc
+from library import ACCURATERIP_SKIP, Library, RipJob, RipManager, accuraterip_checksums
+from pcm_cache import BYTES_PER_SECTOR
+
+
+def reference_checksums(pcm, first_track=False, last_track=False):
+    """AccurateRip v1/v2 one sample at a time, as the AccurateRip description gives them"""
+    count = len(pcm) // 4
+    v1 = v2 = 0
+    for position in range(1, count + 1):
+        if first_track and position < ACCURATERIP_SKIP:
+            continue
+        if last_track and position > count - ACCURATERIP_SKIP:
+            continue
+        product = int.from_bytes(pcm[(position - 1) * 4:position * 4], 'little') * position
+        v1 += product
+        v2 += (product & 0xFFFFFFFF) + (product >> 32)
+    return f'{v1 & 0xFFFFFFFF:08x}', f'{v2 & 0xFFFFFFFF:08x}'
+
+
+def random_pcm(sectors, seed=0):
+    return random.Random(seed).randbytes(sectors * BYTES_PER_SECTOR)
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def checksums(request, monkeypatch):
+    """accuraterip_checksums with numpy, or with the pure Python fallback in small blocks"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(library, 'numpy', None)
+        # Several blocks per track, and a partial last one
+        monkeypatch.setattr(library, 'CHECKSUM_BLOCK', 1000)
+    return accuraterip_checksums
+
+
+@pytest.mark.parametrize('first_track, last_track', [
+    (False, False), (True, False), (False, True), (True, True),
+])
+def test_accuraterip_checksums(checksums, first_track, last_track):
+    pcm = random_pcm(13)
+    assert checksums(pcm, first_track, last_track) == reference_checksums(pcm, first_track, last_track)
+
+
+def test_accuraterip_checksums_of_full_scale_samples(checksums):
+    # Every product overflows 32 bits, so v2 differs from v1
+    pcm = b'\xff' * (12 * BYTES_PER_SECTOR)
+    v1, v2 = checksums(pcm)
+    assert (v1, v2) == reference_checksums(pcm) and v1 != v2
+
+
+def test_accuraterip_checksums_of_a_track_too_short_to_count(checksums):
+    assert checksums(random_pcm(9), first_track=True, last_track=True) == ('00000000', '00000000')
+    assert checksums(b'') == ('00000000', '00000000')
+
+
+class RecordingPool(concurrent.futures.ThreadPoolExecutor):
+    """Runs process_track in threads and keeps each track's work file as it was handed over"""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.handed_over = {}
+
+    def submit(self, fn, pcm_path, *args):
+        with open(pcm_path, 'rb') as f:
+            self.handed_over[pcm_path.rsplit('/', 1)[1]] = f.read()
+        return super().submit(fn, pcm_path, *args)
+
+
+def fake_player(toc, pcm, chunk_sectors, reads=None):
+    """What RipJob uses of a player: its reads come in chunks that straddle track boundaries"""
+    def extract_pcm(track, start_sector=0, last_track=None):
+        start = toc.track_sectors(track)[0] * BYTES_PER_SECTOR
+        end = sum(toc.track_sectors(last_track)) * BYTES_PER_SECTOR
+        if reads is not None:
+            reads.append((track, last_track))
+        size = chunk_sectors * BYTES_PER_SECTOR
+        for offset in range(start, end, size):
+            yield pcm[offset:min(offset + size, end)]
+    return types.SimpleNamespace(cd_device='/dev/sr0', device_id='sr0', disc_id='rip-test', toc=toc,
+                                 extract_pcm=extract_pcm)
+
+
+# Track lengths that are no multiple of the read size
+TOC = Toc(1, 3, [0, 23, 50], 81)
+
+
+def test_rip_job_cuts_one_read_at_track_boundaries(tmp_path):
+    pcm = random_pcm(TOC.leadout)
+    reads = []
+    pool = RecordingPool()
+    job = RipJob(fake_player(TOC, pcm, 10, reads), TOC.audio_tracks(), [], '192k', Library(str(tmp_path)),
+                 pool)
+    job.run()
+    assert job.state == 'done', job.error
+    # One pass over all audio tracks
+    assert reads == [(1, 3)]
+    assert pool.handed_over == {
+        f'{track:02d}.pcm': pcm[start * BYTES_PER_SECTOR:(start + length) * BYTES_PER_SECTOR]
+        for track, (start, length) in ((t, TOC.track_sectors(t)) for t in TOC.audio_tracks())}
+    # The first and last audio tracks of the disc skip AccurateRip's edges
+    for track, first, last in [(1, True, False), (2, False, False), (3, False, True)]:
+        v1, v2 = reference_checksums(pool.handed_over[f'{track:02d}.pcm'], first, last)
+        assert job.checksums[track] == {'accuraterip_v1': v1, 'accuraterip_v2': v2}
+    manifest = Library(str(tmp_path)).manifest('rip-test')
+    assert manifest['tracks']['2']['sectors'] == 27
+    assert not (tmp_path / 'rip-test' / '.rip').exists()
+    pool.shutdown()
+
+
+def test_rip_job_fails_on_a_short_read(tmp_path):
+    pcm = random_pcm(60)
+    job = RipJob(fake_player(TOC, pcm, 7), TOC.audio_tracks(), [], '192k', Library(str(tmp_path)),
+                 RecordingPool())
+    job.run()
+    assert job.state == 'failed'
+    assert job.error == f'Drive returned {10 * BYTES_PER_SECTOR} of {31 * BYTES_PER_SECTOR} bytes of track 3'
+
+
+def test_rip_manager_spawns_its_workers(tmp_path, monkeypatch):
+    contexts = []
+    real_pool = concurrent.futures.ProcessPoolExecutor
+
+    def pool(*args, mp_context=None, **kwargs):
+        contexts.append(mp_context.get_start_method() if mp_context else None)
+        return real_pool(*args, mp_context=mp_context, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', pool)
+    manager = RipManager(Library(str(tmp_path)), workers=1)
+    pcm = random_pcm(TOC.leadout)
+    job = manager.start(fake_player(TOC, pcm, 10), [], '192k')
+    try:
+        deadline = time.monotonic() + 60
+        while job.state not in ('done', 'failed') and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert job.state == 'done', job.error
+        assert contexts == ['spawn']
+        assert job.checksums[2]['accuraterip_v1'] == reference_checksums(pcm[23 * BYTES_PER_SECTOR:
+                                                                             50 * BYTES_PER_SECTOR])[0]
+    finally:
+        manager.pool.shutdown()
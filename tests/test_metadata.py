@@ -0,0 +1,124 @@
+import queue
+import time
+
+import musicbrainzngs
+import pytest
+
+from cddb import CDDBClient
+from cdtoc import Toc
+from musicbrainz import MusicBrainzClient
+from stub_servers import StubCDDBServer, StubMusicBrainzServer
+
+DISC = Toc(1, 3, [0, 15000, 30000], 45000)
+TITLES = ['One', 'Two', 'Three']
+GNUDB_ENTRY = ('GNUDB Artist / GNUDB Album', TITLES)
+MUSICBRAINZ_RELEASE = ('MB Artist', 'MB Album', '2001', TITLES)
+
+
+@pytest.fixture
+def lookup(app_module, drive_player):
+    """Start stub GNUDB and MusicBrainz servers and a player whose lookups go to them"""
+    servers = []
+    players = []
+
+    def start(gnudb=None, gnudb_delay=0.0, musicbrainz=None, musicbrainz_delay=0.0):
+        cddb = StubCDDBServer({DISC.freedb_id(): gnudb} if gnudb else {}, delay=gnudb_delay)
+        mb = StubMusicBrainzServer({DISC.musicbrainz_id(): musicbrainz} if musicbrainz else {},
+                                   delay=musicbrainz_delay)
+        servers.extend([cddb, mb])
+        musicbrainzngs.set_hostname(mb.host)
+        player = drive_player(DISC)
+        player.cddb = CDDBClient('127.0.0.1', cddb.port)
+        player.musicbrainz = MusicBrainzClient(rate=100)
+        players.append(player)
+        return player, cddb, mb
+
+    yield start
+    # Lookups still running would answer the next test, and musicbrainzngs
+    # sends one request at a time, so a slow one would hold up the next test's
+    deadline = time.monotonic() + 5
+    while any(player.resolving or player.musicbrainz.stats()['in_flight'] for player in players) \
+            and time.monotonic() < deadline:
+        time.sleep(0.05)
+    for server in servers:
+        server.wait_idle()
+        server.close()
+
+
+def next_event(events, name, player, timeout=5):
+    """The next ``name`` event about ``player``"""
+    deadline = time.monotonic() + timeout
+    while True:
+        event, data = events.get(timeout=max(deadline - time.monotonic(), 0.01))
+        if event == name and data.get('device_id') == player.device_id:
+            return data
+
+
+@pytest.fixture
+def events(app_module):
+    q = app_module.players.events.subscribe()
+    yield q
+    app_module.players.events.unsubscribe(q)
+
+
+def test_cd_info_answers_from_the_toc_at_once(app_module, lookup, events):
+    player, _, _ = lookup(gnudb=GNUDB_ENTRY, gnudb_delay=1, musicbrainz=MUSICBRAINZ_RELEASE, musicbrainz_delay=1)
+    client = app_module.app.test_client()
+    start = time.monotonic()
+    info = client.get(f'/api/devices/{player.device_id}/cd-info').get_json()
+    assert time.monotonic() - start < 0.5
+    assert info['success'] and info['resolving']
+    assert info['album'] is None
+    assert info['disc_id'] == DISC.freedb_id()
+    assert [track['number'] for track in info['tracks']] == [1, 2, 3]
+    assert info['tracks'][0] == {'number': 1, 'title': 'Track 1', 'duration': '03:20'}
+    # The lookups are still running
+    with pytest.raises(queue.Empty):
+        next_event(events, 'metadata', player, timeout=0.3)
+
+
+@pytest.mark.parametrize('gnudb_delay, musicbrainz_delay, winner', [
+    (0, 1.5, 'GNUDB'),
+    (1.5, 0, 'MusicBrainz'),
+])
+def test_first_answer_wins(lookup, events, gnudb_delay, musicbrainz_delay, winner):
+    player, _, _ = lookup(gnudb=GNUDB_ENTRY, gnudb_delay=gnudb_delay,
+                          musicbrainz=MUSICBRAINZ_RELEASE, musicbrainz_delay=musicbrainz_delay)
+    start = time.monotonic()
+    player.get_cd_info()
+    event = next_event(events, 'metadata', player)
+    # Not held back by the slower server
+    assert time.monotonic() - start < 1.2
+    assert event['device_id'] == player.device_id
+    assert event['disc_id'] == DISC.freedb_id()
+    assert event['album']['source'] == winner
+    assert [track['title'] for track in event['tracks']] == TITLES
+    assert player.album_info['source'] == winner
+
+
+def test_not_found_waits_for_the_other_server(lookup, events):
+    # GNUDB does not know the disc and says so at once; MusicBrainz does
+    player, cddb, _ = lookup(musicbrainz=MUSICBRAINZ_RELEASE, musicbrainz_delay=0.5)
+    player.get_cd_info()
+    event = next_event(events, 'metadata', player)
+    assert event['album'] == {'artist': 'MB Artist', 'album': 'MB Album', 'year': '2001',
+                              'disc_id': DISC.musicbrainz_id(), 'source': 'MusicBrainz'}
+    assert cddb.counts['queries'] == 1
+
+
+def test_resolved_album_is_cached(app_module, lookup, events):
+    player, cddb, mb = lookup(gnudb=GNUDB_ENTRY)
+    player.get_cd_info()
+    next_event(events, 'metadata', player)
+    info = player.get_cd_info()
+    assert info['cached'] and info['album']['album'] == 'GNUDB Album'
+    assert [track['title'] for track in info['tracks']] == TITLES
+
+
+def test_nothing_found(lookup, events):
+    player, cddb, mb = lookup()
+    player.get_cd_info()
+    event = next_event(events, 'metadata', player)
+    assert event['album'] is None
+    assert [track['title'] for track in event['tracks']] == ['Track 1', 'Track 2', 'Track 3']
+    assert len(mb.paths) == 1 and cddb.counts['queries'] == 1
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import musicbrainzngs
+import pytest
+
+import musicbrainz
+from musicbrainz import MusicBrainzClient, Pending, RateLimited
+from stub_servers import StubMusicBrainzServer
+
+DISC_ID = 'MXsnrcgOkbb2H34IbwspNVMJMwA-'
+
+
+@pytest.fixture
+def server():
+    """A mock MusicBrainz answering after ``server.delay`` seconds, which tests may change"""
+    server = StubMusicBrainzServer({DISC_ID: ('Artist', 'Album', '2001', ['One', 'Two'])})
+    musicbrainzngs.set_useragent('WebCD-tests', '1.0')
+    # MusicBrainzClient does the rate limiting, as in app.py
+    musicbrainzngs.set_rate_limit(False)
+    musicbrainzngs.set_hostname(server.host)
+    yield server
+    server.wait_idle()
+    server.close()
+
+
+def titles(result):
+    return [release['title'] for release in result['release-list']]
+
+
+def wait_for(client, timeout=5):
+    """Until ``client`` has nothing in flight"""
+    deadline = time.monotonic() + timeout
+    while client.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_identical_searches_share_one_request(server):
+    server.delay = 0.3
+    client = MusicBrainzClient(rate=100)
+    results = []
+    users = [threading.Thread(target=lambda: results.append(
+        client.search_releases(release='abbey road', wait=None))) for _ in range(5)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    assert [titles(result) for result in results] == [['release:(abbey road)']] * 5
+    assert len(server.paths) == 1
+    # Later searches are answered from the cache
+    assert titles(client.search_releases(release='abbey road')) == ['release:(abbey road)']
+    assert len(server.paths) == 1
+    stats = client.stats()
+    assert (stats['requests'], stats['coalesced'], stats['cache_hits']) == (1, 4, 1)
+
+
+def test_request_threads_do_not_wait(server):
+    server.delay = 0.5
+    client = MusicBrainzClient(rate=100)
+    start = time.monotonic()
+    with pytest.raises(Pending) as pending:
+        client.search_releases(release='kind of blue')
+    # Asked again while the answer is on its way: no second request
+    with pytest.raises(Pending):
+        client.search_releases(release='kind of blue')
+    assert time.monotonic() - start < 0.2
+    assert pending.value.retry_after >= musicbrainz.POLL_INTERVAL
+    wait_for(client)
+    assert titles(client.search_releases(release='kind of blue')) == ['release:(kind of blue)']
+    assert len(server.paths) == 1
+    assert client.stats()['pending'] == 2
+
+
+def test_answers_expire(server, monkeypatch):
+    monkeypatch.setattr(musicbrainz, 'SEARCH_TTL', 0.2)
+    client = MusicBrainzClient(rate=100)
+    client.search_releases(release='rumours', wait=None)
+    client.search_releases(release='rumours', wait=None)
+    assert len(server.paths) == 1
+    time.sleep(0.3)
+    client.search_releases(release='rumours', wait=None)
+    assert len(server.paths) == 2
+
+
+def test_not_found_is_cached(server):
+    client = MusicBrainzClient(rate=100)
+    for _ in range(2):
+        with pytest.raises(musicbrainzngs.ResponseError):
+            client.get_releases_by_discid('unknown-disc-id', wait=None)
+    assert len(server.paths) == 1
+
+
+def test_one_request_per_second(server):
+    client = MusicBrainzClient()
+    for query in ['abbey road', 'kind of blue', 'blue train']:
+        with pytest.raises(Pending):
+            client.search_releases(release=query)
+    wait_for(client)
+    assert len(server.times) == 3
+    gaps = [later - earlier for earlier, later in zip(server.times, server.times[1:])]
+    assert min(gaps) >= 0.95
+    # Cached answers are not held up by the rate limit
+    start = time.monotonic()
+    client.search_releases(release='abbey road')
+    assert time.monotonic() - start < 0.1
+
+
+def test_refused_when_the_turn_is_too_far_away(server):
+    client = MusicBrainzClient(max_queue=0.5)
+    client.search_releases(release='abbey road', wait=None)
+    start = time.monotonic()
+    with pytest.raises(RateLimited) as refused:
+        client.search_releases(release='rumours')
+    assert time.monotonic() - start < 0.1
+    assert 0.5 < refused.value.retry_after <= 1
+    assert len(server.paths) == 1 and client.stats()['rate_limited'] == 1
+
+
+def test_errors_reach_callers_polling_for_them(server):
+    client = MusicBrainzClient(rate=100)
+    server.close()
+    with pytest.raises(Pending):
+        client.search_releases(release='abbey road')
+    wait_for(client)
+    with pytest.raises(musicbrainzngs.NetworkError):
+        client.search_releases(release='abbey road')
+    assert client.stats()['errors'] == 1
+
+
+@pytest.mark.parametrize('retry_after, backoff', [(1, 1), (None, musicbrainz.UNAVAILABLE_BACKOFF)])
+def test_unavailable_holds_off_every_call(server, retry_after, backoff):
+    server.unavailable = 1
+    server.retry_after = retry_after
+    client = MusicBrainzClient(rate=100)
+    start = time.monotonic()
+    # Refused once, without musicbrainzngs trying again by itself
+    with pytest.raises(RateLimited) as refused:
+        client.search_releases(release='abbey road', wait=None)
+    assert time.monotonic() - start < 0.5
+    assert refused.value.retry_after == backoff
+    assert len(server.paths) == 1
+    # Asked again meanwhile, that call and others wait out the break
+    with pytest.raises(RateLimited):
+        client.search_releases(release='abbey road')
+    assert client.stats()['queue_delay'] > backoff - 0.5
+    stats = client.stats()
+    assert (stats['rate_limited'], stats['errors']) == (1, 0)
+    if backoff == 1:
+        assert titles(client.search_releases(release='rumours', wait=None)) == ['release:(rumours)']
+        assert server.times[1] - server.times[0] >= 0.95
+
+
+def test_search_album_answers_202_until_the_answer_is_in(app_module, server, monkeypatch):
+    server.delay = 0.3
+    client = MusicBrainzClient(rate=100)
+    monkeypatch.setattr(app_module.players, 'musicbrainz', client)
+    http = app_module.app.test_client()
+    response = http.post('/api/search-album', json={'query': 'blue train'})
+    assert response.status_code == 202
+    assert response.get_json()['pending'] and int(response.headers['Retry-After']) >= 1
+    wait_for(client)
+    response = http.post('/api/search-album', json={'query': 'blue train'})
+    assert response.status_code == 200
+    assert [album['album'] for album in response.get_json()['albums']] == ['release:(blue train)']
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import output
+from cdtoc import Toc
+from conftest import FakeCdrom
+from pcm_cache import BYTES_PER_SECTOR
+from sources import DriveSource
+
+SECTORS = 200
+# Far less than one track, so the sinks fall behind the reads
+RING_BYTES = 10000
+
+
+@pytest.fixture
+def playing(app_module, drive_player, tmp_path, monkeypatch):
+    """Plays a two track disc to a null sink and a file; returns the player, the disc PCM and the file"""
+    toc = Toc(1, 2, [0, SECTORS], 2 * SECTORS)
+    pcm = bytes(range(256)) * (2 * SECTORS * BYTES_PER_SECTOR // 256)
+    player = drive_player(toc)
+    # Read with CDROMREADAUDIO, faster than the sinks play
+    player.source = DriveSource(player.cd_device, player.device_id, inprocess=True,
+                                ioctl=FakeCdrom(1, 2, toc.offsets, toc.leadout, pcm=pcm).ioctl)
+    player.toc = player.source.toc = toc
+    player.disc_id = f'output-{player.device_id}'
+    # Several reads per track
+    player.stream_settings['buffer_size'] = '64k'
+    path = tmp_path / 'played.pcm'
+    monkeypatch.setattr(app_module, 'LOCAL_OUTPUTS', ['null', f'file:{path}'])
+    # A sound card playing 1 MB/s with little buffer, and a broadcast that used to give up on it quickly
+    monkeypatch.setattr(output, 'BYTES_PER_SECOND', 1000000)
+    monkeypatch.setattr(output, 'SINK_BUFFER_SECONDS', 0.02)
+    get = player.broadcasts.get
+    monkeypatch.setattr(player.broadcasts, 'get', lambda key, factory, **kwargs: get(
+        key, factory, **dict(kwargs, ring_bytes=RING_BYTES, stall_timeout=0.05)))
+    return player, pcm, path
+
+
+def test_local_playback_plays_every_byte(playing):
+    player, pcm, path = playing
+    assert len(pcm) // 2 > RING_BYTES
+    assert player.play_track(1)['success']
+    playback = player.output
+    null_sink = playback.sinks[0]
+    deadline = time.monotonic() + 10
+    while player.is_playing and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not player.is_playing and playback.error is None
+    assert null_sink.written == len(pcm)
+    assert path.read_bytes() == pcm
+    assert all(b['bytes_skipped'] == 0 for b in player.broadcasts.stats())
+
+
+def test_null_sink_plays_in_real_time(monkeypatch):
+    monkeypatch.setattr(output, 'BYTES_PER_SECOND', 100000)
+    sink = output.NullSink()
+    start = time.monotonic()
+    for _ in range(10):
+        sink.write(bytes(10000))
+    # One second of audio, of which SINK_BUFFER_SECONDS is accepted ahead
+    assert time.monotonic() - start == pytest.approx(1 - output.SINK_BUFFER_SECONDS, abs=0.1)
+    assert sink.written == 100000